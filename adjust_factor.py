@@ -0,0 +1,220 @@
+"""不复权行情 + 复权因子：入库存原始价格，读取时按因子现算前/后复权。
+
+前复权价格会在每次除权除息后整体改写历史，增量同步无法察觉。改为：
+
+* stock_daily_raw / stock_weekly_raw 保存 adjustflag="3" 的不复权 K 线，历史永不改写；
+* stock_adjust_factor 保存 bs.query_adjust_factor 返回的除权除息事件因子；
+* apply_adjustment 在读取时向量化计算：
+  后复权价 = 原始价 × 当时生效的 backAdjustFactor；
+  前复权价 = 后复权价 / 最新一次事件的 backAdjustFactor（最新价格与不复权一致）。
+
+这样一次除权事件只需要重新拉一次该股票的因子（几十行），而不是重刷整段历史。
+周线按周末日期取因子，周内发生除权时周开盘价有近似误差。
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Any, Sequence
+
+from baostock_deadline import baostock_deadline
+from common import lazy_import
+
+bs = lazy_import("baostock")
+pd = lazy_import("pandas")
+logger = logging.getLogger(__name__)
+
+RAW_TABLES = {"daily": "stock_daily_raw", "weekly": "stock_weekly_raw"}
+ADJUSTED_TABLES = {"daily": "stock_daily", "weekly": "stock_weekly"}
+FACTOR_TABLE = "stock_adjust_factor"
+PRICE_COLUMNS = ("open", "high", "low", "close", "preclose")
+# 判断除权的相对容差：不复权数据里 preclose 与上一日 close 只有在除权除息日才会不同
+EX_RIGHTS_TOLERANCE = 1e-4
+
+CREATE_FACTOR_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{FACTOR_TABLE}` (
+  `code` VARCHAR(20) NOT NULL COMMENT '6位股票代码',
+  `divid_operate_date` DATE NOT NULL COMMENT '除权除息日期',
+  `fore_adjust_factor` DECIMAL(20,10) DEFAULT NULL COMMENT '向前复权因子（查询时刻口径）',
+  `back_adjust_factor` DECIMAL(20,10) DEFAULT NULL COMMENT '向后复权因子',
+  `adjust_factor` DECIMAL(20,10) DEFAULT NULL COMMENT '本次复权因子',
+  `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`code`, `divid_operate_date`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+
+def to_baostock_code(code: str) -> str:
+    return f"sh.{code}" if code.startswith(('6', '9')) else f"sz.{code}"
+
+
+def ensure_raw_tables(engine: Any) -> None:
+    """不复权表与复权后的表结构完全相同，直接 LIKE 复制。"""
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        for freq, table in RAW_TABLES.items():
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS `{table}` LIKE `{ADJUSTED_TABLES[freq]}`"))
+        conn.execute(text(CREATE_FACTOR_TABLE_SQL))
+
+
+def fetch_adjust_factors(code: str, start: str = "1990-01-01", end: str | None = None) -> pd.DataFrame:
+    """拉取单只股票的全部除权除息因子，一般只有几十行。"""
+    rows = []
+    with baostock_deadline(f"{code} adjust_factor"):
+        rs = bs.query_adjust_factor(code=to_baostock_code(code), start_date=start, end_date=end or "")
+        if rs.error_code != '0':
+            logger.warning(f"Baostock 复权因子查询失败 {code}: {rs.error_msg}")
+            return pd.DataFrame()
+        while (rs.error_code == '0') & rs.next():
+            rows.append(rs.get_row_data())
+    if not rows:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(rows, columns=rs.fields).rename(
+        columns={
+            "dividOperateDate": "divid_operate_date",
+            "foreAdjustFactor": "fore_adjust_factor",
+            "backAdjustFactor": "back_adjust_factor",
+            "adjustFactor": "adjust_factor",
+        }
+    )
+    df['code'] = code
+    for col in ("fore_adjust_factor", "back_adjust_factor", "adjust_factor"):
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df['divid_operate_date'] = pd.to_datetime(df['divid_operate_date'])
+    return df[["code", "divid_operate_date", "fore_adjust_factor", "back_adjust_factor", "adjust_factor"]]
+
+
+def upsert_adjust_factors(engine: Any, df: pd.DataFrame) -> None:
+    from sqlalchemy import text
+
+    if df.empty:
+        return
+    rows = df.astype(object).where(pd.notnull(df), None).to_dict("records")
+    for row in rows:
+        row["divid_operate_date"] = row["divid_operate_date"].strftime("%Y-%m-%d")
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                f"""
+                INSERT INTO `{FACTOR_TABLE}`
+                    (`code`, `divid_operate_date`, `fore_adjust_factor`, `back_adjust_factor`, `adjust_factor`)
+                VALUES (:code, :divid_operate_date, :fore_adjust_factor, :back_adjust_factor, :adjust_factor)
+                ON DUPLICATE KEY UPDATE
+                    `fore_adjust_factor` = VALUES(`fore_adjust_factor`),
+                    `back_adjust_factor` = VALUES(`back_adjust_factor`),
+                    `adjust_factor` = VALUES(`adjust_factor`)
+                """
+            ),
+            rows,
+        )
+
+
+def sync_adjust_factors(engine: Any, code: str) -> int:
+    df = fetch_adjust_factors(code)
+    upsert_adjust_factors(engine, df)
+    return len(df)
+
+
+def get_prev_close(engine: Any, table: str, code: str, before_date: str) -> float | None:
+    """取某日之前最近一根 K 线的收盘价。"""
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        value = conn.execute(
+            text(
+                f"SELECT `close` FROM `{table}` WHERE `code` = :c AND `date` < :d "
+                "ORDER BY `date` DESC LIMIT 1"
+            ),
+            {"c": code, "d": before_date},
+        ).scalar()
+    return float(value) if value is not None else None
+
+
+def has_ex_rights_rows(columns: Sequence[str], rows: Sequence[tuple], prev_close: float | None) -> bool:
+    """新 K 线中只要有一根的 preclose 与前一根 close 对不上，就说明期间发生了除权除息（或价格口径变化）；rows 需按日期升序。"""
+    if not rows or 'preclose' not in columns:
+        return False
+    close_idx, preclose_idx = columns.index('close'), columns.index('preclose')
+    previous = prev_close
+    for row in rows:
+        preclose = row[preclose_idx]
+        if previous is not None and preclose is not None:
+            if abs(preclose - previous) > abs(previous) * EX_RIGHTS_TOLERANCE:
+                return True
+        previous = row[close_idx]
+    return False
+
+
+def load_factors(engine: Any, codes: Sequence[str]) -> pd.DataFrame:
+    from sqlalchemy import bindparam, text
+
+    query = text(
+        f"SELECT `code`, `divid_operate_date`, `back_adjust_factor` FROM `{FACTOR_TABLE}` "
+        "WHERE `code` IN :codes ORDER BY `divid_operate_date`"
+    ).bindparams(bindparam("codes", expanding=True))
+    with engine.connect() as conn:
+        df = pd.read_sql(query, conn, params={"codes": list(codes)})
+    df['divid_operate_date'] = pd.to_datetime(df['divid_operate_date'])
+    df['back_adjust_factor'] = pd.to_numeric(df['back_adjust_factor'], errors='coerce')
+    return df
+
+
+def apply_adjustment(bars: pd.DataFrame, factors: pd.DataFrame, mode: str = "forward") -> pd.DataFrame:
+    """对不复权 K 线做前复权（forward）或后复权（backward），返回新 DataFrame。
+
+    bars 需含 code、date 与价格列；factors 需含 code、divid_operate_date、back_adjust_factor。
+    没有任何除权事件的股票因子恒为 1。
+    """
+    if mode not in ("forward", "backward"):
+        raise ValueError(f"不支持的复权方式: {mode}")
+    if bars.empty:
+        return bars.copy()
+
+    out = bars.copy()
+    out['date'] = pd.to_datetime(out['date'])
+    out = out.sort_values('date', kind='stable')
+    if factors.empty:
+        out['_factor'] = 1.0
+    else:
+        events = factors[['code', 'divid_operate_date', 'back_adjust_factor']].sort_values('divid_operate_date')
+        out = pd.merge_asof(
+            out,
+            events.rename(columns={'divid_operate_date': 'date', 'back_adjust_factor': '_factor'}),
+            on='date',
+            by='code',
+            direction='backward',
+        )
+        # 首次除权之前的 K 线，后复权因子为 1
+        out['_factor'] = out['_factor'].fillna(1.0)
+        if mode == "forward":
+            latest = events.groupby('code')['back_adjust_factor'].last()
+            out['_factor'] = out['_factor'] / out['code'].map(latest).fillna(1.0)
+
+    for col in PRICE_COLUMNS:
+        if col in out.columns:
+            out[col] = pd.to_numeric(out[col], errors='coerce') * out['_factor']
+    if 'adjustflag' in out.columns:
+        out['adjustflag'] = 2 if mode == "forward" else 1
+    return out.drop(columns=['_factor']).sort_values(['code', 'date']).reset_index(drop=True)
+
+
+def load_adjusted(
+    engine: Any,
+    codes: Sequence[str],
+    start: str,
+    end: str,
+    freq: str = "daily",
+    mode: str = "forward",
+) -> pd.DataFrame:
+    """从不复权表读取区间行情并即时复权。"""
+    from sqlalchemy import bindparam, text
+
+    table = RAW_TABLES[freq]
+    query = text(
+        f"SELECT * FROM `{table}` WHERE `code` IN :codes AND `date` BETWEEN :s AND :e ORDER BY `code`, `date`"
+    ).bindparams(bindparam("codes", expanding=True))
+    with engine.connect() as conn:
+        bars = pd.read_sql(query, conn, params={"codes": list(codes), "s": start, "e": end})
+    return apply_adjustment(bars, load_factors(engine, codes), mode)
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""stock_daily 缺口检测与最小补数计划。
+
+一条 SQL 把 股票上市区间 × 交易日历 与 stock_daily 做反连接，找出所有缺失的 (code, date)；
+再把同一股票相邻的缺失交易日合并成区间（间隔不超过 --merge-gap 个已有交易日的也合并，
+多拉几行比多发一次请求便宜），得到最少的 (code, start, end) 请求，按当前请求速率估算耗时，
+--execute 时走正常的 fetch_with_relogin + upsert 路径补齐。
+
+    python backfill_planner.py --start 2024-01-01                 # 只打印计划
+    python backfill_planner.py --start 2024-01-01 --execute       # 执行补数
+    python backfill_planner.py --refresh-reference --start 2019-07-22
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from baostock_deadline import baostock_deadline, log_stats
+from common import build_engine, lazy_import, setup_logging
+from profiling import add_profile_arguments, limit_codes, profile_run
+from sync_daily import CODE_CSV_PATH, fetch_with_relogin, validate_date
+from sync_to_mysql import upsert
+
+bs = lazy_import("baostock")
+pd = lazy_import("pandas")
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_TABLE = "trade_calendar"
+LISTING_TABLE = "stock_listing"
+
+CREATE_CALENDAR_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{CALENDAR_TABLE}` (
+  `calendar_date` DATE NOT NULL PRIMARY KEY,
+  `is_trading_day` TINYINT NOT NULL,
+  KEY `idx_trading_day` (`is_trading_day`, `calendar_date`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+CREATE_LISTING_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{LISTING_TABLE}` (
+  `code` VARCHAR(20) NOT NULL PRIMARY KEY COMMENT '6位股票代码',
+  `name` VARCHAR(64) DEFAULT NULL,
+  `ipo_date` DATE DEFAULT NULL COMMENT '上市日期',
+  `out_date` DATE DEFAULT NULL COMMENT '退市日期',
+  `type` TINYINT DEFAULT NULL COMMENT '1=股票 2=指数 3=其它',
+  `status` TINYINT DEFAULT NULL COMMENT '1=上市 0=退市',
+  `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+GAP_SQL = f"""
+SELECT l.`code`, c.`calendar_date`
+FROM `{LISTING_TABLE}` l
+JOIN `{CALENDAR_TABLE}` c
+  ON c.`is_trading_day` = 1
+ AND c.`calendar_date` BETWEEN GREATEST(COALESCE(l.`ipo_date`, :start), :start)
+                           AND LEAST(COALESCE(l.`out_date`, :end), :end)
+LEFT JOIN `stock_daily` d
+  ON d.`code` = l.`code` AND d.`date` = c.`calendar_date`
+WHERE l.`code` IN :codes
+  AND d.`code` IS NULL
+ORDER BY l.`code`, c.`calendar_date`
+"""
+
+
+@dataclass
+class BackfillRequest:
+    code: str
+    start: str
+    end: str
+    missing_days: int
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="检测 stock_daily 缺口并生成最小补数计划")
+    parser.add_argument("--code-csv", default=CODE_CSV_PATH, help="股票代码 CSV 路径")
+    parser.add_argument("--start", required=True, help="检查起始日期 YYYY-MM-DD")
+    parser.add_argument("--end", default=None, help="检查截止日期 YYYY-MM-DD，默认今天")
+    parser.add_argument("--merge-gap", type=int, default=5, help="两段缺口间隔不超过 N 个交易日时合并为一个请求")
+    parser.add_argument("--seconds-per-request", type=float, default=0.5, help="估算耗时用的单次请求秒数（含限流等待）")
+    parser.add_argument("--refresh-reference", action="store_true", help="先从 Baostock 刷新交易日历和上市信息")
+    parser.add_argument("--execute", action="store_true", help="按计划补数；不加只打印计划")
+    parser.add_argument("--sleep", type=float, default=0.2, help="执行时每个请求后的等待秒数")
+    add_profile_arguments(parser)
+    return parser.parse_args()
+
+
+def load_codes(csv_path: str) -> list[str]:
+    codes: list[str] = []
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as handle:
+        for row in csv.reader(handle):
+            if not row:
+                continue
+            code = row[0].strip()
+            if code and not code.startswith("#") and code.lower() != "code":
+                codes.append(code.zfill(6))
+    return list(dict.fromkeys(codes))
+
+
+def ensure_reference_tables(engine: Any) -> None:
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_CALENDAR_SQL))
+        conn.execute(text(CREATE_LISTING_SQL))
+
+
+def refresh_trade_calendar(engine: Any, start: str, end: str) -> int:
+    from sqlalchemy import text
+
+    rows = []
+    with baostock_deadline("trade_dates"):
+        rs = bs.query_trade_dates(start_date=start, end_date=end)
+        if rs.error_code != '0':
+            raise RuntimeError(f"交易日历查询失败: {rs.error_msg}")
+        while (rs.error_code == '0') & rs.next():
+            calendar_date, is_trading_day = rs.get_row_data()
+            rows.append({"d": calendar_date, "t": int(is_trading_day)})
+    if rows:
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    f"INSERT INTO `{CALENDAR_TABLE}` (`calendar_date`, `is_trading_day`) VALUES (:d, :t) "
+                    "ON DUPLICATE KEY UPDATE `is_trading_day` = VALUES(`is_trading_day`)"
+                ),
+                rows,
+            )
+    return len(rows)
+
+
+def refresh_listing(engine: Any) -> int:
+    from sqlalchemy import text
+
+    rows = []
+    with baostock_deadline("stock_basic"):
+        rs = bs.query_stock_basic()
+        if rs.error_code != '0':
+            raise RuntimeError(f"证券基本资料查询失败: {rs.error_msg}")
+        while (rs.error_code == '0') & rs.next():
+            row = dict(zip(rs.fields, rs.get_row_data()))
+            rows.append(
+                {
+                    "code": row["code"].split(".", 1)[-1],
+                    "name": row.get("code_name") or None,
+                    "ipo": row.get("ipoDate") or None,
+                    "out": row.get("outDate") or None,
+                    "type": int(row["type"]) if row.get("type") else None,
+                    "status": int(row["status"]) if row.get("status") else None,
+                }
+            )
+    if rows:
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    f"""
+                    INSERT INTO `{LISTING_TABLE}` (`code`, `name`, `ipo_date`, `out_date`, `type`, `status`)
+                    VALUES (:code, :name, :ipo, :out, :type, :status)
+                    ON DUPLICATE KEY UPDATE
+                        `name` = VALUES(`name`), `ipo_date` = VALUES(`ipo_date`), `out_date` = VALUES(`out_date`),
+                        `type` = VALUES(`type`), `status` = VALUES(`status`)
+                    """
+                ),
+                rows,
+            )
+    return len(rows)
+
+
+def trading_days(engine: Any, start: str, end: str) -> list[str]:
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                f"SELECT `calendar_date` FROM `{CALENDAR_TABLE}` "
+                "WHERE `is_trading_day` = 1 AND `calendar_date` BETWEEN :s AND :e ORDER BY `calendar_date`"
+            ),
+            {"s": start, "e": end},
+        ).fetchall()
+    return [row[0].strftime("%Y-%m-%d") for row in rows]
+
+
+def find_gaps(engine: Any, codes: list[str], start: str, end: str) -> pd.DataFrame:
+    """一次反连接查询返回所有缺失的 (code, date)。"""
+    from sqlalchemy import bindparam, text
+
+    query = text(GAP_SQL).bindparams(bindparam("codes", expanding=True))
+    with engine.connect() as conn:
+        df = pd.read_sql(query, conn, params={"codes": codes, "start": start, "end": end})
+    df["calendar_date"] = pd.to_datetime(df["calendar_date"]).dt.strftime("%Y-%m-%d")
+    return df
+
+
+def coalesce_gaps(gaps: pd.DataFrame, calendar: list[str], merge_gap: int) -> list[BackfillRequest]:
+    """按交易日序号把缺口合并成区间；两段之间已有的交易日不超过 merge_gap 时并为一段。"""
+    ordinal = {day: index for index, day in enumerate(calendar)}
+    requests: list[BackfillRequest] = []
+    for code, group in gaps.groupby("code", sort=True):
+        days = [day for day in group["calendar_date"] if day in ordinal]
+        if not days:
+            continue
+        run_start = run_end = days[0]
+        missing = 1
+        for day in days[1:]:
+            if ordinal[day] - ordinal[run_end] - 1 <= merge_gap:
+                run_end = day
+                missing += 1
+                continue
+            requests.append(BackfillRequest(code, run_start, run_end, missing))
+            run_start = run_end = day
+            missing = 1
+        requests.append(BackfillRequest(code, run_start, run_end, missing))
+    return requests
+
+
+def print_plan(requests: list[BackfillRequest], seconds_per_request: float) -> None:
+    missing = sum(req.missing_days for req in requests)
+    codes = len({req.code for req in requests})
+    estimate = len(requests) * seconds_per_request
+    logger.info(
+        "缺失 %s 个 (code, date)，涉及 %s 只股票，合并为 %s 个请求，按 %.2fs/请求 预计耗时 %.0f 分钟",
+        missing,
+        codes,
+        len(requests),
+        seconds_per_request,
+        estimate / 60,
+    )
+    for req in requests[:50]:
+        logger.info("  %s %s ~ %s 缺 %s 天", req.code, req.start, req.end, req.missing_days)
+    if len(requests) > 50:
+        logger.info("  ... 其余 %s 个请求省略", len(requests) - 50)
+
+
+def execute_plan(engine: Any, requests: list[BackfillRequest], sleep_seconds: float) -> None:
+    started = time.monotonic()
+    filled = empty = 0
+    for index, req in enumerate(requests, start=1):
+        df = fetch_with_relogin(req.code, req.start, req.end, "daily")
+        if df.empty:
+            empty += 1
+            logger.info("%s/%s %s %s~%s 上游无数据（可能停牌）", index, len(requests), req.code, req.start, req.end)
+        else:
+            upsert(df, "stock_daily", engine, "date")
+            filled += len(df)
+        time.sleep(sleep_seconds)
+        if index % 20 == 0 or index == len(requests):
+            rate = (time.monotonic() - started) / index
+            logger.info(
+                "补数进度 %s/%s，实测 %.2fs/请求，预计剩余 %.0fs",
+                index,
+                len(requests),
+                rate,
+                rate * (len(requests) - index),
+            )
+    logger.info("补数完成：写入 %s 行，%s 个请求上游无数据", filled, empty)
+
+
+def run(args: argparse.Namespace) -> None:
+    end = args.end or datetime.now().strftime("%Y-%m-%d")
+    if not validate_date(args.start) or not validate_date(end):
+        raise SystemExit("日期格式错误，请使用 YYYY-MM-DD")
+    codes = limit_codes(load_codes(args.code_csv), args)
+    if not codes:
+        logger.warning("未加载到任何股票代码，请检查 %s", args.code_csv)
+        return
+
+    engine = build_engine()
+    ensure_reference_tables(engine)
+    need_login = args.refresh_reference or args.execute
+    if need_login:
+        lg = bs.login()
+        if lg.error_code != '0':
+            raise SystemExit(f"Baostock login failed: {lg.error_msg}")
+    try:
+        if args.refresh_reference:
+            logger.info("交易日历 %s 天，上市信息 %s 条", refresh_trade_calendar(engine, args.start, end), refresh_listing(engine))
+
+        calendar = trading_days(engine, args.start, end)
+        if not calendar:
+            raise SystemExit("交易日历为空，请先加 --refresh-reference")
+        requests = coalesce_gaps(find_gaps(engine, codes, args.start, end), calendar, args.merge_gap)
+        print_plan(requests, args.seconds_per_request)
+        if args.execute and requests:
+            execute_plan(engine, requests, args.sleep)
+    finally:
+        if need_login:
+            bs.logout()
+
+
+def main() -> None:
+    args = parse_arguments()
+    setup_logging("backfill_planner.log")
+    try:
+        with profile_run("backfill_planner", args):
+            run(args)
+    finally:
+        log_stats()
+
+
+if __name__ == "__main__":
+    main()
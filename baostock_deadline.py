@@ -0,0 +1,243 @@
+"""Baostock 调用的时限与看门狗。
+
+Baostock 客户端只有一个全局 socket（baostock.common.context.default_socket），默认没有超时：
+服务端不回包时 query_history_k_data_plus 或 rs.next() 的翻页会永远阻塞，一只股票卡住整晚的任务。
+更糟的是对端关闭连接后 send_msg 的 recv 循环会不停拿到 b""，变成空转。
+
+install() 给 baostock.util.socketutil.send_msg 套一层（所有查询、翻页、登录都经过它）：
+
+* 每条消息都在时限内完成：socket 换成 _DeadlineSocket，每次 send/recv 前按剩余时间重设超时，
+  累计超过时限或对端关闭时直接抛错，而不是依赖单次 recv 超时；
+* baostock_deadline(label, seconds) 给一次完整调用（含 rs.next() 翻页）设置总时限，
+  翻页中途到期同样生效；
+* 到期后关闭这条已经错位的连接并重新登录，向调用方抛出 BaostockTimeout，
+  调用方按原有的失败/重试逻辑处理，不会把截断的结果当成完整数据写库；
+* 调用次数、超时次数、最慢调用记在 STATS 中，任务结束时 log_stats() 输出。
+
+同一个 socket 同一时刻只能有一个请求在途：baostock_deadline 在整个调用期间持有 SESSION_LOCK，
+login() / logout() 也先取这把锁。多数据源对冲时落后的 Baostock 请求可能还在后台线程里翻页，
+主线程的重新登录、登出会等它结束，而不是关掉它正在用的连接或读走它的响应。
+
+    install()
+    with baostock_deadline(f"{code} daily"):
+        rs = bs.query_history_k_data_plus(...)
+        while (rs.error_code == '0') & rs.next():
+            ...
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_TIMEOUT = float(os.getenv("BAOSTOCK_MESSAGE_TIMEOUT", "20"))  # 单条消息（一页）的时限
+CALL_TIMEOUT = float(os.getenv("BAOSTOCK_CALL_TIMEOUT", "60"))  # 一次完整调用（含翻页）的时限
+CONNECT_TIMEOUT = float(os.getenv("BAOSTOCK_CONNECT_TIMEOUT", "10"))
+
+
+class BaostockTimeout(RuntimeError):
+    """Baostock 调用超过时限，连接已回收。"""
+
+
+@dataclass
+class CallStats:
+    messages: int = 0
+    calls: int = 0
+    timeouts: int = 0
+    recycles: int = 0
+    slowest: float = 0.0
+    slowest_label: str = ""
+    timeout_labels: list = field(default_factory=list)
+
+    def reset(self) -> None:
+        """调度进程里每个任务开始前清零。"""
+        self.__init__()
+
+    def summary(self) -> str:
+        text = (
+            f"Baostock 调用 {self.calls} 次 / 消息 {self.messages} 条，超时 {self.timeouts} 次，"
+            f"重建会话 {self.recycles} 次，最慢 {self.slowest:.1f}s（{self.slowest_label or '-'}）"
+        )
+        if self.timeout_labels:
+            text += f"，超时调用: {', '.join(self.timeout_labels[:20])}"
+        return text
+
+
+STATS = CallStats()
+
+_state = threading.local()
+SESSION_LOCK = threading.RLock()  # 可重入：超时回收会话时在持锁的调用内重新登录
+_installed = False
+_install_lock = threading.Lock()
+
+
+class _DeadlineSocket:
+    """代理 Baostock 的 socket：每次 send/recv 前按截止时间重设超时。"""
+
+    def __init__(self, sock: socket.socket) -> None:
+        self._sock = sock
+        self.deadline: Optional[float] = None
+        self.expired = False
+
+    def _arm(self) -> None:
+        remaining = self.deadline - time.monotonic() if self.deadline is not None else MESSAGE_TIMEOUT
+        if remaining <= 0:
+            self.expired = True
+            raise socket.timeout("Baostock 调用超过时限")
+        self._sock.settimeout(min(MESSAGE_TIMEOUT, remaining))
+
+    def send(self, data: bytes) -> int:
+        self._arm()
+        try:
+            return self._sock.send(data)
+        except socket.timeout:
+            self.expired = True
+            raise
+
+    def recv(self, size: int) -> bytes:
+        self._arm()
+        try:
+            data = self._sock.recv(size)
+        except socket.timeout:
+            self.expired = True
+            raise
+        if not data:
+            self.expired = True  # 对端已关闭，原实现会在这里空转
+            raise ConnectionError("Baostock 服务器关闭了连接")
+        return data
+
+    def close(self) -> None:
+        self._sock.close()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._sock, name)
+
+
+def _current_socket() -> Optional[_DeadlineSocket]:
+    import baostock.common.context as context
+
+    sock = getattr(context, "default_socket", None)
+    if sock is None:
+        return None
+    if not isinstance(sock, _DeadlineSocket):
+        sock = _DeadlineSocket(sock)
+        context.default_socket = sock
+    return sock
+
+
+def _recycle(sock: _DeadlineSocket, label: str) -> None:
+    """关闭已经错位的连接（迟到的响应会污染下一次请求），重新登录。"""
+    import baostock as bs
+    import baostock.common.context as context
+
+    STATS.recycles += 1
+    try:
+        sock.close()
+    except OSError:
+        pass
+    context.default_socket = None
+    _state.recycling = True
+    try:
+        lg = bs.login()
+        if lg.error_code != '0':
+            logger.warning("Baostock 超时后重新登录失败（%s）: %s", label, lg.error_msg)
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("Baostock 超时后重新登录异常（%s）: %s", label, exc)
+    finally:
+        _state.recycling = False
+
+
+def install() -> None:
+    """给 Baostock 的 send_msg / connect 加时限，重复调用无副作用。"""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        import baostock.util.socketutil as socketutil
+
+        original_send = socketutil.send_msg
+        original_connect = socketutil.SocketUtil.connect
+
+        def send_msg(msg: str) -> Any:
+            sock = _current_socket()
+            if sock is None:
+                return original_send(msg)
+            call_deadline = getattr(_state, "deadline", None)
+            message_deadline = time.monotonic() + MESSAGE_TIMEOUT
+            sock.deadline = min(call_deadline, message_deadline) if call_deadline else message_deadline
+            sock.expired = False
+            STATS.messages += 1
+            try:
+                result = original_send(msg)
+            finally:
+                sock.deadline = None
+            if sock.expired:
+                label = getattr(_state, "label", None) or "baostock"
+                STATS.timeouts += 1
+                STATS.timeout_labels.append(label)
+                logger.warning("⏱️ Baostock 调用超时，回收会话: %s", label)
+                if not getattr(_state, "recycling", False):
+                    _recycle(sock, label)
+                raise BaostockTimeout(f"Baostock 调用超时: {label}")
+            return result
+
+        def connect(self: Any, api_key: str) -> None:
+            previous = socket.getdefaulttimeout()
+            socket.setdefaulttimeout(CONNECT_TIMEOUT)
+            try:
+                original_connect(self, api_key)
+            finally:
+                socket.setdefaulttimeout(previous)
+
+        socketutil.send_msg = send_msg
+        socketutil.SocketUtil.connect = connect
+        _installed = True
+
+
+@contextmanager
+def baostock_deadline(label: str, seconds: float = CALL_TIMEOUT) -> Iterator[None]:
+    """为一次完整的 Baostock 调用（查询 + 翻页）设置总时限并独占会话；可嵌套，取更早的截止时间。"""
+    install()
+    with SESSION_LOCK:  # 时限从拿到会话开始算，等锁的时间不计入
+        previous = (getattr(_state, "deadline", None), getattr(_state, "label", None))
+        deadline = time.monotonic() + seconds
+        if previous[0] is not None:
+            deadline = min(deadline, previous[0])
+        _state.deadline, _state.label = deadline, label
+        started = time.monotonic()
+        STATS.calls += 1
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            if elapsed > STATS.slowest:
+                STATS.slowest, STATS.slowest_label = elapsed, label
+            _state.deadline, _state.label = previous
+
+
+def login() -> Any:
+    """持有 SESSION_LOCK 登录，等后台线程里未完成的 Baostock 请求结束后再替换连接。"""
+    import baostock as bs
+
+    with SESSION_LOCK:
+        return bs.login()
+
+
+def logout() -> Any:
+    import baostock as bs
+
+    with SESSION_LOCK:
+        return bs.logout()
+
+
+def log_stats() -> None:
+    if STATS.calls or STATS.messages:
+        logger.info(STATS.summary())
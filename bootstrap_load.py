@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""新库初始化：TSV 落盘 + LOAD DATA LOCAL INFILE 批量导入日线/周线历史。
+
+sync_to_mysql 逐只股票 to_sql 多行 INSERT，初始化数百万行时瓶颈在 MySQL。这里：
+
+1. 按股票拉取 Baostock 行（fetch_baostock_rows），直接写成 TSV 追加到 ./data/bootstrap/<表>.<序号>.tsv；
+2. 每满 --spool-mb 就切换文件，由后台线程 LOAD DATA LOCAL INFILE 导入 <表>__staging，
+   与下一批的网络拉取并行；staging 表去掉二级索引，导入会话关闭 unique_checks；
+3. 全部完成后：目标表为空则补建 (date, code) 索引后 RENAME 原子替换；
+   否则按股票分批 INSERT ... SELECT ... ON DUPLICATE KEY UPDATE 合并，再删除 staging；
+4. 为导入的 (代码, 年份) 登记写入版本，读端缓存随之失效。
+
+需要服务端 local_infile=1（mysqld --local-infile=1），客户端已在连接参数中开启。
+
+    python bootstrap_load.py
+    python bootstrap_load.py --raw --spool-mb 256
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, time as dtime, timedelta
+from pathlib import Path
+from typing import Any
+
+from adjust_factor import ensure_raw_tables, sync_adjust_factors
+from baostock_deadline import log_stats
+from common import LOG_DIR, build_engine, lazy_import, setup_logging
+from db_writer import TAG_COLUMNS, TAG_DEFAULTS, ensure_tag_columns
+from fingerprint import rebuild_fingerprints
+from profiling import add_profile_arguments, limit_codes, profile_run
+from sync_to_mysql import (
+    HISTORY_START_DATE,
+    ensure_write_version_table,
+    fetch_baostock_rows,
+    load_codes,
+)
+
+bs = lazy_import("baostock")
+
+logger = logging.getLogger(__name__)
+
+SPOOL_DIR = Path("./data/bootstrap")
+DEFAULT_SPOOL_MB = 128
+MERGE_BATCH_CODES = 200
+NULL = r"\N"
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="LOAD DATA LOCAL INFILE 批量初始化日线/周线历史")
+    parser.add_argument("--start", default=HISTORY_START_DATE, help="历史起点 YYYY-MM-DD")
+    parser.add_argument("--end", default=None, help="截止日期 YYYY-MM-DD，默认收盘后今天，否则昨天")
+    parser.add_argument("--raw", action="store_true", help="导入不复权表 stock_daily_raw/stock_weekly_raw")
+    parser.add_argument("--spool-mb", type=int, default=DEFAULT_SPOOL_MB, help="单个 TSV 文件达到多少 MB 后导入")
+    parser.add_argument("--keep-spool", action="store_true", help="导入后保留 TSV 文件")
+    add_profile_arguments(parser)
+    return parser.parse_args()
+
+
+def build_infile_engine() -> Any:
+    return build_engine(connect_args={"allow_local_infile": True})
+
+
+def default_end_date() -> str:
+    now = datetime.now()
+    day = now if now.time() >= dtime(15, 30) else now - timedelta(days=1)
+    return day.strftime("%Y-%m-%d")
+
+
+def staging_table(table: str) -> str:
+    return f"{table}__staging"
+
+
+def check_local_infile(engine: Any) -> None:
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        enabled = conn.execute(text("SELECT @@GLOBAL.local_infile")).scalar()
+    if not int(enabled or 0):
+        raise SystemExit("MySQL 未开启 local_infile，请以 --local-infile=1 启动或执行 SET GLOBAL local_infile = 1")
+
+
+def create_staging(engine: Any, table: str) -> None:
+    """staging 与目标表同结构，但只保留聚簇主键，二级索引留到最后一次性构建。"""
+    from sqlalchemy import text
+
+    ensure_tag_columns(engine, table)  # 合并时要重置标记列，staging 也需要带上
+    staging = staging_table(table)
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS `{staging}`"))
+        conn.execute(text(f"CREATE TABLE `{staging}` LIKE `{table}`"))
+        indexes = conn.execute(
+            text(
+                "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND INDEX_NAME <> 'PRIMARY'"
+            ),
+            {"t": staging},
+        ).fetchall()
+        for (index_name,) in indexes:
+            conn.execute(text(f"ALTER TABLE `{staging}` DROP INDEX `{index_name}`"))
+
+
+class Spool:
+    """单张表的 TSV 落盘文件，写满后交给后台线程导入 staging。"""
+
+    def __init__(self, table: str, columns: list[str], limit_bytes: int) -> None:
+        self.table = table
+        self.columns = columns
+        self.limit_bytes = limit_bytes
+        self.seq = 0
+        self.rows = 0
+        self._open()
+
+    def _open(self) -> None:
+        self.seq += 1
+        self.path = SPOOL_DIR / f"{self.table}.{self.seq:04d}.tsv"
+        self.handle = open(self.path, "w", encoding="utf-8", newline="")
+
+    def write(self, rows: list[tuple]) -> None:
+        # 字段全是代码、日期和数值，不含制表符/换行，直接拼接即可；None 写成 LOAD DATA 的 \N
+        self.handle.writelines(
+            "\t".join(NULL if value is None else str(value) for value in row) + "\n" for row in rows
+        )
+        self.rows += len(rows)
+
+    def full(self) -> bool:
+        return self.handle.tell() >= self.limit_bytes
+
+    def rotate(self) -> Path:
+        """关闭当前文件并返回其路径，随后写入新文件。"""
+        self.handle.close()
+        finished = self.path
+        self._open()
+        return finished
+
+    def close(self) -> Path:
+        self.handle.close()
+        return self.path
+
+
+def load_file(engine: Any, table: str, columns: list[str], path: Path, keep: bool) -> int:
+    from sqlalchemy import text
+
+    staging = staging_table(table)
+    cols = ", ".join(f"`{col}`" for col in columns)
+    started = time.monotonic()
+    with engine.begin() as conn:
+        conn.execute(text("SET SESSION unique_checks = 0"))
+        conn.execute(text("SET SESSION foreign_key_checks = 0"))
+        result = conn.exec_driver_sql(
+            f"LOAD DATA LOCAL INFILE '{path.resolve().as_posix()}' IGNORE INTO TABLE `{staging}` "
+            f"CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' "
+            f"LINES TERMINATED BY '\\n' ({cols})"
+        )
+        loaded = result.rowcount
+        conn.execute(text("SET SESSION unique_checks = 1"))
+        conn.execute(text("SET SESSION foreign_key_checks = 1"))
+    logger.info("%s 导入 %s 行 <- %s，用时 %.1fs", staging, loaded, path.name, time.monotonic() - started)
+    if not keep:
+        path.unlink(missing_ok=True)
+    return loaded
+
+
+def finalize(engine: Any, table: str, columns: list[str]) -> None:
+    from sqlalchemy import bindparam, text
+
+    staging = staging_table(table)
+    with engine.connect() as conn:
+        target_empty = conn.execute(text(f"SELECT NOT EXISTS (SELECT 1 FROM `{table}`)")).scalar()
+        indexes = conn.execute(
+            text(
+                "SELECT INDEX_NAME, MIN(NON_UNIQUE), "
+                "GROUP_CONCAT(CONCAT('`', COLUMN_NAME, '`') ORDER BY SEQ_IN_INDEX) "
+                "FROM information_schema.STATISTICS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND INDEX_NAME <> 'PRIMARY' "
+                "GROUP BY INDEX_NAME"
+            ),
+            {"t": table},
+        ).fetchall()
+
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO `stock_write_version` (`table_name`, `code`, `year`) "
+                f"SELECT DISTINCT :t, `code`, YEAR(`date`) FROM `{staging}` "
+                "ON DUPLICATE KEY UPDATE `version` = CURRENT_TIMESTAMP(6)"
+            ),
+            {"t": table},
+        )
+
+    if target_empty:
+        # 新库：按目标表的二级索引一次性排序构建，然后原子替换
+        for index_name, non_unique, index_columns in indexes:
+            kind = "KEY" if int(non_unique) else "UNIQUE KEY"
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE `{staging}` ADD {kind} `{index_name}` ({index_columns})"))
+        old = f"{table}__pre_bootstrap"
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS `{old}`"))
+            conn.execute(text(f"RENAME TABLE `{table}` TO `{old}`, `{staging}` TO `{table}`"))
+            conn.execute(text(f"DROP TABLE `{old}`"))
+        logger.info("%s 为空表，已用 staging 原子替换", table)
+        return
+
+    cols = ", ".join(f"`{col}`" for col in columns)
+    updates = ", ".join(f"`{col}` = VALUES(`{col}`)" for col in columns if col not in ("code", "date"))
+    for column in TAG_COLUMNS.get(table, ()):
+        if column not in columns:
+            updates += f", `{column}` = {TAG_DEFAULTS[column]}"  # 与 build_upsert_sql 一致：Baostock 数据覆盖即为确认
+    merge_sql = text(
+        f"INSERT INTO `{table}` ({cols}) SELECT {cols} FROM `{staging}` WHERE `code` IN :codes "
+        f"ON DUPLICATE KEY UPDATE {updates}"
+    ).bindparams(bindparam("codes", expanding=True))
+    with engine.connect() as conn:
+        codes = [row[0] for row in conn.execute(text(f"SELECT DISTINCT `code` FROM `{staging}` ORDER BY `code`"))]
+    for offset in range(0, len(codes), MERGE_BATCH_CODES):
+        with engine.begin() as conn:
+            conn.execute(merge_sql, {"codes": codes[offset:offset + MERGE_BATCH_CODES]})
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE `{staging}`"))
+    logger.info("%s 已有数据，按 %s 只一批合并 %s 只股票后删除 staging", table, MERGE_BATCH_CODES, len(codes))
+
+
+def bootstrap(engine: Any, codes: list[str], start: str, end: str, raw: bool, spool_mb: int, keep_spool: bool) -> None:
+    from sqlalchemy import text
+
+    adjustflag = "3" if raw else "2"
+    tables = {
+        "daily": "stock_daily_raw" if raw else "stock_daily",
+        "weekly": "stock_weekly_raw" if raw else "stock_weekly",
+    }
+    check_local_infile(engine)
+    ensure_write_version_table(engine)
+    SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    for table in tables.values():
+        create_staging(engine, table)
+
+    spools: dict[str, Spool] = {}
+    pending: list[Future] = []
+    failed: list[str] = []
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="bootstrap-load") as loader:
+
+        def submit(spool: Spool, path: Path) -> None:
+            # 同时最多一个文件在导入，磁盘占用不超过两份 spool
+            while pending:
+                pending.pop(0).result()
+            pending.append(loader.submit(load_file, engine, spool.table, spool.columns, path, keep_spool))
+
+        lg = bs.login()
+        if lg.error_code != '0':
+            raise SystemExit(f"Baostock login failed: {lg.error_msg}")
+        try:
+            for index, code in enumerate(codes, start=1):
+                for freq, table in tables.items():
+                    try:
+                        columns, rows = fetch_baostock_rows(code, start, end, freq, adjustflag)
+                    except Exception as exc:  # noqa: BLE001
+                        logger.warning("%s %s 拉取失败，重新登录后重试: %s", code, freq, exc)
+                        bs.logout()
+                        time.sleep(2)
+                        bs.login()
+                        try:
+                            columns, rows = fetch_baostock_rows(code, start, end, freq, adjustflag)
+                        except Exception as retry_exc:  # noqa: BLE001
+                            logger.error("%s %s 拉取失败: %s", code, freq, retry_exc)
+                            failed.append(f"{freq},{code}")
+                            continue
+                    if not rows:
+                        continue
+                    spool = spools.get(table)
+                    if spool is None:
+                        spool = spools[table] = Spool(table, columns, spool_mb * 1024 * 1024)
+                    spool.write(rows)
+                    if spool.full():
+                        submit(spool, spool.rotate())
+                if raw:
+                    sync_adjust_factors(engine, code)
+                if index % 100 == 0 or index == len(codes):
+                    elapsed = time.monotonic() - started
+                    logger.info(
+                        "拉取进度 %s/%s，预计剩余 %.0f 分钟", index, len(codes), elapsed / index * (len(codes) - index) / 60
+                    )
+                time.sleep(random.uniform(0.1, 0.3))
+        finally:
+            bs.logout()
+
+        for spool in spools.values():
+            submit(spool, spool.close())
+        while pending:
+            pending.pop(0).result()
+
+    for table in tables.values():
+        if table in spools:
+            finalize(engine, table, spools[table].columns)
+            logger.info("%s 指纹重建：%s 个 (代码, 月)", table, rebuild_fingerprints(engine, table))
+        else:
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP TABLE IF EXISTS `{staging_table(table)}`"))
+    if failed:
+        failed_path = LOG_DIR / "failed_bootstrap_codes.txt"
+        failed_path.write_text("\n".join(failed), encoding="utf-8")
+        logger.warning("拉取失败 %s 项，已写入 %s，可用 sync_to_mysql.py 补齐", len(failed), failed_path)
+    logger.info("初始化导入完成，用时 %.0f 分钟", (time.monotonic() - started) / 60)
+
+
+def run(args: argparse.Namespace) -> None:
+    if args.spool_mb < 1:
+        raise SystemExit("--spool-mb 至少为 1")
+    codes = limit_codes(load_codes(), args)
+    if not codes:
+        logger.warning("⚠️ 未加载到任何股票代码，请检查 code.csv")
+        return
+    engine = build_infile_engine()
+    if args.raw:
+        ensure_raw_tables(engine)
+    end = args.end or default_end_date()
+    logger.info("初始化导入 %s 只股票 %s ~ %s，raw=%s", len(codes), args.start, end, args.raw)
+    bootstrap(engine, codes, args.start, end, args.raw, args.spool_mb, args.keep_spool)
+
+
+def main() -> None:
+    args = parse_arguments()
+    setup_logging("bootstrap_load.log")
+    try:
+        with profile_run("bootstrap_load", args):
+            run(args)
+    finally:
+        log_stats()
+
+
+if __name__ == "__main__":
+    main()
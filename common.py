@@ -0,0 +1,110 @@
+"""各同步脚本共用的配置、日志与数据库连接。
+
+只依赖标准库：pandas / baostock / SQLAlchemy 等重依赖通过 lazy_import 或函数内导入推迟到真正用到时，
+`stock_sync_cli.py --help`、`fetch_intraday_one` 这类轻命令不必为它们付启动时间。
+日志不再在 import 时配置，由各脚本的 main() 调用 setup_logging。
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import logging
+import os
+import sys
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Iterator
+
+MYSQL_USER = os.getenv("MYSQL_USER", "root")
+MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "InsightOne123456")
+MYSQL_HOST = os.getenv("MYSQL_HOST", "127.0.0.1")
+MYSQL_PORT = os.getenv("MYSQL_PORT", "3306")
+MYSQL_DB = os.getenv("MYSQL_DB", "stock_db_qfq")
+CODE_CSV_PATH = os.getenv("CODE_CSV_PATH", "./code.csv")
+LOG_DIR = Path("./logs")
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOCK_PREFIX = "stock_sync:"
+
+
+def lazy_import(name: str) -> ModuleType:
+    """返回一个首次访问属性时才真正执行的模块；已导入的模块直接返回。"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def setup_logging(log_file: str, level: int = logging.INFO, fmt: str = LOG_FORMAT) -> None:
+    """同时输出到 ./logs/<log_file> 与标准输出；根 logger 已配置过时不重复配置（如在调度进程内运行）。"""
+    LOG_DIR.mkdir(exist_ok=True)
+    logging.basicConfig(
+        level=level,
+        format=fmt,
+        handlers=[
+            logging.FileHandler(LOG_DIR / log_file, encoding="utf-8"),
+            logging.StreamHandler(sys.stdout),
+        ],
+    )
+
+
+def mysql_url() -> Any:
+    from sqlalchemy.engine import URL
+
+    return URL.create(
+        "mysql+mysqlconnector",
+        username=MYSQL_USER,
+        password=MYSQL_PASSWORD,
+        host=MYSQL_HOST,
+        port=int(MYSQL_PORT),
+        database=MYSQL_DB,
+        query={"charset": "utf8mb4"},
+    )
+
+
+def build_engine(**kwargs: Any) -> Any:
+    from sqlalchemy import create_engine
+
+    kwargs.setdefault("pool_pre_ping", True)
+    return create_engine(mysql_url(), **kwargs)
+
+
+@contextmanager
+def job_lock(engine: Any, name: str) -> Iterator[bool]:
+    """在专用连接上持有 GET_LOCK('stock_sync:<脚本>')，产出是否拿到锁；连接断开时 MySQL 会自动释放。"""
+    from sqlalchemy import text
+
+    lock_name = f"{LOCK_PREFIX}{name}"
+    with engine.connect() as conn:
+        acquired = conn.execute(text("SELECT GET_LOCK(:n, 0)"), {"n": lock_name}).scalar() == 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute(text("SELECT RELEASE_LOCK(:n)"), {"n": lock_name})
+
+
+@contextmanager
+def exclusive_run(name: str, args: Any, *conflicts: str) -> Iterator[None]:
+    """手工执行脚本时持有与调度进程相同的咨询锁，同一脚本已在运行（调度或手工）则直接退出。
+
+    conflicts 是写同一批表、不能同时运行的其他脚本，一并持有它们的锁。
+    锁所在的引擎放进 args.engine 供 run() 复用；--dry-run 不写库，不加锁。
+    """
+    if getattr(args, "dry_run", False):
+        yield
+        return
+    engine = getattr(args, "engine", None) or build_engine()
+    args.engine = engine
+    with ExitStack() as stack:
+        for lock_name in (name, *conflicts):
+            if not stack.enter_context(job_lock(engine, lock_name)):
+                raise SystemExit(f"{lock_name} 正在其他进程（调度进程或手工执行）中运行，{name} 本次退出")
+        yield
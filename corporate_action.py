@@ -0,0 +1,176 @@
+"""除权除息检测与定向重刷。
+
+stock_daily 存的是前复权价格，任何一次除权除息都会让该股票之前的所有 K 线失效。
+日线增量同步时逐只检测：
+
+* 新 K 线的 preclose 与库中前一日 close 不一致（前复权口径已切换）；
+* 或（--check-dividends）分红送转日历中，上次同步之后出现了除权除息日。
+
+命中的股票写入 stock_resync_queue，日线同步结束后只对这些股票重刷完整历史（日线+周线），
+并整段重算其技术指标（indicators.py），不再需要每周全量重跑 sync_to_mysql。
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from datetime import datetime
+from typing import Any, Sequence
+
+from adjust_factor import get_prev_close, has_ex_rights_rows, to_baostock_code
+from baostock_deadline import baostock_deadline
+from common import lazy_import
+from indicators import recompute_indicators
+from sync_to_mysql import HISTORY_START_DATE, fetch_baostock_data, upsert
+
+bs = lazy_import("baostock")
+
+logger = logging.getLogger(__name__)
+
+QUEUE_TABLE = "stock_resync_queue"
+MAX_ATTEMPTS = 3
+
+CREATE_QUEUE_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{QUEUE_TABLE}` (
+  `code` VARCHAR(20) NOT NULL PRIMARY KEY COMMENT '6位股票代码',
+  `reason` VARCHAR(64) NOT NULL COMMENT '触发原因',
+  `status` VARCHAR(16) NOT NULL DEFAULT 'pending' COMMENT 'pending/done/failed',
+  `attempts` INT NOT NULL DEFAULT 0,
+  `detected_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `finished_at` TIMESTAMP NULL DEFAULT NULL,
+  KEY `idx_status` (`status`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+
+def ensure_resync_queue(engine: Any) -> None:
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_QUEUE_TABLE_SQL))
+
+
+def has_dividend_between(code: str, start_date: str, end_date: str) -> bool:
+    """查询分红送转日历，判断 (start_date, end_date] 内是否有除权除息日。"""
+    for year in range(int(start_date[:4]), int(end_date[:4]) + 1):
+        with baostock_deadline(f"{code} dividend {year}"):
+            rs = bs.query_dividend_data(code=to_baostock_code(code), year=str(year), yearType="operate")
+            if rs.error_code != '0':
+                logger.warning(f"分红数据查询失败 {code} {year}: {rs.error_msg}")
+                continue
+            while (rs.error_code == '0') & rs.next():
+                row = dict(zip(rs.fields, rs.get_row_data()))
+                operate_date = row.get("dividOperateDate", "")
+                if operate_date and start_date < operate_date <= end_date:
+                    return True
+    return False
+
+
+def detect_corporate_action(
+    engine: Any,
+    code: str,
+    columns: Sequence[str],
+    rows: Sequence[tuple],
+    latest_date: str | None,
+    check_dividends: bool = False,
+) -> str | None:
+    """返回触发原因；未检测到除权除息时返回 None。新股（库里无历史）不需要重刷。
+
+    columns/rows 为 fetch_baostock_rows 的返回值（按日期升序）。
+    """
+    if not rows or latest_date is None:
+        return None
+    date_idx = columns.index('date')
+    first_date = rows[0][date_idx]
+    prev_close = get_prev_close(engine, "stock_daily", code, first_date)
+    if prev_close is not None and has_ex_rights_rows(columns, rows, prev_close):
+        return "preclose_mismatch"
+    if check_dividends:
+        last_date = rows[-1][date_idx]
+        if has_dividend_between(code, latest_date, last_date):
+            return "dividend_calendar"
+    return None
+
+
+def enqueue_resync(engine: Any, code: str, reason: str) -> None:
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                f"""
+                INSERT INTO `{QUEUE_TABLE}` (`code`, `reason`, `status`, `attempts`)
+                VALUES (:code, :reason, 'pending', 0)
+                ON DUPLICATE KEY UPDATE
+                    `reason` = VALUES(`reason`),
+                    `status` = 'pending',
+                    `attempts` = 0,
+                    `detected_at` = CURRENT_TIMESTAMP,
+                    `finished_at` = NULL
+                """
+            ),
+            {"code": code, "reason": reason},
+        )
+    logger.info(f"🧾 {code} 检测到除权除息（{reason}），已加入重刷队列")
+
+
+def pending_resyncs(engine: Any) -> list[str]:
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                f"SELECT `code` FROM `{QUEUE_TABLE}` "
+                "WHERE `status` = 'pending' OR (`status` = 'failed' AND `attempts` < :max_attempts) "
+                "ORDER BY `detected_at`"
+            ),
+            {"max_attempts": MAX_ATTEMPTS},
+        ).fetchall()
+    return [row[0] for row in rows]
+
+
+def mark_resync(engine: Any, code: str, status: str) -> None:
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                f"UPDATE `{QUEUE_TABLE}` SET `status` = :status, `attempts` = `attempts` + 1, "
+                "`finished_at` = CURRENT_TIMESTAMP WHERE `code` = :code"
+            ),
+            {"code": code, "status": status},
+        )
+
+
+def resync_code(engine: Any, code: str, end_date: str) -> None:
+    """重刷单只股票完整的前复权日线和周线历史。"""
+    df_d = fetch_baostock_data(code, HISTORY_START_DATE, end_date, "daily")
+    if df_d.empty:
+        raise RuntimeError("日线历史为空")
+    upsert(df_d, "stock_daily", engine, "date")
+    df_w = fetch_baostock_data(code, HISTORY_START_DATE, end_date, "weekly")
+    if not df_w.empty:
+        upsert(df_w, "stock_weekly", engine, "date")
+
+
+def process_resync_queue(engine: Any, end_date: str | None = None, sleep_seconds: float = 0.5) -> tuple[int, int]:
+    """处理重刷队列，返回 (成功数, 失败数)。调用方负责 Baostock 登录。"""
+    end_date = end_date or datetime.now().strftime("%Y-%m-%d")
+    codes = pending_resyncs(engine)
+    if not codes:
+        return 0, 0
+    logger.info(f"开始重刷 {len(codes)} 只除权除息股票的完整历史")
+    done = failed = 0
+    for index, code in enumerate(codes, start=1):
+        try:
+            resync_code(engine, code, end_date)
+            recompute_indicators(engine, [code])  # 历史整体改写，滚动状态作废
+            mark_resync(engine, code, "done")
+            done += 1
+            logger.info(f"✅ {code} 历史重刷完成 {index}/{len(codes)}")
+        except Exception as e:
+            mark_resync(engine, code, "failed")
+            failed += 1
+            logger.warning(f"⚠️ {code} 历史重刷失败 {index}/{len(codes)}: {e}")
+        time.sleep(sleep_seconds)
+    return done, failed
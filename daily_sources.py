@@ -0,0 +1,308 @@
+"""日线/周线的多数据源抓取：统一字段、故障切换与对冲请求。
+
+以前 stock_daily / stock_weekly 只能从 Baostock 拉取，它变慢或宕机时整晚的任务跟着等待或失败。
+这里把数据源抽象为 DailySource，各自输出与 fetch_baostock_rows 相同的字段（缺失的字段为 None），
+MultiSourceFetcher 按配置顺序使用：
+
+* 故障切换：当前数据源抛错就换下一个；连续失败 FAILURE_THRESHOLD 次的数据源熔断 COOLDOWN_SECONDS 秒；
+* 对冲请求：首选数据源超过其近期 p95 耗时仍未返回时，同时向下一个数据源发出请求，先成功者胜出，
+  落后的请求在后台完成后丢弃；样本不足 MIN_SAMPLES 时按 HEDGE_DEFAULT_SECONDS 计。
+  落后的 Baostock 请求在完成前一直持有 baostock_deadline.SESSION_LOCK，主线程的登录/登出经
+  baostock_deadline.login()/logout() 等它结束，close() 也等在途请求结束后再返回；
+* 每行追加 source 与 provisional 列写入 K 线表，对账时可按来源区分。
+
+各数据源的前复权基准并不完全一致，腾讯也不提供昨收，除权检测与指纹校验仍以 Baostock 为准：
+非 Baostock 的行与临时收盘（provisional_close.py）一样写成 provisional = 1，get_latest 不计入，
+下一次 Baostock 同步重新拉取这些日期、写入时清零（确认或覆盖），除权检测也在那时按 Baostock 的
+昨收进行。只有增量同步使用多数据源，--full / --verify 始终走 Baostock。
+
+    python sync_daily.py --sources baostock,tencent,akshare
+    python sync_weekly.py --sources baostock,akshare --no-hedge
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Optional, Sequence
+
+from baostock_deadline import SESSION_LOCK, login, logout
+from common import lazy_import
+from fetch_intraday_one import get_market_prefix, http_get_text, parse_jsonp_text, to_float
+from sync_to_mysql import DAILY_FIELDS, WEEKLY_FIELDS, fetch_baostock_rows
+
+logger = logging.getLogger(__name__)
+
+SOURCE_COLUMN = "source"
+PROVISIONAL_COLUMN = "provisional"
+CONFIRMED_SOURCE = "baostock"
+DEFAULT_SOURCES = os.getenv("DAILY_SOURCES", "baostock")
+HEDGE_DEFAULT_SECONDS = float(os.getenv("HEDGE_DEFAULT_SECONDS", "5"))
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 20
+FAILURE_THRESHOLD = 3
+COOLDOWN_SECONDS = 300
+
+TENCENT_KLINE_URL = "https://web.ifzq.gtimg.cn/appstock/app/fqkline/get"
+TENCENT_MAX_BARS = 640
+
+
+class SourceUnavailable(RuntimeError):
+    """所有数据源均失败（或可选依赖未安装）。"""
+
+
+def normalized_columns(freq: str) -> list[str]:
+    return (DAILY_FIELDS if freq == "daily" else WEEKLY_FIELDS).split(",")
+
+
+def align_rows(freq: str, records: list[dict]) -> list[tuple]:
+    """按统一字段顺序输出元组，数据源未提供的字段为 None。"""
+    columns = normalized_columns(freq)
+    return [tuple(record.get(column) for column in columns) for record in records]
+
+
+class LatencyTracker:
+    """最近 LATENCY_WINDOW 次成功请求的耗时。"""
+
+    def __init__(self, window: int = LATENCY_WINDOW) -> None:
+        self._samples: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self) -> float:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < MIN_SAMPLES:
+            return HEDGE_DEFAULT_SECONDS
+        return samples[int(0.95 * (len(samples) - 1))]
+
+
+class DailySource:
+    """数据源基类：fetch 返回按 normalized_columns(freq) 排列的元组列表，出错时抛异常。"""
+
+    name = ""
+
+    def __init__(self) -> None:
+        self.latency = LatencyTracker()
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    def fetch(self, code: str, start: str, end: str, freq: str, adjustflag: str) -> list[tuple]:
+        raise NotImplementedError
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def timed_fetch(self, code: str, start: str, end: str, freq: str, adjustflag: str) -> list[tuple]:
+        started = time.monotonic()
+        rows = self.fetch(code, start, end, freq, adjustflag)
+        self.latency.record(time.monotonic() - started)
+        return rows
+
+    def record_success(self) -> None:
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= FAILURE_THRESHOLD:
+            self.cooldown_until = time.monotonic() + COOLDOWN_SECONDS
+            self.failures = 0
+            logger.warning("数据源 %s 连续失败 %s 次，熔断 %ss", self.name, FAILURE_THRESHOLD, COOLDOWN_SECONDS)
+
+
+class BaostockSource(DailySource):
+    """Baostock 只有一个全局连接，与主线程共用 SESSION_LOCK；出错后重新登录再抛出，交给下一个数据源。"""
+
+    name = "baostock"
+
+    def fetch(self, code: str, start: str, end: str, freq: str, adjustflag: str) -> list[tuple]:
+        with SESSION_LOCK:
+            try:
+                _, rows = fetch_baostock_rows(code, start, end, freq, adjustflag, strict=True)
+            except Exception:
+                logout()
+                login()
+                raise
+        return rows
+
+
+class TencentSource(DailySource):
+    """腾讯 fqkline 接口：开高低收与成交量，不提供昨收、成交额等字段。"""
+
+    name = "tencent"
+
+    def fetch(self, code: str, start: str, end: str, freq: str, adjustflag: str) -> list[tuple]:
+        period = "day" if freq == "daily" else "week"
+        fq = "" if adjustflag == "3" else "qfq"
+        symbol = f"{get_market_prefix(code)}{code}"
+        params = {
+            "_var": f"kline_{period}{fq}",
+            "param": f"{symbol},{period},{start},{end},{TENCENT_MAX_BARS},{fq}",
+            "r": f"{time.time():.9f}",
+        }
+        payload = parse_jsonp_text(http_get_text(TENCENT_KLINE_URL, params))
+        if payload.get("code") not in (0, None):
+            raise RuntimeError(f"腾讯 K 线接口返回错误 {code}: {payload.get('msg')}")
+        block = (payload.get("data") or {}).get(symbol) or {}
+        bars = block.get(f"{fq}{period}") or block.get(period) or []
+        records = []
+        for bar in bars:
+            day = bar[0]
+            if not start <= day <= end:
+                continue
+            volume_hand = to_float(bar[5])
+            records.append(
+                {
+                    "date": day,
+                    "code": code,
+                    "open": to_float(bar[1]),
+                    "close": to_float(bar[2]),
+                    "high": to_float(bar[3]),
+                    "low": to_float(bar[4]),
+                    "volume": int(volume_hand * 100) if volume_hand is not None else None,
+                    "adjustflag": int(adjustflag),
+                    "tradestatus": 1,
+                }
+            )
+        return align_rows(freq, records)
+
+
+class AkshareSource(DailySource):
+    """akshare.stock_zh_a_hist（东方财富）：字段最全，昨收由 收盘 - 涨跌额 推出。"""
+
+    name = "akshare"
+
+    def fetch(self, code: str, start: str, end: str, freq: str, adjustflag: str) -> list[tuple]:
+        try:
+            ak = lazy_import("akshare")
+        except ModuleNotFoundError as exc:
+            raise SourceUnavailable("akshare 未安装") from exc
+        df = ak.stock_zh_a_hist(
+            symbol=code,
+            period="daily" if freq == "daily" else "weekly",
+            start_date=start.replace("-", ""),
+            end_date=end.replace("-", ""),
+            adjust="" if adjustflag == "3" else "qfq",
+        )
+        records = []
+        for row in df.to_dict("records"):
+            close, change = row.get("收盘"), row.get("涨跌额")
+            records.append(
+                {
+                    "date": str(row["日期"])[:10],
+                    "code": code,
+                    "open": row.get("开盘"),
+                    "high": row.get("最高"),
+                    "low": row.get("最低"),
+                    "close": close,
+                    "preclose": round(close - change, 4) if close is not None and change is not None else None,
+                    "volume": int(row["成交量"] * 100) if row.get("成交量") is not None else None,
+                    "amount": row.get("成交额"),
+                    "adjustflag": int(adjustflag),
+                    "turn": row.get("换手率"),  # 与 Baostock 相同，单位为 %
+                    "tradestatus": 1,
+                    "pctChg": row.get("涨跌幅"),
+                }
+            )
+        return align_rows(freq, records)
+
+
+SOURCES = {source.name: source for source in (BaostockSource, TencentSource, AkshareSource)}
+
+
+class MultiSourceFetcher:
+    """按顺序使用多个数据源，带故障切换与对冲请求；fetch 返回 (字段名, 元组)，末两列为 source、provisional。"""
+
+    def __init__(self, sources: Sequence[DailySource], hedge: bool = True) -> None:
+        self.sources = list(sources)
+        self.hedge = hedge and len(self.sources) > 1
+        self.wins: Counter[str] = Counter()
+        self.hedges = 0
+        self.failovers = 0
+        self._executor = ThreadPoolExecutor(max_workers=2 * len(self.sources), thread_name_prefix="daily-source")
+
+    def fetch(self, code: str, start: str, end: str, freq: str = "daily", adjustflag: str = "2"):
+        columns = normalized_columns(freq) + [SOURCE_COLUMN, PROVISIONAL_COLUMN]
+        candidates = [source for source in self.sources if source.available()] or list(self.sources)
+        pending: dict[Future, DailySource] = {}
+        errors: list[str] = []
+        hedged = False
+
+        def launch() -> DailySource:
+            source = candidates.pop(0)
+            pending[self._executor.submit(source.timed_fetch, code, start, end, freq, adjustflag)] = source
+            return source
+
+        primary = launch()
+        while pending:
+            timeout = primary.latency.p95() if self.hedge and candidates and not hedged else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                self.hedges += 1
+                backup = launch()
+                logger.info("%s %s 超过 %.1fs 未返回，对冲请求 %s", primary.name, code, timeout, backup.name)
+                continue
+            for future in done:
+                source = pending.pop(future)
+                try:
+                    rows = future.result()
+                except Exception as exc:  # noqa: BLE001
+                    source.record_failure()
+                    errors.append(f"{source.name}: {exc}")
+                    if not pending and candidates:
+                        self.failovers += 1
+                        primary = launch()
+                        logger.warning("%s %s 失败，切换到 %s: %s", source.name, code, primary.name, exc)
+                    continue
+                source.record_success()
+                self.wins[source.name] += 1
+                provisional = 0 if source.name == CONFIRMED_SOURCE else 1  # 待 Baostock 确认
+                return columns, [row + (source.name, provisional) for row in rows]
+        raise SourceUnavailable(f"{code} {freq} 所有数据源均失败: {'; '.join(errors)}")
+
+    def summary(self) -> str:
+        wins = ", ".join(f"{name} {count}" for name, count in self.wins.most_common()) or "-"
+        return f"数据源使用: {wins}；对冲 {self.hedges} 次，故障切换 {self.failovers} 次"
+
+    def close(self) -> None:
+        # 等在途请求（最长 CALL_TIMEOUT）结束，调用方随后登出 Baostock 时不会关掉后台请求正在用的连接
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        logger.info(self.summary())
+
+
+def parse_sources(value: str) -> list[str]:
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SOURCES]
+    if unknown or not names:
+        raise argparse.ArgumentTypeError(f"未知数据源 {', '.join(unknown) or value!r}，可选: {', '.join(SOURCES)}")
+    return names
+
+
+def add_source_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--sources",
+        type=parse_sources,
+        default=DEFAULT_SOURCES,
+        help=f"增量同步的数据源，按优先级逗号分隔（{', '.join(SOURCES)}），默认 {DEFAULT_SOURCES}",
+    )
+    parser.add_argument("--no-hedge", action="store_true", help="关闭对冲请求，只在失败时切换数据源")
+
+
+def build_fetcher(args: argparse.Namespace) -> Optional[MultiSourceFetcher]:
+    """只配置了 baostock 时返回 None，调用方走原有的 Baostock 路径（不写 source 列）。"""
+    names = getattr(args, "sources", None) or ["baostock"]
+    if names == ["baostock"]:
+        return None
+    fetcher = MultiSourceFetcher([SOURCES[name]() for name in names], hedge=not args.no_hedge)
+    logger.info("多数据源增量同步: %s，对冲%s", " > ".join(names), "开启" if fetcher.hedge else "关闭")
+    return fetcher
+
@@ -0,0 +1,369 @@
+"""单写线程的组提交写入器，以及各同步任务共用的 upsert / 写入版本工具。
+
+增量同步每只股票只有几行，逐只 checkout 连接、开事务、提交，成千上万次小提交各付一次 fsync。
+GroupCommitWriter 用一个后台线程 + 有界队列，把多只股票的行合并进同一个事务：
+
+* 攒够 max_rows 行、max_bytes 字节，或最早一批等待超过 max_latency 秒时提交；
+* 队列满时 submit 阻塞，调用方天然限速；
+* 每批的 on_commit 回调只在其所在事务提交成功后执行，用于推进水位线/记录已完成的股票；
+* 任一事务失败后写入器进入失败状态，后续 submit/flush/close 抛出该异常，未提交批次的回调不会执行。
+
+    with open_writer(engine, args) as writer:
+        write_rows(engine, writer, "stock_daily", columns, rows, on_commit=lambda: done.add(code))
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+from fingerprint import ensure_fingerprint_table, month_keys, refresh_fingerprints
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ROWS = 5000
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+DEFAULT_MAX_LATENCY = 2.0
+DEFAULT_QUEUE_SIZE = 256
+
+# 写入版本表：按 (表, 代码, 年份) 记录最近一次写入时间，panel_loader 据此让块缓存失效
+WRITE_VERSION_DDL = """
+CREATE TABLE IF NOT EXISTS `stock_write_version` (
+  `table_name` VARCHAR(64) NOT NULL,
+  `code` VARCHAR(20) NOT NULL,
+  `year` SMALLINT NOT NULL,
+  `version` TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+  PRIMARY KEY (`table_name`, `code`, `year`),
+  KEY `idx_version` (`version`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+_write_version_ready = set()
+
+# 行级标记列，写入时未显式给出就重置为默认值：
+# provisional —— provisional_close.py 的临时收盘、daily_sources.py 的非 Baostock 回退行置 1，
+#                Baostock 写入同一行时清零；
+# source —— 数据来源（daily_sources.py），未给出即为 baostock
+TAG_COLUMN_DDL = {
+    "provisional": "TINYINT NOT NULL DEFAULT 0 COMMENT '1=非 Baostock 数据（临时收盘/回退数据源），待 Baostock 确认'",
+    "source": "VARCHAR(16) NOT NULL DEFAULT 'baostock' COMMENT '数据来源'",
+}
+TAG_DEFAULTS = {"provisional": "0", "source": "'baostock'"}
+TAG_COLUMNS = {
+    "stock_daily": ("provisional", "source"),
+    "stock_daily_raw": ("provisional", "source"),
+    "stock_weekly": ("provisional", "source"),
+    "stock_weekly_raw": ("provisional", "source"),
+}
+PROVISIONAL_TABLES = ("stock_daily", "stock_daily_raw", "stock_weekly", "stock_weekly_raw")
+_tag_columns_ready = set()
+
+
+def ensure_write_version_table(engine):
+    """每个进程对每个库只建一次写入版本表"""
+    from sqlalchemy import text
+
+    key = str(engine.url)
+    if key in _write_version_ready:
+        return
+    with engine.begin() as conn:
+        conn.execute(text(WRITE_VERSION_DDL))
+    _write_version_ready.add(key)
+
+
+def ensure_tag_columns(engine, table):
+    """旧库补加行级标记列（追加到末尾，MySQL 8 为 INSTANT DDL）；每个进程每张表只检查一次"""
+    from sqlalchemy import text
+
+    columns = TAG_COLUMNS.get(table)
+    if not columns:
+        return
+    key = (str(engine.url), table)
+    if key in _tag_columns_ready:
+        return
+    with engine.begin() as conn:
+        existing = {
+            row[0]
+            for row in conn.execute(
+                text(
+                    "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t"
+                ),
+                {"t": table},
+            )
+        }
+        for column in columns:
+            if column not in existing:
+                conn.execute(text(f"ALTER TABLE `{table}` ADD COLUMN `{column}` {TAG_COLUMN_DDL[column]}"))
+    _tag_columns_ready.add(key)
+
+
+def touch_write_versions(conn, table, code_years):
+    """在写入事务内更新 (代码, 年份) 的版本号，随数据一起提交"""
+    from sqlalchemy import text
+
+    rows = [{"t": table, "c": code, "y": int(year)} for code, year in code_years]
+    if not rows:
+        return
+    conn.execute(
+        text(
+            "INSERT INTO `stock_write_version` (`table_name`, `code`, `year`) VALUES (:t, :c, :y) "
+            "ON DUPLICATE KEY UPDATE `version` = CURRENT_TIMESTAMP(6)"
+        ),
+        rows,
+    )
+
+
+def build_upsert_sql(table: str, columns: Sequence[str], key_columns: Sequence[str]) -> str:
+    cols = ", ".join(f"`{col}`" for col in columns)
+    placeholders = ", ".join(["%s"] * len(columns))
+    updates = ", ".join(f"`{col}` = VALUES(`{col}`)" for col in columns if col not in key_columns)
+    for column in TAG_COLUMNS.get(table, ()):
+        if column not in columns:
+            updates += f", `{column}` = {TAG_DEFAULTS[column]}"  # 如 Baostock 数据覆盖临时收盘即为确认
+    return f"INSERT INTO `{table}` ({cols}) VALUES ({placeholders}) ON DUPLICATE KEY UPDATE {updates}"
+
+
+def version_keys(columns: Sequence[str], rows: Sequence[tuple], date_column: Optional[str]) -> set:
+    if date_column is None:
+        return set()
+    code_idx, date_idx = list(columns).index("code"), list(columns).index(date_column)
+    return {(row[code_idx], int(str(row[date_idx])[:4])) for row in rows}
+
+
+def upsert_rows(engine, table, columns, rows, key_columns=("code", "date"), date_column="date"):
+    """类型化元组直接 executemany：INSERT ... ON DUPLICATE KEY UPDATE，同一事务内登记写入版本、刷新月指纹"""
+    if not rows:
+        return
+    sql = build_upsert_sql(table, columns, key_columns)
+    code_years = version_keys(columns, rows, date_column)
+    if code_years:
+        ensure_write_version_table(engine)
+        ensure_fingerprint_table(engine, table)
+    ensure_tag_columns(engine, table)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(sql, rows)
+        touch_write_versions(conn, table, code_years)
+        refresh_fingerprints(conn, table, month_keys(columns, rows, date_column))
+
+
+@dataclass
+class _Batch:
+    table: str
+    columns: tuple
+    key_columns: tuple
+    date_column: Optional[str]
+    rows: list
+    size: int
+    on_commit: Optional[Callable[[], None]]
+
+
+_STOP = object()
+
+
+def _estimate_bytes(rows: Sequence[tuple]) -> int:
+    return sum(len(value) if isinstance(value, str) else 8 for row in rows for value in row)
+
+
+class GroupCommitWriter:
+    """后台单线程写入器：合并多次 submit 到一个事务里提交。"""
+
+    def __init__(
+        self,
+        engine: Any,
+        max_rows: int = DEFAULT_MAX_ROWS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_latency: float = DEFAULT_MAX_LATENCY,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+    ) -> None:
+        self.engine = engine
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self.commits = 0
+        self.rows_committed = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        table: str,
+        columns: Sequence[str],
+        rows: Sequence[tuple],
+        *,
+        key_columns: Sequence[str] = ("code", "date"),
+        date_column: Optional[str] = "date",
+        on_commit: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """排队写入；队列满时阻塞。rows 为空时回调仍按顺序在之前的批次提交后执行。"""
+        self._raise_if_failed()
+        if self._closed:
+            raise RuntimeError("GroupCommitWriter 已关闭")
+        rows = list(rows)
+        self._queue.put(
+            _Batch(table, tuple(columns), tuple(key_columns), date_column, rows, _estimate_bytes(rows), on_commit)
+        )
+
+    @property
+    def failed(self) -> bool:
+        return self._error is not None
+
+    def flush(self) -> None:
+        """等待此前提交的所有批次落库。"""
+        barrier = threading.Event()
+        self._queue.put(barrier)
+        barrier.wait()
+        self._raise_if_failed()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        logger.info("组提交写入器关闭：%s 次提交，%s 行", self.commits, self.rows_committed)
+        self._raise_if_failed()
+
+    def __enter__(self) -> "GroupCommitWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+            return
+        try:
+            self.close()
+        except Exception:  # noqa: BLE001
+            logger.exception("组提交写入器关闭失败")
+
+    def _raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise RuntimeError(f"组提交写入失败: {self._error}") from self._error
+
+    def _run(self) -> None:
+        pending: list[_Batch] = []
+        rows = size = 0
+        deadline: Optional[float] = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None  # 到达延迟上限
+
+            if isinstance(item, _Batch):
+                pending.append(item)
+                rows += len(item.rows)
+                size += item.size
+                if deadline is None:
+                    deadline = time.monotonic() + self.max_latency
+                if rows < self.max_rows and size < self.max_bytes:
+                    continue
+
+            self._commit(pending)
+            pending, rows, size, deadline = [], 0, 0, None
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                return
+
+    def _commit(self, pending: list[_Batch]) -> None:
+        if not pending:
+            return
+        if self._error is not None:
+            return  # 失败后丢弃，回调不执行，调用方据此不推进进度
+
+        groups: dict[tuple, list[tuple]] = {}
+        versions: dict[str, set] = {}
+        months: dict[str, set] = {}
+        for batch in pending:
+            if not batch.rows:
+                continue
+            groups.setdefault((batch.table, batch.columns, batch.key_columns), []).extend(batch.rows)
+            keys = version_keys(batch.columns, batch.rows, batch.date_column)
+            if keys:
+                versions.setdefault(batch.table, set()).update(keys)
+                months.setdefault(batch.table, set()).update(month_keys(batch.columns, batch.rows, batch.date_column))
+
+        total = sum(len(group) for group in groups.values())
+        try:
+            if versions:
+                ensure_write_version_table(self.engine)
+            for table in months:
+                ensure_fingerprint_table(self.engine, table)
+            for table, _, _ in groups:
+                ensure_tag_columns(self.engine, table)
+            with self.engine.begin() as conn:
+                for (table, columns, key_columns), group_rows in groups.items():
+                    conn.exec_driver_sql(build_upsert_sql(table, columns, key_columns), group_rows)
+                for table, code_years in versions.items():
+                    touch_write_versions(conn, table, code_years)
+                for table, code_months in months.items():
+                    refresh_fingerprints(conn, table, code_months)
+        except Exception as exc:  # noqa: BLE001
+            self._error = exc
+            logger.exception("组提交失败，%s 批 %s 行未写入", len(pending), total)
+            return
+
+        self.commits += 1
+        self.rows_committed += total
+        logger.debug("组提交：%s 批 %s 行", len(pending), total)
+        for batch in pending:
+            if batch.on_commit is None:
+                continue
+            try:
+                batch.on_commit()
+            except Exception:  # noqa: BLE001
+                logger.exception("提交回调执行失败")
+
+
+def add_group_commit_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--group-commit",
+        action="store_true",
+        help="多只股票的写入合并到同一事务，由后台写线程按行数/字节/延迟提交",
+    )
+    parser.add_argument("--group-commit-rows", type=int, default=DEFAULT_MAX_ROWS, help="组提交的行数上限")
+    parser.add_argument(
+        "--group-commit-ms", type=int, default=int(DEFAULT_MAX_LATENCY * 1000), help="组提交的最大等待毫秒数"
+    )
+
+
+@contextmanager
+def open_writer(engine: Any, args: argparse.Namespace) -> Iterator[Optional[GroupCommitWriter]]:
+    """未开启 --group-commit（或未传 engine）时产出 None，调用方走逐只直写。"""
+    if engine is None or not getattr(args, "group_commit", False):
+        yield None
+        return
+    with GroupCommitWriter(
+        engine, max_rows=args.group_commit_rows, max_latency=args.group_commit_ms / 1000
+    ) as writer:
+        yield writer
+
+
+def write_rows(
+    engine: Any,
+    writer: Optional[GroupCommitWriter],
+    table: str,
+    columns: Sequence[str],
+    rows: Sequence[tuple],
+    *,
+    key_columns: Sequence[str] = ("code", "date"),
+    date_column: Optional[str] = "date",
+    on_commit: Optional[Callable[[], None]] = None,
+) -> None:
+    """有写入器就排队组提交，否则立即 upsert；两种方式下 on_commit 都只在落库后执行。"""
+    if writer is not None:
+        writer.submit(table, columns, rows, key_columns=key_columns, date_column=date_column, on_commit=on_commit)
+        return
+    upsert_rows(engine, table, columns, rows, key_columns=key_columns, date_column=date_column)
+    if on_commit is not None:
+        on_commit()
@@ -13,6 +13,8 @@ from pathlib import Path
 from urllib.parse import quote
 from urllib.request import Request, urlopen
 
+from raw_archive import record as archive_raw
+
 TENCENT_M1_URL = "https://ifzq.gtimg.cn/appstock/app/kline/mkline"
 REQUEST_TIMEOUT = 10
 MAX_RETRIES = 3
@@ -127,7 +129,14 @@ def fetch_intraday_trends(code: str, bars: int = 32000) -> dict:
         "_var": "m1_today",
         "r": f"{time.time():.9f}",
     }
-    payload = parse_jsonp_text(http_get_text(TENCENT_M1_URL, params))
+    text = http_get_text(TENCENT_M1_URL, params)
+    archive_raw("tencent_mkline", code=code, payload=text)
+    return parse_mkline_text(code, text)
+
+
+def parse_mkline_text(code: str, text: str) -> dict:
+    """解析 mkline 接口的 JSONP 原文；归档重放时直接调用。"""
+    payload = parse_jsonp_text(text)
     data = payload.get("data") or {}
     quote_key = f"{get_market_prefix(code)}{code}"
     stock_block = data.get(quote_key) or {}
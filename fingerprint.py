@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""日线/周线的按 (代码, 月) 指纹表，用来低成本判断库中历史是否仍与上游一致。
+
+<表名>_fingerprint（如 stock_daily_fingerprint）每行记录一只股票一个月的：
+
+* row_count：K 线条数，发现漏写/多写；
+* close_sum_hash：Σ CRC32('YYYY-MM-DD|收盘价')，收盘价按 DECIMAL(10,4) 格式化。
+  求和与行顺序无关，任何一天的收盘价变化（如前复权整体改写）都会改变它。
+
+写入路径（upsert / upsert_rows / 组提交 / 校验重写）在同一事务里用 refresh_fingerprints
+按受影响的 (代码, 月) 从 K 线表重新聚合，删改都能正确反映；一个月最多二十几行，走主键范围扫描。
+对账任务用 frame_fingerprints / row_fingerprints 在本地算出同口径指纹，再用 changed_months
+与库中指纹比较，只处理不一致的月份，不做逐行 diff。
+
+    python fingerprint.py --rebuild               # 已有数据的库首次启用时全量生成
+    python fingerprint.py --rebuild --table stock_daily_raw
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import math
+import zlib
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Iterable, Sequence
+
+from common import build_engine, setup_logging
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINTED_TABLES = ("stock_daily", "stock_weekly", "stock_daily_raw", "stock_weekly_raw")
+PRICE_QUANTUM = Decimal("0.0001")  # 与 K 线表 DECIMAL(10,4) 一致
+
+CREATE_FINGERPRINT_SQL = """
+CREATE TABLE IF NOT EXISTS `{table}` (
+  `code` VARCHAR(20) NOT NULL COMMENT '6位股票代码',
+  `year_month` CHAR(7) NOT NULL COMMENT 'YYYY-MM',
+  `row_count` INT NOT NULL,
+  `close_sum_hash` BIGINT UNSIGNED NOT NULL COMMENT 'SUM(CRC32(CONCAT(date, ''|'', close)))',
+  `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`code`, `year_month`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+# 从 K 线表聚合指纹；{where} 由调用方拼接过滤条件
+AGGREGATE_SQL = """
+INSERT INTO `{fp_table}` (`code`, `year_month`, `row_count`, `close_sum_hash`)
+SELECT `code`, DATE_FORMAT(`date`, '%Y-%m'), COUNT(*),
+       COALESCE(SUM(CRC32(CONCAT(`date`, '|', COALESCE(`close`, '')))), 0)
+FROM `{table}`
+WHERE {where}
+GROUP BY `code`, DATE_FORMAT(`date`, '%Y-%m')
+ON DUPLICATE KEY UPDATE `row_count` = VALUES(`row_count`), `close_sum_hash` = VALUES(`close_sum_hash`)
+"""
+
+_fingerprint_ready: set = set()
+
+
+def fingerprint_table(table: str) -> str:
+    return f"{table}_fingerprint"
+
+
+def ensure_fingerprint_table(engine: Any, table: str) -> None:
+    """建表会隐式提交，须在写入事务开始前调用；每个进程每张表只执行一次。"""
+    from sqlalchemy import text
+
+    if table not in FINGERPRINTED_TABLES:
+        return
+    key = (str(engine.url), table)
+    if key in _fingerprint_ready:
+        return
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_FINGERPRINT_SQL.format(table=fingerprint_table(table))))
+    _fingerprint_ready.add(key)
+
+
+def month_keys(columns: Sequence[str], rows: Iterable[tuple], date_column: str | None = "date") -> set:
+    """写入行涉及的 (代码, 'YYYY-MM')。"""
+    if date_column is None:
+        return set()
+    code_idx, date_idx = list(columns).index("code"), list(columns).index(date_column)
+    return {(row[code_idx], str(row[date_idx])[:7]) for row in rows}
+
+
+def refresh_fingerprints(conn: Any, table: str, code_months: Iterable[tuple[str, str]]) -> None:
+    """在写入事务内重算受影响月份的指纹；K 线已被删空的月份同时删除指纹。"""
+    from sqlalchemy import text
+
+    if table not in FINGERPRINTED_TABLES:
+        return
+    by_code: dict[str, set[str]] = {}
+    for code, month in code_months:
+        by_code.setdefault(code, set()).add(month)
+    fp_table = fingerprint_table(table)
+    for code, months in by_code.items():
+        first, last = min(months), max(months)
+        conn.execute(
+            text(f"DELETE FROM `{fp_table}` WHERE `code` = :c AND `year_month` BETWEEN :s AND :e"),
+            {"c": code, "s": first, "e": last},
+        )
+        conn.execute(
+            text(
+                AGGREGATE_SQL.format(
+                    fp_table=fp_table, table=table, where="`code` = :c AND `date` BETWEEN :s AND LAST_DAY(:e)"
+                )
+            ),
+            {"c": code, "s": f"{first}-01", "e": f"{last}-01"},
+        )
+
+
+def rebuild_fingerprints(engine: Any, table: str) -> int:
+    """从 K 线表全量重建指纹，返回写入的 (代码, 月) 数。"""
+    from sqlalchemy import text
+
+    ensure_fingerprint_table(engine, table)
+    fp_table = fingerprint_table(table)
+    with engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM `{fp_table}`"))
+        conn.execute(text(AGGREGATE_SQL.format(fp_table=fp_table, table=table, where="1 = 1")))
+        return int(conn.execute(text(f"SELECT COUNT(*) FROM `{fp_table}`")).scalar())
+
+
+def _row_hash(day: str, close: Any) -> int:
+    if close is None or (isinstance(close, float) and math.isnan(close)):
+        close_text = ""
+    else:
+        close_text = str(Decimal(str(close)).quantize(PRICE_QUANTUM, rounding=ROUND_HALF_UP))
+    return zlib.crc32(f"{day}|{close_text}".encode())
+
+
+def row_fingerprints(columns: Sequence[str], rows: Iterable[tuple]) -> dict[tuple[str, str], tuple[int, int]]:
+    """fetch_baostock_rows 结果的本地指纹，{(代码, 'YYYY-MM'): (行数, close_sum_hash)}。"""
+    columns = list(columns)
+    code_idx, date_idx, close_idx = columns.index("code"), columns.index("date"), columns.index("close")
+    result: dict[tuple[str, str], tuple[int, int]] = {}
+    for row in rows:
+        day = str(row[date_idx])[:10]
+        key = (row[code_idx], day[:7])
+        count, total = result.get(key, (0, 0))
+        result[key] = (count + 1, total + _row_hash(day, row[close_idx]))
+    return result
+
+
+def frame_fingerprints(df: Any) -> dict[tuple[str, str], tuple[int, int]]:
+    """fetch_baostock_data 返回的 DataFrame 的本地指纹，口径同 row_fingerprints。"""
+    if df.empty:
+        return {}
+    days = df["date"].dt.strftime("%Y-%m-%d") if hasattr(df["date"], "dt") else df["date"].astype(str)
+    rows = zip(df["code"], days, df["close"])
+    return row_fingerprints(("code", "date", "close"), rows)
+
+
+def stored_fingerprints(
+    engine: Any, table: str, codes: Sequence[str], start: str, end: str
+) -> dict[tuple[str, str], tuple[int, int]]:
+    """库中 [start, end] 所在月份的指纹。"""
+    from sqlalchemy import bindparam, text
+
+    if not codes:
+        return {}
+    ensure_fingerprint_table(engine, table)
+    query = text(
+        f"SELECT `code`, `year_month`, `row_count`, `close_sum_hash` FROM `{fingerprint_table(table)}` "
+        "WHERE `code` IN :codes AND `year_month` BETWEEN :s AND :e"
+    ).bindparams(bindparam("codes", expanding=True))
+    with engine.connect() as conn:
+        result = conn.execute(query, {"codes": list(codes), "s": start[:7], "e": end[:7]})
+        return {(code, month): (int(count), int(total)) for code, month, count, total in result}
+
+
+def changed_months(
+    fetched: dict[tuple[str, str], tuple[int, int]],
+    stored: dict[tuple[str, str], tuple[int, int]],
+) -> dict[str, list[str]]:
+    """上游有、且与库中指纹不一致（含库中缺失）的月份，按代码分组。"""
+    changed: dict[str, list[str]] = {}
+    for key in sorted(fetched):
+        if stored.get(key) != fetched[key]:
+            changed.setdefault(key[0], []).append(key[1])
+    return changed
+
+
+def compare_frame(engine: Any, table: str, df: Any) -> dict[str, list[str]]:
+    """把抓到的 DataFrame 与库中指纹比较，返回 {代码: [不一致的 'YYYY-MM', ...]}；一致的月份可直接跳过。"""
+    fetched = frame_fingerprints(df)
+    if not fetched:
+        return {}
+    codes = sorted({code for code, _ in fetched})
+    months = sorted(month for _, month in fetched)
+    stored = stored_fingerprints(engine, table, codes, months[0], months[-1])
+    return changed_months(fetched, stored)
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="维护 K 线表的 (代码, 月) 指纹")
+    parser.add_argument("--rebuild", action="store_true", help="从 K 线表全量重建指纹")
+    parser.add_argument(
+        "--table", nargs="+", choices=FINGERPRINTED_TABLES, default=["stock_daily", "stock_weekly"], help="要处理的表"
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_arguments()
+    setup_logging("fingerprint.log")
+    if not args.rebuild:
+        raise SystemExit("请指定 --rebuild")
+    engine = build_engine()
+    for table in args.table:
+        count = rebuild_fingerprints(engine, table)
+        logger.info("%s 指纹重建完成：%s 个 (代码, 月)", fingerprint_table(table), count)
+
+
+if __name__ == "__main__":
+    main()
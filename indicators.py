@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""stock_daily 的技术指标物化表 stock_daily_indicators。
+
+各策略以前都从 stock_daily 的完整历史重新计算 MA/EMA/MACD/RSI/ATR。这里在日线写入之后
+增量维护一张指标表，每只股票在 stock_indicator_state 中保存滚动状态（最近 60 根收盘价、
+EMA/DEA、RSI 与 ATR 的平滑均值、前收），追加一根 K 线对每个指标都是 O(1)：
+
+* ma5/ma10/ma20/ma60：窗口和，进出窗口各一次加减；
+* ema12/ema26、macd_dif = ema12 - ema26、macd_dea = dif 的 9 日 EMA、macd_hist = 2 × (dif - dea)，
+  EMA 以首根收盘价为初值（即 pandas ewm(adjust=False)）；
+* rsi14：涨跌幅的 Wilder 平滑（alpha = 1/14），满 14 个变化后输出；
+* atr14：真实波幅的 Wilder 平滑，满 14 根后输出。
+
+哪些股票需要计算由 stock_write_version 决定：版本晚于状态中记录的 seen_version 的股票增量推进；
+变化出现在状态最后日期之前的年份（如前复权重刷改写了历史）则按向量化方式整段重算。
+除权除息重刷（corporate_action.process_resync_queue）完成后直接对该股票整段重算。
+同一年内早于最后日期的补数（sync_daily --date / --start-date）由调用方传 rewritten_from 触发重算。
+临时收盘（provisional = 1）不参与计算，Baostock 确认后再推进；推进时被其后已确认 K 线越过的临时行
+记入状态的 pending，该股票再有写入时整段重算，确认后的那根 K 线才不会被漏掉。
+
+    python indicators.py                          # 增量；新库首次运行即全量
+    python indicators.py --rebuild --codes 600000 000001
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import math
+from collections import deque
+from datetime import date
+from typing import Any, Iterable, Optional, Sequence
+
+from common import build_engine, lazy_import, setup_logging
+from db_writer import build_upsert_sql, ensure_tag_columns, ensure_write_version_table
+from profiling import add_profile_arguments, profile_run
+
+pd = lazy_import("pandas")
+
+logger = logging.getLogger(__name__)
+
+SOURCE_TABLE = "stock_daily"
+INDICATOR_TABLE = "stock_daily_indicators"
+STATE_TABLE = "stock_indicator_state"
+MA_WINDOWS = (5, 10, 20, 60)
+EMA_FAST, EMA_SLOW, DEA_SPAN = 12, 26, 9
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+CODE_CHUNK_SIZE = 100
+
+COLUMNS = (
+    "code", "date", "ma5", "ma10", "ma20", "ma60", "ema12", "ema26",
+    "macd_dif", "macd_dea", "macd_hist", "rsi14", "atr14",
+)
+
+CREATE_INDICATOR_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{INDICATOR_TABLE}` (
+  `code` VARCHAR(20) NOT NULL COMMENT '6位股票代码',
+  `date` DATE NOT NULL,
+  `ma5` DOUBLE, `ma10` DOUBLE, `ma20` DOUBLE, `ma60` DOUBLE,
+  `ema12` DOUBLE, `ema26` DOUBLE,
+  `macd_dif` DOUBLE, `macd_dea` DOUBLE, `macd_hist` DOUBLE,
+  `rsi14` DOUBLE, `atr14` DOUBLE,
+  PRIMARY KEY (`code`, `date`),
+  KEY `idx_date_code` (`date`, `code`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+CREATE_STATE_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{STATE_TABLE}` (
+  `code` VARCHAR(20) NOT NULL PRIMARY KEY COMMENT '6位股票代码',
+  `last_date` DATE NOT NULL COMMENT '已计算到的最后一根 K 线',
+  `seen_version` TIMESTAMP(6) NULL DEFAULT NULL COMMENT '计算时该股票在 stock_write_version 中的最大版本',
+  `state` TEXT NOT NULL COMMENT '滚动状态 JSON',
+  `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+SAVE_STATE_SQL = f"""
+INSERT INTO `{STATE_TABLE}` (`code`, `last_date`, `seen_version`, `state`)
+VALUES (:code, :last_date, :seen_version, :state)
+ON DUPLICATE KEY UPDATE `last_date` = VALUES(`last_date`), `seen_version` = VALUES(`seen_version`),
+                        `state` = VALUES(`state`)
+"""
+
+_indicator_ready: set = set()
+
+
+def _value(number: Any) -> Optional[float]:
+    """NaN/None -> None，numpy 标量 -> float，便于写库与 JSON 序列化。"""
+    if number is None:
+        return None
+    number = float(number)
+    return None if math.isnan(number) else number
+
+
+class IndicatorState:
+    """一只股票的滚动状态；append 一根 K 线即得到当天全部指标。"""
+
+    def __init__(self, data: Optional[dict] = None) -> None:
+        data = data or {}
+        self.closes: deque[float] = deque(data.get("closes", []), maxlen=max(MA_WINDOWS))
+        # 窗口和在加载时按保存的收盘价重算，不跨运行累积浮点误差
+        self.sums = {n: sum(list(self.closes)[-n:]) for n in MA_WINDOWS}
+        self.bars = data.get("bars", 0)
+        self.ema_fast = data.get("ema_fast")
+        self.ema_slow = data.get("ema_slow")
+        self.dea = data.get("dea")
+        self.avg_gain = data.get("avg_gain")
+        self.avg_loss = data.get("avg_loss")
+        self.atr = data.get("atr")
+        self.prev_close = data.get("prev_close")
+        # 早于 last_date、计算时仍是临时收盘而被跳过的日期（ISO 字符串），确认后需回退重算
+        self.pending: list[str] = data.get("pending", [])
+
+    def append(self, high: float, low: float, close: float) -> tuple:
+        """返回 COLUMNS 中 code/date 之后的各列。"""
+        for n in MA_WINDOWS:
+            self.sums[n] += close
+            if len(self.closes) >= n:
+                self.sums[n] -= self.closes[-n]
+        self.closes.append(close)
+        self.bars += 1
+        mas = [self.sums[n] / n if self.bars >= n else None for n in MA_WINDOWS]
+
+        self.ema_fast = close if self.ema_fast is None else self.ema_fast + (close - self.ema_fast) * 2 / (EMA_FAST + 1)
+        self.ema_slow = close if self.ema_slow is None else self.ema_slow + (close - self.ema_slow) * 2 / (EMA_SLOW + 1)
+        dif = self.ema_fast - self.ema_slow
+        self.dea = dif if self.dea is None else self.dea + (dif - self.dea) * 2 / (DEA_SPAN + 1)
+
+        prev = self.prev_close
+        if prev is None:
+            true_range = high - low
+        else:
+            gain, loss = max(close - prev, 0.0), max(prev - close, 0.0)
+            self.avg_gain = gain if self.avg_gain is None else self.avg_gain + (gain - self.avg_gain) / RSI_PERIOD
+            self.avg_loss = loss if self.avg_loss is None else self.avg_loss + (loss - self.avg_loss) / RSI_PERIOD
+            true_range = max(high - low, abs(high - prev), abs(low - prev))
+        self.atr = true_range if self.atr is None else self.atr + (true_range - self.atr) / ATR_PERIOD
+        self.prev_close = close
+
+        rsi = None
+        if self.bars > RSI_PERIOD and self.avg_gain + self.avg_loss > 0:
+            rsi = 100 * self.avg_gain / (self.avg_gain + self.avg_loss)
+        atr = self.atr if self.bars >= ATR_PERIOD else None
+        return (*mas, self.ema_fast, self.ema_slow, dif, self.dea, 2 * (dif - self.dea), rsi, atr)
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "closes": list(self.closes),
+                "bars": self.bars,
+                "ema_fast": self.ema_fast,
+                "ema_slow": self.ema_slow,
+                "dea": self.dea,
+                "avg_gain": self.avg_gain,
+                "avg_loss": self.avg_loss,
+                "atr": self.atr,
+                "prev_close": self.prev_close,
+                "pending": self.pending,
+            }
+        )
+
+
+def compute_frame(df: Any) -> tuple[Any, IndicatorState]:
+    """向量化计算一只股票全部历史（按日期升序）的指标，口径与 IndicatorState 逐根递推一致。
+
+    返回 (指标 DataFrame, 末尾的滚动状态)。
+    """
+    close = df["close"].astype(float).reset_index(drop=True)
+    high = df["high"].astype(float).reset_index(drop=True).fillna(close)
+    low = df["low"].astype(float).reset_index(drop=True).fillna(close)
+    position = pd.Series(range(len(close)))
+
+    out = pd.DataFrame({f"ma{n}": close.rolling(n).mean() for n in MA_WINDOWS})
+    ema_fast = close.ewm(span=EMA_FAST, adjust=False).mean()
+    ema_slow = close.ewm(span=EMA_SLOW, adjust=False).mean()
+    dif = ema_fast - ema_slow
+    dea = dif.ewm(span=DEA_SPAN, adjust=False).mean()
+    out["ema12"], out["ema26"] = ema_fast, ema_slow
+    out["macd_dif"], out["macd_dea"], out["macd_hist"] = dif, dea, 2 * (dif - dea)
+
+    delta = close.diff()
+    avg_gain = delta.clip(lower=0).ewm(alpha=1 / RSI_PERIOD, adjust=False).mean()
+    avg_loss = (-delta).clip(lower=0).ewm(alpha=1 / RSI_PERIOD, adjust=False).mean()
+    out["rsi14"] = (100 * avg_gain / (avg_gain + avg_loss)).where(position >= RSI_PERIOD)
+
+    prev = close.shift()
+    true_range = pd.concat([high - low, (high - prev).abs(), (low - prev).abs()], axis=1).max(axis=1)
+    atr = true_range.ewm(alpha=1 / ATR_PERIOD, adjust=False).mean()
+    out["atr14"] = atr.where(position >= ATR_PERIOD - 1)
+
+    state = IndicatorState(
+        {
+            "closes": close.tail(max(MA_WINDOWS)).tolist(),
+            "bars": len(close),
+            "ema_fast": _value(ema_fast.iloc[-1]),
+            "ema_slow": _value(ema_slow.iloc[-1]),
+            "dea": _value(dea.iloc[-1]),
+            "avg_gain": _value(avg_gain.iloc[-1]),
+            "avg_loss": _value(avg_loss.iloc[-1]),
+            "atr": _value(atr.iloc[-1]),
+            "prev_close": _value(close.iloc[-1]),
+        }
+    )
+    return out, state
+
+
+def ensure_indicator_tables(engine: Any) -> None:
+    """每个进程每个库只建一次；同时确保读取时依赖的写入版本表与 provisional 列存在。"""
+    from sqlalchemy import text
+
+    key = str(engine.url)
+    if key in _indicator_ready:
+        return
+    ensure_write_version_table(engine)
+    ensure_tag_columns(engine, SOURCE_TABLE)
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_INDICATOR_SQL))
+        conn.execute(text(CREATE_STATE_SQL))
+    _indicator_ready.add(key)
+
+
+def chunked(items: Sequence[str], size: int) -> Iterable[Sequence[str]]:
+    for start in range(0, len(items), size):
+        yield items[start: start + size]
+
+
+def load_versions(engine: Any) -> dict[str, dict[int, Any]]:
+    """stock_daily 每只股票各年份的写入版本。"""
+    from sqlalchemy import text
+
+    versions: dict[str, dict[int, Any]] = {}
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("SELECT `code`, `year`, `version` FROM `stock_write_version` WHERE `table_name` = :t"),
+            {"t": SOURCE_TABLE},
+        )
+        for code, year, version in rows:
+            versions.setdefault(code, {})[int(year)] = version
+    return versions
+
+
+def load_states(engine: Any) -> dict[str, tuple[date, Any, str]]:
+    """{代码: (last_date, seen_version, 状态 JSON)}"""
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"SELECT `code`, `last_date`, `seen_version`, `state` FROM `{STATE_TABLE}`"))
+        return {code: (last_date, seen, state) for code, last_date, seen, state in rows}
+
+
+def plan_updates(
+    codes: Sequence[str],
+    versions: dict[str, dict[int, Any]],
+    states: dict[str, tuple[date, Any, str]],
+    rebuild: bool = False,
+    rewritten_from: Optional[str] = None,
+) -> tuple[list[str], list[str]]:
+    """返回 (增量推进的股票, 整段重算的股票)；没有新写入的股票两边都不出现。"""
+    rewritten = date.fromisoformat(rewritten_from) if rewritten_from else None
+    incremental, full = [], []
+    for code in codes:
+        state = states.get(code)
+        if rebuild or state is None:
+            full.append(code)
+            continue
+        last_date, seen, saved = state
+        if rewritten is not None and last_date >= rewritten:
+            full.append(code)
+            continue
+        changed = [year for year, version in versions.get(code, {}).items() if seen is None or version > seen]
+        if any(year < last_date.year for year in changed):
+            full.append(code)  # 更早的年份被改写（前复权重刷、校验重写）
+        elif changed and json.loads(saved).get("pending"):
+            full.append(code)  # 越过的临时行可能已被确认，回退到它之前重算
+        elif changed:
+            incremental.append(code)
+    return incremental, full
+
+
+def write_chunk(conn: Any, rows: list[tuple], states: list[dict]) -> None:
+    if rows:
+        conn.exec_driver_sql(build_upsert_sql(INDICATOR_TABLE, COLUMNS, ("code", "date")), rows)
+    if states:
+        from sqlalchemy import text
+
+        conn.execute(text(SAVE_STATE_SQL), states)
+
+
+def advance_indicators(
+    engine: Any,
+    codes: Sequence[str],
+    states: dict[str, tuple[date, Any, str]],
+    versions: dict[str, dict[int, Any]],
+) -> int:
+    """只读取各股票 last_date 之后的 K 线，用已确认的逐根推进滚动状态；返回新增指标行数。
+
+    临时行不参与计算；其后出现已确认 K 线时它被越过，日期记入状态的 pending。
+    """
+    from sqlalchemy import bindparam, text
+
+    query = text(
+        f"SELECT `code`, `date`, `high`, `low`, `close`, `provisional` FROM `{SOURCE_TABLE}` "
+        "WHERE `code` IN :codes AND `date` > :since AND `close` IS NOT NULL "
+        "ORDER BY `code`, `date`"
+    ).bindparams(bindparam("codes", expanding=True))
+    appended = 0
+    for chunk in chunked(list(codes), CODE_CHUNK_SIZE):
+        rolling = {code: IndicatorState(json.loads(states[code][2])) for code in chunk}
+        last_dates = {code: states[code][0] for code in chunk}
+        since = min(last_dates.values())
+        with engine.connect() as conn:
+            bars = conn.execute(query, {"codes": list(chunk), "since": since}).fetchall()
+        rows = []
+        held: dict[str, list[str]] = {}
+        for code, day, high, low, close, provisional in bars:
+            if day <= last_dates[code]:
+                continue
+            if provisional:
+                held.setdefault(code, []).append(day.isoformat())
+                continue
+            rolling[code].pending.extend(held.pop(code, []))
+            close = float(close)
+            high = float(high) if high is not None else close
+            low = float(low) if low is not None else close
+            rows.append((code, day, *rolling[code].append(high, low, close)))
+            last_dates[code] = day
+        saved = [
+            {
+                "code": code,
+                "last_date": last_dates[code],
+                "seen_version": max(versions.get(code, {}).values(), default=None),
+                "state": rolling[code].to_json(),
+            }
+            for code in chunk
+        ]
+        with engine.begin() as conn:
+            write_chunk(conn, rows, saved)
+        appended += len(rows)
+    return appended
+
+
+def recompute_indicators(engine: Any, codes: Sequence[str], versions: Optional[dict] = None) -> int:
+    """向量化整段重算：删除旧指标行，按全部已确认 K 线重写，并用末尾的值重建滚动状态；返回写入行数。
+
+    已确认 K 线之间仍是临时收盘的日期记入状态的 pending，确认后由 plan_updates 再次整段重算。
+    """
+    from sqlalchemy import bindparam, text
+
+    ensure_indicator_tables(engine)
+    if versions is None:
+        versions = load_versions(engine)  # 先读版本再读数据，期间的新写入下次会被发现
+    query = text(
+        f"SELECT `code`, `date`, `high`, `low`, `close`, `provisional` FROM `{SOURCE_TABLE}` "
+        "WHERE `code` IN :codes AND `close` IS NOT NULL ORDER BY `code`, `date`"
+    ).bindparams(bindparam("codes", expanding=True))
+    purge = (
+        text(f"DELETE FROM `{INDICATOR_TABLE}` WHERE `code` IN :codes").bindparams(bindparam("codes", expanding=True)),
+        text(f"DELETE FROM `{STATE_TABLE}` WHERE `code` IN :codes").bindparams(bindparam("codes", expanding=True)),
+    )
+    written = 0
+    for chunk in chunked(list(codes), CODE_CHUNK_SIZE):
+        with engine.connect() as conn:
+            df = pd.read_sql(query, conn, params={"codes": list(chunk)})
+        rows, saved = [], []
+        for code, part in df.groupby("code", sort=False):
+            confirmed = part[part["provisional"] == 0]
+            if confirmed.empty:
+                continue
+            values, state = compute_frame(confirmed)
+            values = values.astype(object).where(values.notna(), None)
+            dates = confirmed["date"].tolist()
+            skipped = part.loc[(part["provisional"] != 0) & (part["date"] < dates[-1]), "date"]
+            state.pending = [day.isoformat() for day in skipped]
+            rows.extend((code, day, *row) for day, row in zip(dates, values.itertuples(index=False, name=None)))
+            saved.append(
+                {
+                    "code": code,
+                    "last_date": dates[-1],
+                    "seen_version": max(versions.get(code, {}).values(), default=None),
+                    "state": state.to_json(),
+                }
+            )
+        with engine.begin() as conn:
+            for statement in purge:
+                conn.execute(statement, {"codes": list(chunk)})
+            write_chunk(conn, rows, saved)
+        written += len(rows)
+    return written
+
+
+def update_indicators(
+    engine: Any,
+    codes: Optional[Sequence[str]] = None,
+    rebuild: bool = False,
+    rewritten_from: Optional[str] = None,
+) -> tuple[int, int]:
+    """日线写入之后调用：有新 K 线的股票增量推进，历史被改写的股票整段重算。
+
+    codes 为空时处理 stock_write_version 与状态表中出现过的全部股票；rewritten_from 表示
+    该日期及之后的 K 线可能是补写的，状态已越过该日期的股票整段重算。返回 (增量数, 重算数)。
+    """
+    ensure_indicator_tables(engine)
+    versions = load_versions(engine)
+    states = load_states(engine)
+    targets = list(codes) if codes is not None else sorted(set(versions) | set(states))
+    incremental, full = plan_updates(targets, versions, states, rebuild, rewritten_from)
+    appended = advance_indicators(engine, incremental, states, versions) if incremental else 0
+    recomputed = recompute_indicators(engine, full, versions) if full else 0
+    logger.info(
+        "📈 技术指标：增量 %s 只（新增 %s 行），整段重算 %s 只（%s 行）",
+        len(incremental), appended, len(full), recomputed,
+    )
+    return len(incremental), len(full)
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="增量维护 stock_daily_indicators 技术指标表")
+    parser.add_argument("--codes", nargs="+", help="只处理指定股票，默认全部")
+    parser.add_argument("--rebuild", action="store_true", help="忽略滚动状态，按全部历史整段重算")
+    add_profile_arguments(parser)
+    return parser.parse_args()
+
+
+def run(args: argparse.Namespace) -> None:
+    engine = getattr(args, "engine", None) or build_engine()
+    codes = [code.zfill(6) for code in args.codes] if args.codes else None
+    update_indicators(engine, codes, rebuild=args.rebuild)
+
+
+def main() -> None:
+    args = parse_arguments()
+    setup_logging("indicators.log")
+    with profile_run("indicators", args):
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""分时数据完整性检查：按 240 分钟交易网格核对每个 (code, trade_date)，只补抓不完整的股票日。
+
+sync_intraday 只与库里最新的 trade_datetime 比较，某次运行中途退出或腾讯返回被截断时，
+一天之内缺失的分钟永远不会被补上。这里用一条分组查询统计每个股票日落在
+09:31–11:30、13:01–15:00 网格内的分钟数，不足 240 的才重新抓取，
+并按最早一个不完整日距今的交易日数请求最小的 bars，而不是一律拉 32000 条。
+分组查询只看得到有数据的股票日，整天没有分钟线的交易日再按交易日历（trade_calendar，
+没有时取表中任一股票有数据的日期）逐只比对补上，记为 0 分钟。
+
+    python intraday_checker.py --start 2024-06-01
+    python intraday_checker.py --start 2024-06-01 --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Any
+
+from common import lazy_import, setup_logging
+from profiling import add_profile_arguments, limit_codes, profile_run
+from sync_intraday import (
+    CODE_CSV_PATH,
+    COMPACT_TABLE_NAME,
+    INTRADAY_LAYOUT,
+    LOG_DIR,
+    TABLE_NAME,
+    build_engine,
+    fetch_code_rows,
+    load_codes,
+    to_db_rows,
+    upsert_intraday_rows,
+    validate_date,
+)
+
+np = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 240
+MAX_BARS = 32000  # 腾讯 m1 接口单次最多返回的条数
+SESSION_CLOSE = "15:00"
+
+GRID_SQL = """
+SELECT `code`, `trade_date`, SUM(
+         `trade_time` BETWEEN '09:31:00' AND '11:30:00'
+      OR `trade_time` BETWEEN '13:01:00' AND '15:00:00'
+       ) AS `minutes`
+FROM `{table}`
+WHERE {range_clause}
+  AND `code` IN :codes
+GROUP BY `code`, `trade_date`
+HAVING `minutes` < {minutes}
+ORDER BY `code`, `trade_date`
+"""
+
+# 每只股票有数据的交易日数，少于应有交易日数的再查具体日期
+DAY_COUNT_SQL = """
+SELECT `code`, COUNT(DISTINCT `trade_date`)
+FROM `{table}`
+WHERE {range_clause}
+  AND `code` IN :codes
+GROUP BY `code`
+"""
+
+PRESENT_DAYS_SQL = """
+SELECT DISTINCT `code`, `trade_date`
+FROM `{table}`
+WHERE {range_clause}
+  AND `code` IN :codes
+"""
+
+MARKET_DAYS_SQL = """
+SELECT DISTINCT `trade_date`
+FROM `{table}`
+WHERE {range_clause}
+"""
+
+# 标准/分区布局按 trade_date 过滤才能裁剪分区；紧凑布局 trade_date 是虚拟列，按主键 trade_datetime 走范围扫描
+RANGE_CLAUSES = {
+    "standard": "`trade_date` BETWEEN :start AND :end",
+    "partitioned": "`trade_date` BETWEEN :start AND :end",
+    "compact": "`trade_datetime` >= :start AND `trade_datetime` < :end_next",
+}
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="按 240 分钟网格检查分时数据完整性并补抓")
+    parser.add_argument("--code-csv", default=CODE_CSV_PATH, help="股票代码 CSV 路径，默认 ./code.csv")
+    parser.add_argument("--start", required=True, help="检查起始日期 YYYY-MM-DD")
+    parser.add_argument("--end", help="检查截止日期 YYYY-MM-DD；默认收盘后为今天，否则为昨天")
+    parser.add_argument("--sleep-min", type=float, default=0.6, help="每只股票请求后的最小等待秒数")
+    parser.add_argument("--sleep-max", type=float, default=1.2, help="每只股票请求后的最大等待秒数")
+    parser.add_argument("--dry-run", action="store_true", help="只输出不完整的股票日，不补抓")
+    parser.add_argument(
+        "--layout",
+        choices=("standard", "partitioned", "compact"),
+        default=INTRADAY_LAYOUT,
+        help="分时表布局，默认读 INTRADAY_LAYOUT",
+    )
+    add_profile_arguments(parser)
+    return parser.parse_args()
+
+
+def default_end_date(now: datetime | None = None) -> str:
+    """盘中的当天数据本来就不完整，收盘前默认只检查到昨天。"""
+    now = now or datetime.now()
+    day = now.date() if now.strftime("%H:%M") > SESSION_CLOSE else now.date() - timedelta(days=1)
+    return day.strftime("%Y-%m-%d")
+
+
+def find_incomplete_days(engine: Any, codes: list[str], start: str, end: str, layout: str) -> dict[str, dict[str, int]]:
+    """返回 {code: {trade_date: 网格内分钟数}}，只包含不足 240 分钟的股票日（含整天没有数据的交易日）。"""
+    from sqlalchemy import bindparam, text
+
+    table = COMPACT_TABLE_NAME if layout == "compact" else TABLE_NAME
+    query = text(
+        GRID_SQL.format(table=table, range_clause=RANGE_CLAUSES[layout], minutes=MINUTES_PER_DAY)
+    ).bindparams(bindparam("codes", expanding=True))
+    with engine.connect() as conn:
+        rows = conn.execute(query, {**range_params(start, end), "codes": codes}).fetchall()
+
+    incomplete: dict[str, dict[str, int]] = {}
+    for code, trade_date, minutes in rows:
+        incomplete.setdefault(code, {})[trade_date.strftime("%Y-%m-%d")] = int(minutes or 0)
+
+    for code, days in find_missing_days(engine, codes, start, end, layout).items():
+        incomplete.setdefault(code, {}).update(dict.fromkeys(days, 0))
+    return {code: dict(sorted(days.items())) for code, days in sorted(incomplete.items())}
+
+
+def expected_trading_days(engine: Any, start: str, end: str, layout: str) -> list[str]:
+    """start 到 end 的交易日；没有 trade_calendar 时取分时表中任一股票有数据的日期（不会把节假日算成缺失）。"""
+    from sqlalchemy import text
+
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(
+                text(
+                    "SELECT `calendar_date` FROM `trade_calendar` "
+                    "WHERE `is_trading_day` = 1 AND `calendar_date` BETWEEN :s AND :e ORDER BY `calendar_date`"
+                ),
+                {"s": start, "e": end},
+            ).fetchall()
+        if rows:
+            return [row[0].strftime("%Y-%m-%d") for row in rows]
+    except Exception:  # noqa: BLE001
+        logger.debug("trade_calendar 不可用，按分时表中已有的交易日核对")
+    table = COMPACT_TABLE_NAME if layout == "compact" else TABLE_NAME
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(MARKET_DAYS_SQL.format(table=table, range_clause=RANGE_CLAUSES[layout])),
+            range_params(start, end),
+        ).fetchall()
+    return sorted(row[0].strftime("%Y-%m-%d") for row in rows)
+
+
+def find_missing_days(engine: Any, codes: list[str], start: str, end: str, layout: str) -> dict[str, list[str]]:
+    """返回 {code: [一分钟数据都没有的交易日]}；先按股票计数，只对天数不够的股票查具体日期。"""
+    from sqlalchemy import bindparam, text
+
+    expected = expected_trading_days(engine, start, end, layout)
+    if not expected:
+        return {}
+    table = COMPACT_TABLE_NAME if layout == "compact" else TABLE_NAME
+    params = range_params(start, end)
+    count_query = text(
+        DAY_COUNT_SQL.format(table=table, range_clause=RANGE_CLAUSES[layout])
+    ).bindparams(bindparam("codes", expanding=True))
+    with engine.connect() as conn:
+        counts = dict(conn.execute(count_query, {**params, "codes": codes}).fetchall())
+    short = [code for code in codes if int(counts.get(code) or 0) < len(expected)]
+    if not short:
+        return {}
+
+    present: dict[str, set[str]] = {}
+    present_query = text(
+        PRESENT_DAYS_SQL.format(table=table, range_clause=RANGE_CLAUSES[layout])
+    ).bindparams(bindparam("codes", expanding=True))
+    with engine.connect() as conn:
+        for code, trade_date in conn.execute(present_query, {**params, "codes": short}):
+            present.setdefault(code, set()).add(trade_date.strftime("%Y-%m-%d"))
+    missing = {code: [day for day in expected if day not in present.get(code, ())] for code in short}
+    return {code: days for code, days in missing.items() if days}
+
+
+def range_params(start: str, end: str) -> dict[str, str]:
+    end_next = (datetime.strptime(end, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    return {"start": start, "end": end, "end_next": end_next}
+
+
+def trading_days_since(engine: Any, first_day: str, today: date) -> int:
+    """first_day 到今天（含）的交易日数；有 trade_calendar 时按日历算，否则按工作日估（只会偏多，bars 仍然够用）。"""
+    from sqlalchemy import text
+
+    try:
+        with engine.connect() as conn:
+            count = conn.execute(
+                text(
+                    "SELECT COUNT(*) FROM `trade_calendar` "
+                    "WHERE `is_trading_day` = 1 AND `calendar_date` BETWEEN :s AND :e"
+                ),
+                {"s": first_day, "e": today.strftime("%Y-%m-%d")},
+            ).scalar()
+        if count:
+            return int(count)
+    except Exception:  # noqa: BLE001
+        logger.debug("trade_calendar 不可用，按工作日估算")
+    return int(np.busday_count(first_day, today + timedelta(days=1)))
+
+
+def bars_to_cover(engine: Any, first_day: str, today: date) -> int:
+    """腾讯接口返回截至当前的最近 N 条，覆盖 first_day 需要的最小 N。"""
+    return trading_days_since(engine, first_day, today) * MINUTES_PER_DAY
+
+
+def write_unrepaired(unrepaired: list[str]) -> None:
+    if not unrepaired:
+        return
+    path = LOG_DIR / "incomplete_intraday_days.txt"
+    path.write_text("\n".join(unrepaired), encoding="utf-8")
+    logger.warning("补抓后仍不完整的股票日 %s 个（停牌、上市首日等），已写入 %s", len(unrepaired), path)
+
+
+def run(args: argparse.Namespace) -> None:
+    validate_date(args.start)
+    end = args.end or default_end_date()
+    validate_date(end)
+    if args.sleep_min < 0 or args.sleep_max < args.sleep_min:
+        raise SystemExit("--sleep-max 必须大于等于 --sleep-min，且等待时间不能为负数")
+
+    codes = limit_codes(load_codes(args.code_csv), args)
+    if not codes:
+        logger.warning("未加载到任何股票代码，请检查 %s", args.code_csv)
+        return
+
+    engine = build_engine()
+    incomplete = find_incomplete_days(engine, codes, args.start, end, args.layout)
+    total_days = sum(len(days) for days in incomplete.values())
+    logger.info(
+        "检查 %s 只股票 %s 至 %s，不完整股票日 %s 个，涉及 %s 只股票",
+        len(codes),
+        args.start,
+        end,
+        total_days,
+        len(incomplete),
+    )
+    if args.dry_run or not incomplete:
+        for code, days in incomplete.items():
+            logger.info("  %s %s", code, ", ".join(f"{day}({minutes})" for day, minutes in days.items()))
+        return
+
+    today = datetime.now().date()
+    repaired_rows = 0
+    unrepaired: list[str] = []
+    for index, (code, days) in enumerate(incomplete.items(), start=1):
+        first_day = min(days)
+        bars = bars_to_cover(engine, first_day, today)
+        if bars > MAX_BARS:
+            logger.warning("%s 最早不完整日 %s 超出接口可回溯范围（需 %s 条），跳过", code, first_day, bars)
+            unrepaired.extend(f"{code},{day},{minutes}" for day, minutes in days.items())
+            continue
+        try:
+            rows = [row for row in fetch_code_rows(code, bars, None) if row["date"] in days]
+            if rows:
+                upsert_intraday_rows(engine, to_db_rows(rows), args.layout)
+                repaired_rows += len(rows)
+            fetched = {day: sum(1 for row in rows if row["date"] == day) for day in days}
+            unrepaired.extend(
+                f"{code},{day},{count}" for day, count in fetched.items() if count < MINUTES_PER_DAY
+            )
+            logger.info("%s/%s %s bars=%s 补写 %s 条，覆盖 %s 个股票日", index, len(incomplete), code, bars, len(rows), len(days))
+        except Exception as exc:  # noqa: BLE001
+            unrepaired.extend(f"{code},{day},{minutes}" for day, minutes in days.items())
+            logger.exception("%s/%s %s 补抓失败: %s", index, len(incomplete), code, exc)
+        finally:
+            time.sleep(random.uniform(args.sleep_min, args.sleep_max))
+
+    write_unrepaired(unrepaired)
+    logger.info("分时补抓结束，补写 %s 条", repaired_rows)
+
+
+def main() -> None:
+    args = parse_arguments()
+    setup_logging("intraday_checker.log")
+    with profile_run("intraday_checker", args):
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""stock_intraday_1m 冷数据归档：把超出保留期的月份导出为压缩文件后从热表删除。
+
+分区表（sync_intraday --layout partitioned）按月 DROP PARTITION，秒级完成；
+未分区的旧表按月分批 DELETE。归档文件写完并核对行数后才会删除数据。
+
+    python intraday_retention.py archive --keep-months 6
+    python intraday_retention.py archive --keep-months 6 --format csv.zst --dry-run
+    python intraday_retention.py convert                # 旧单表转换为分区表（会锁表，需停掉分时同步）
+    python intraday_retention.py convert --to compact   # 旧单表数据迁入 compact 布局，原表改名保留
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import logging
+import os
+from datetime import date
+from pathlib import Path
+from typing import Any, Iterator
+
+from common import setup_logging
+from parquet_mirror import normalize_frame
+from sync_intraday import (
+    COMPACT_TABLE_NAME,
+    PARTITION_MONTHS_AHEAD,
+    PRICE_SCALE,
+    SYMBOL_TABLE_NAME,
+    TABLE_NAME,
+    TURNOVER_SCALE,
+    add_months,
+    build_engine,
+    build_partition_clauses,
+    ensure_compact_view,
+    ensure_table,
+    get_partition_bounds,
+    is_base_table,
+)
+
+ARCHIVE_ROOT = os.getenv("INTRADAY_ARCHIVE_DIR", "./data/archive")
+CHUNK_ROWS = 200_000
+DELETE_BATCH_ROWS = 20_000
+LEGACY_TABLE_NAME = f"{TABLE_NAME}_legacy"
+
+logger = logging.getLogger(__name__)
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="分时表冷数据归档与存储布局转换")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    archive = sub.add_parser("archive", help="归档并删除超出保留期的月份")
+    archive.add_argument("--keep-months", type=int, default=6, help="热表保留最近 N 个自然月（含当月），默认 6")
+    archive.add_argument("--archive-dir", default=ARCHIVE_ROOT, help="归档目录，默认 ./data/archive")
+    archive.add_argument("--format", choices=("parquet", "csv.zst"), default="parquet", help="归档格式")
+    archive.add_argument("--dry-run", action="store_true", help="只列出将要归档的月份")
+
+    convert = sub.add_parser("convert", help="转换旧单表的存储布局")
+    convert.add_argument(
+        "--to",
+        choices=("partitioned", "compact"),
+        default="partitioned",
+        help="partitioned 原地改为月度分区；compact 迁移到紧凑表并以视图替代原表",
+    )
+    return parser.parse_args()
+
+
+def parse_bound(description: str) -> date | None:
+    """PARTITION_DESCRIPTION 形如 '2024-07-01'，MAXVALUE 返回 None。"""
+    text_value = description.strip("'")
+    if text_value.upper() == "MAXVALUE":
+        return None
+    return date.fromisoformat(text_value)
+
+
+def iter_month_frames(engine: Any, lower: date | None, upper: date, partition: str | None) -> Iterator[Any]:
+    """按 (code, trade_datetime) 键集分页读取某个月，内存占用与表大小无关。"""
+    import pandas as pd
+    from sqlalchemy import text
+
+    source = f"`{TABLE_NAME}` PARTITION (`{partition}`)" if partition else f"`{TABLE_NAME}`"
+    conditions = ["`trade_date` < :upper"]
+    if lower is not None:
+        conditions.append("`trade_date` >= :lower")
+    base = " AND ".join(conditions)
+    cursor: tuple[str, Any] | None = None
+
+    while True:
+        where = base
+        params: dict[str, Any] = {"upper": upper, "lower": lower, "limit": CHUNK_ROWS}
+        if cursor is not None:
+            where += " AND (`code`, `trade_datetime`) > (:last_code, :last_dt)"
+            params.update(last_code=cursor[0], last_dt=cursor[1])
+        with engine.connect() as conn:
+            df = pd.read_sql(
+                text(f"SELECT * FROM {source} WHERE {where} ORDER BY `code`, `trade_datetime` LIMIT :limit"),
+                conn,
+                params=params,
+            )
+        if df.empty:
+            return
+        cursor = (df["code"].iloc[-1], df["trade_datetime"].iloc[-1])
+        yield normalize_frame(df.drop(columns=["id"], errors="ignore"))
+        if len(df) < CHUNK_ROWS:
+            return
+
+
+def write_archive(frames: Iterator[Any], path: Path, fmt: str) -> int:
+    """流式写入归档文件，返回写入行数；先写临时文件，完成后再改名。"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    written = 0
+
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for df in frames:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema, compression="zstd")
+                writer.write_table(table)
+                written += len(df)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        import zstandard
+
+        with tmp_path.open("wb") as raw, zstandard.ZstdCompressor(level=10).stream_writer(raw) as compressed:
+            handle = io.TextIOWrapper(compressed, encoding="utf-8", newline="")
+            csv_writer = None
+            for df in frames:
+                if csv_writer is None:
+                    csv_writer = csv.writer(handle)
+                    csv_writer.writerow(df.columns)
+                csv_writer.writerows(df.astype(object).where(df.notna(), "").itertuples(index=False, name=None))
+                written += len(df)
+            handle.flush()
+            handle.detach()
+
+    if written:
+        os.replace(tmp_path, path)
+    elif tmp_path.exists():
+        tmp_path.unlink()
+    return written
+
+
+def count_rows(engine: Any, lower: date | None, upper: date, partition: str | None) -> int:
+    from sqlalchemy import text
+
+    source = f"`{TABLE_NAME}` PARTITION (`{partition}`)" if partition else f"`{TABLE_NAME}`"
+    where = "`trade_date` < :upper" + (" AND `trade_date` >= :lower" if lower is not None else "")
+    with engine.connect() as conn:
+        return int(conn.execute(text(f"SELECT COUNT(*) FROM {source} WHERE {where}"), {"upper": upper, "lower": lower}).scalar())
+
+
+def drop_month(engine: Any, lower: date | None, upper: date, partition: str | None) -> None:
+    from sqlalchemy import text
+
+    if partition:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE `{TABLE_NAME}` DROP PARTITION `{partition}`"))
+        return
+
+    where = "`trade_date` < :upper" + (" AND `trade_date` >= :lower" if lower is not None else "")
+    while True:
+        # 分批删除，避免单个大事务撑爆 undo log
+        with engine.begin() as conn:
+            deleted = conn.execute(
+                text(f"DELETE FROM `{TABLE_NAME}` WHERE {where} LIMIT {DELETE_BATCH_ROWS}"),
+                {"upper": upper, "lower": lower},
+            ).rowcount
+        if deleted < DELETE_BATCH_ROWS:
+            return
+
+
+def plan_months(engine: Any, cutoff: date) -> list[tuple[date | None, date, str | None]]:
+    """返回需要归档的 (下界, 上界, 分区名) 列表，上界不超过 cutoff。"""
+    from sqlalchemy import text
+
+    bounds = get_partition_bounds(engine)
+    if bounds is not None:
+        plan = []
+        lower = None
+        for name, description in bounds.items():
+            upper = parse_bound(description)
+            if upper is None or upper > cutoff:
+                break
+            plan.append((lower, upper, name))
+            lower = upper
+        return plan
+
+    with engine.connect() as conn:
+        earliest = conn.execute(text(f"SELECT MIN(`trade_date`) FROM `{TABLE_NAME}`")).scalar()
+    if earliest is None:
+        return []
+    plan = []
+    month = earliest.replace(day=1)
+    while month < cutoff:
+        plan.append((month, add_months(month, 1), None))
+        month = add_months(month, 1)
+    return plan
+
+
+def archive(engine: Any, args: argparse.Namespace) -> None:
+    if args.keep_months < 1:
+        raise SystemExit("--keep-months 至少为 1")
+    if not is_base_table(engine, TABLE_NAME):
+        raise SystemExit(f"{TABLE_NAME} 是 compact 布局的兼容视图，归档只支持 standard/partitioned 布局")
+    cutoff = add_months(date.today().replace(day=1), -(args.keep_months - 1))
+    plan = plan_months(engine, cutoff)
+    logger.info("保留 %s 之后的数据，待归档 %s 个区间", cutoff, len(plan))
+
+    suffix = "parquet" if args.format == "parquet" else "csv.zst"
+    for lower, upper, partition in plan:
+        label = partition or f"{lower:%Y%m}"
+        expected = count_rows(engine, lower, upper, partition)
+        if args.dry_run:
+            logger.info("[dry-run] %s [%s, %s) %s 行", label, lower or "-∞", upper, expected)
+            continue
+
+        if expected:
+            path = Path(args.archive_dir) / TABLE_NAME / f"{TABLE_NAME}_{label}.{suffix}"
+            written = write_archive(iter_month_frames(engine, lower, upper, partition), path, args.format)
+            remaining = count_rows(engine, lower, upper, partition)
+            if written != remaining:
+                logger.error("%s 归档行数 %s 与表内 %s 不一致，跳过删除", label, written, remaining)
+                continue
+            logger.info("%s 已归档 %s 行至 %s", label, written, path)
+        drop_month(engine, lower, upper, partition)
+        logger.info("%s 已从热表删除", label)
+
+
+def convert_to_compact(engine: Any) -> None:
+    """按股票逐只把旧表数据复制进 compact 表，核对行数后把旧表改名，原表名改由兼容视图提供。"""
+    from sqlalchemy import text
+
+    if not is_base_table(engine, TABLE_NAME):
+        logger.info("%s 已是兼容视图，无需迁移", TABLE_NAME)
+        return
+    ensure_table(engine, "compact")
+    with engine.connect() as conn:
+        codes = [row[0] for row in conn.execute(text(f"SELECT DISTINCT `code` FROM `{TABLE_NAME}`")).fetchall()]
+
+    copy_sql = text(
+        f"""
+        INSERT INTO `{COMPACT_TABLE_NAME}`
+            (`code`, `trade_datetime`, `open`, `close`, `high`, `low`, `volume_hand`, `turnover_ppm`)
+        SELECT `code`, `trade_datetime`,
+               ROUND(`open` * {PRICE_SCALE}), ROUND(`close` * {PRICE_SCALE}),
+               ROUND(`high` * {PRICE_SCALE}), ROUND(`low` * {PRICE_SCALE}),
+               ROUND(`volume_hand`), ROUND(`turnover_rate_pct` * {TURNOVER_SCALE})
+        FROM `{TABLE_NAME}` WHERE `code` = :code
+        ON DUPLICATE KEY UPDATE
+            `open` = VALUES(`open`), `close` = VALUES(`close`), `high` = VALUES(`high`), `low` = VALUES(`low`),
+            `volume_hand` = VALUES(`volume_hand`), `turnover_ppm` = VALUES(`turnover_ppm`)
+        """
+    )
+    symbol_sql = text(
+        f"""
+        INSERT INTO `{SYMBOL_TABLE_NAME}` (`code`, `name`, `source`)
+        SELECT `code`, `name`, `source` FROM `{TABLE_NAME}`
+        WHERE `code` = :code ORDER BY `trade_datetime` DESC LIMIT 1
+        ON DUPLICATE KEY UPDATE `name` = VALUES(`name`), `source` = VALUES(`source`)
+        """
+    )
+    for index, code in enumerate(codes, start=1):
+        with engine.begin() as conn:
+            conn.execute(copy_sql, {"code": code})
+            conn.execute(symbol_sql, {"code": code})
+        if index % 100 == 0 or index == len(codes):
+            logger.info("compact 迁移进度 %s/%s", index, len(codes))
+
+    with engine.connect() as conn:
+        legacy_rows = conn.execute(text(f"SELECT COUNT(*) FROM `{TABLE_NAME}`")).scalar()
+        compact_rows = conn.execute(text(f"SELECT COUNT(*) FROM `{COMPACT_TABLE_NAME}`")).scalar()
+    if compact_rows < legacy_rows:
+        raise SystemExit(f"compact 表 {compact_rows} 行少于旧表 {legacy_rows} 行，保留旧表，请检查后重试")
+
+    with engine.begin() as conn:
+        conn.execute(text(f"RENAME TABLE `{TABLE_NAME}` TO `{LEGACY_TABLE_NAME}`"))
+    view = ensure_compact_view(engine)
+    logger.info("迁移完成：%s 行，旧表已改名为 %s，兼容视图 %s", compact_rows, LEGACY_TABLE_NAME, view)
+
+
+def convert(engine: Any) -> None:
+    """离线把旧单表转换为分区表：调整主键/唯一键使其包含分区键，再按月建分区。"""
+    from sqlalchemy import text
+
+    if get_partition_bounds(engine) is not None:
+        logger.info("%s 已是分区表，无需转换", TABLE_NAME)
+        return
+    with engine.connect() as conn:
+        earliest = conn.execute(text(f"SELECT MIN(`trade_date`) FROM `{TABLE_NAME}`")).scalar()
+    this_month = date.today().replace(day=1)
+    first_month = earliest.replace(day=1) if earliest else this_month
+    partitions = build_partition_clauses(first_month, add_months(this_month, PARTITION_MONTHS_AHEAD))
+
+    logger.info("开始转换 %s，首个月度分区 %s，期间表被锁定", TABLE_NAME, first_month)
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                f"ALTER TABLE `{TABLE_NAME}` "
+                "DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `trade_date`), "
+                "DROP INDEX `uk_code_trade_datetime`, "
+                "ADD UNIQUE KEY `uk_code_trade_datetime` (`code`, `trade_datetime`, `trade_date`), "
+                "DROP INDEX `idx_trade_date`"
+            )
+        )
+        conn.execute(text(f"ALTER TABLE `{TABLE_NAME}` PARTITION BY RANGE COLUMNS(`trade_date`) (\n{partitions}\n)"))
+    logger.info("%s 转换完成", TABLE_NAME)
+
+
+def main() -> None:
+    args = parse_arguments()
+    setup_logging("intraday_retention.log")
+    engine = build_engine()
+    if args.command == "convert" and args.to == "compact":
+        convert_to_compact(engine)
+    elif args.command == "convert":
+        convert(engine)
+    else:
+        archive(engine, args)
+
+
+if __name__ == "__main__":
+    main()
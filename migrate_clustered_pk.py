@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""把 stock_daily / stock_weekly 迁移为 (code, date) 聚簇主键。
+
+旧结构是自增 id 主键加 UNIQUE(code, date)：按代码读区间要先走二级索引再回表，每次写入要维护两棵 B+ 树。
+新结构以 (code, date) 为主键，另建 (date, code) 二级索引服务按日横截面查询。
+
+迁移流程（除最后一步外源表全程可读写）：
+1. CREATE TABLE <表>__new LIKE <表>，再改成新主键（空表，瞬间完成）；
+2. 按股票分批 INSERT ... SELECT 复制，打印进度与预计剩余时间；
+3. 复制期间被同步任务写过的股票（stock_write_version 中版本晚于复制开始时间）整只重新复制，
+   最多 CATCH_UP_ROUNDS 轮，把最后一步要处理的股票压到最少；
+4. LOCK TABLES ... WRITE 挡住所有写入（已开始的写事务先提交），在锁内把上一轮之后写过的股票最后重抄一遍，
+   确认锁内再无新写入、行数一致后 RENAME TABLE 原子切换（MySQL 8.0.13+ 允许对 WRITE 锁定的表改名），
+   旧表保留为 <表>__old。任何一项核对不通过都不切换。
+
+    python migrate_clustered_pk.py
+    python migrate_clustered_pk.py --tables stock_daily --batch-codes 100 --drop-old
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import time
+from datetime import datetime
+from typing import Any
+
+from common import build_engine, setup_logging
+
+TABLES = ("stock_daily", "stock_weekly")
+CATCH_UP_ROUNDS = 3
+
+logger = logging.getLogger(__name__)
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="把日线/周线表迁移为 (code, date) 聚簇主键")
+    parser.add_argument("--tables", nargs="+", choices=TABLES, default=list(TABLES), help="需要迁移的表")
+    parser.add_argument("--batch-codes", type=int, default=50, help="每批复制的股票数，默认 50")
+    parser.add_argument("--drop-old", action="store_true", help="切换成功后删除 <表>__old")
+    return parser.parse_args()
+
+
+def primary_key_columns(engine: Any, table: str) -> list[str]:
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND CONSTRAINT_NAME = 'PRIMARY' "
+                "ORDER BY ORDINAL_POSITION"
+            ),
+            {"t": table},
+        ).fetchall()
+    return [row[0] for row in rows]
+
+
+def data_columns(engine: Any, table: str) -> list[str]:
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t ORDER BY ORDINAL_POSITION"
+            ),
+            {"t": table},
+        ).fetchall()
+    return [row[0] for row in rows if row[0] != "id"]
+
+
+def create_shadow_table(engine: Any, table: str) -> str:
+    from sqlalchemy import text
+
+    shadow = f"{table}__new"
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS `{shadow}`"))
+        conn.execute(text(f"CREATE TABLE `{shadow}` LIKE `{table}`"))
+        conn.execute(
+            text(
+                f"ALTER TABLE `{shadow}` "
+                "DROP COLUMN `id`, "
+                "DROP INDEX `uk_code_date`, "
+                "ADD PRIMARY KEY (`code`, `date`), "
+                "ADD KEY `idx_date_code` (`date`, `code`)"
+            )
+        )
+    return shadow
+
+
+def copy_codes(conn: Any, table: str, shadow: str, columns: list[str], codes: list[str], replace: bool) -> int:
+    """复制一批股票；replace=True 时先清掉影子表中这些股票，保证源表上的删除也能同步过去。"""
+    from sqlalchemy import bindparam, text
+
+    cols = ", ".join(f"`{col}`" for col in columns)
+    updates = ", ".join(f"`{col}` = VALUES(`{col}`)" for col in columns if col not in ("code", "date"))
+    insert_sql = text(
+        f"INSERT INTO `{shadow}` ({cols}) SELECT {cols} FROM `{table}` WHERE `code` IN :codes "
+        f"ON DUPLICATE KEY UPDATE {updates}"
+    ).bindparams(bindparam("codes", expanding=True))
+    delete_sql = text(f"DELETE FROM `{shadow}` WHERE `code` IN :codes").bindparams(
+        bindparam("codes", expanding=True)
+    )
+    if replace:
+        conn.execute(delete_sql, {"codes": codes})
+    return conn.execute(insert_sql, {"codes": codes}).rowcount
+
+
+def codes_written_since(conn: Any, table: str, since: datetime) -> list[str]:
+    from sqlalchemy import text
+
+    rows = conn.execute(
+        text(
+            "SELECT DISTINCT `code` FROM `stock_write_version` "
+            "WHERE `table_name` = :t AND `version` >= :since"
+        ),
+        {"t": table, "since": since},
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def count_rows(conn: Any, table: str) -> int:
+    from sqlalchemy import text
+
+    return int(conn.execute(text(f"SELECT COUNT(*) FROM `{table}`")).scalar())
+
+
+def db_now(conn: Any) -> datetime:
+    from sqlalchemy import text
+
+    return conn.execute(text("SELECT CURRENT_TIMESTAMP(6)")).scalar()
+
+
+def migrate_table(engine: Any, table: str, batch_codes: int, drop_old: bool) -> None:
+    from sqlalchemy import text
+
+    if primary_key_columns(engine, table) == ["code", "date"]:
+        logger.info("%s 已是 (code, date) 聚簇主键，跳过", table)
+        return
+
+    shadow = create_shadow_table(engine, table)
+    columns = data_columns(engine, table)
+    with engine.connect() as conn:
+        codes = [row[0] for row in conn.execute(text(f"SELECT DISTINCT `code` FROM `{table}` ORDER BY `code`"))]
+
+    with engine.connect() as conn:
+        copy_started = db_now(conn)
+    started = time.monotonic()
+    copied_rows = 0
+    logger.info("%s 开始复制 %s 只股票至 %s", table, len(codes), shadow)
+    for offset in range(0, len(codes), batch_codes):
+        batch = codes[offset:offset + batch_codes]
+        with engine.begin() as conn:
+            copied_rows += copy_codes(conn, table, shadow, columns, batch, replace=False)
+        done = offset + len(batch)
+        elapsed = time.monotonic() - started
+        eta = elapsed / done * (len(codes) - done)
+        logger.info(
+            "%s 进度 %s/%s 只，%s 行，%.0f 行/秒，预计剩余 %.0fs",
+            table,
+            done,
+            len(codes),
+            copied_rows,
+            copied_rows / max(elapsed, 1e-6),
+            eta,
+        )
+
+    # 复制期间同步任务仍在写源表，按写入版本把这些股票整只重抄，尽量把锁表阶段的工作量压小
+    for round_no in range(1, CATCH_UP_ROUNDS + 1):
+        with engine.begin() as conn:
+            round_started = db_now(conn)
+            dirty = codes_written_since(conn, table, copy_started)
+        if not dirty:
+            break
+        logger.info("%s 追平第 %s 轮：%s 只股票在复制期间有写入", table, round_no, len(dirty))
+        for offset in range(0, len(dirty), batch_codes):
+            with engine.begin() as conn:
+                copy_codes(conn, table, shadow, columns, dirty[offset:offset + batch_codes], replace=True)
+        copy_started = round_started
+
+    old = f"{table}__old"
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS `{old}`"))
+
+    # 最后一步挡住所有写入：锁内重抄上一轮之后写过的股票，确认再无新写入、行数一致才切换
+    with engine.connect() as conn:
+        conn.execute(text(f"LOCK TABLES `{table}` WRITE, `{shadow}` WRITE, `stock_write_version` READ"))
+        try:
+            locked_at = db_now(conn)
+            dirty = codes_written_since(conn, table, copy_started)
+            if dirty:
+                logger.info("%s 锁表后重抄 %s 只股票", table, len(dirty))
+                for offset in range(0, len(dirty), batch_codes):
+                    copy_codes(conn, table, shadow, columns, dirty[offset:offset + batch_codes], replace=True)
+            conn.commit()
+            late = codes_written_since(conn, table, locked_at)
+            source_rows, shadow_rows = count_rows(conn, table), count_rows(conn, shadow)
+            if late or source_rows != shadow_rows:
+                raise SystemExit(
+                    f"{table} 锁表后仍有 {len(late)} 只股票写入或行数不一致（{source_rows} / {shadow_rows}），"
+                    f"未切换，{shadow} 保留供排查"
+                )
+            conn.execute(text(f"RENAME TABLE `{table}` TO `{old}`, `{shadow}` TO `{table}`"))
+        finally:
+            conn.execute(text("UNLOCK TABLES"))
+    logger.info("%s 已切换为聚簇主键，%s 行，旧表保留为 %s", table, shadow_rows, old)
+
+    with engine.connect() as conn:
+        final_rows, old_rows = count_rows(conn, table), count_rows(conn, old)
+    if final_rows != old_rows:
+        logger.warning("%s 切换后行数 %s 与旧表 %s 不一致，请检查", table, final_rows, old_rows)
+    elif drop_old:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE `{old}`"))
+        logger.info("已删除 %s", old)
+
+
+def main() -> None:
+    args = parse_arguments()
+    setup_logging("migrate_clustered_pk.log")
+    if args.batch_codes < 1:
+        raise SystemExit("--batch-codes 至少为 1")
+    engine = build_engine()
+    for table in args.tables:
+        migrate_table(engine, table, args.batch_codes, args.drop_old)
+
+
+if __name__ == "__main__":
+    main()
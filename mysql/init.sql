@@ -1,6 +1,7 @@
 -- 创建日线表（完整字段）
+-- (code, date) 为聚簇主键，按代码读区间无需回表；(date, code) 服务按日横截面查询
+-- 旧库（自增 id 主键）用 python migrate_clustered_pk.py 在线迁移
 CREATE TABLE IF NOT EXISTS `stock_daily` (
-  `id` BIGINT AUTO_INCREMENT PRIMARY KEY,
   `code` VARCHAR(20) NOT NULL COMMENT '6位股票代码',
   `date` DATE NOT NULL,
   `open` DECIMAL(10,4),
@@ -11,7 +12,7 @@ CREATE TABLE IF NOT EXISTS `stock_daily` (
   `volume` BIGINT COMMENT '成交量（股）',
   `amount` DECIMAL(18,2) COMMENT '成交额（元）',
   `adjustflag` TINYINT COMMENT '复权类型：3=前复权',
-  `turn` DECIMAL(10,6) COMMENT '换手率（小数形式）',
+  `turn` DECIMAL(10,6) COMMENT '换手率（%）',
   `tradestatus` TINYINT COMMENT '交易状态：1=正常',
   `pctChg` DECIMAL(10,4) COMMENT '涨跌幅（%）',
   `peTTM` DECIMAL(12,4),
@@ -19,12 +20,14 @@ CREATE TABLE IF NOT EXISTS `stock_daily` (
   `psTTM` DECIMAL(12,4),
   `pcfNcfTTM` DECIMAL(12,4),
   `isST` TINYINT,
-  UNIQUE KEY `uk_code_date` (`code`, `date`)
+  `provisional` TINYINT NOT NULL DEFAULT 0 COMMENT '1=非 Baostock 数据（临时收盘/回退数据源），待 Baostock 确认',
+  `source` VARCHAR(16) NOT NULL DEFAULT 'baostock' COMMENT '数据来源',
+  PRIMARY KEY (`code`, `date`),
+  KEY `idx_date_code` (`date`, `code`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- 创建周线表（结构相同）
 CREATE TABLE IF NOT EXISTS `stock_weekly` (
-  `id` BIGINT AUTO_INCREMENT PRIMARY KEY,
   `code` VARCHAR(20) NOT NULL COMMENT '6位股票代码',
   `date` DATE NOT NULL,
   `open` DECIMAL(10,4),
@@ -34,9 +37,12 @@ CREATE TABLE IF NOT EXISTS `stock_weekly` (
   `volume` BIGINT COMMENT '成交量（股）',
   `amount` DECIMAL(18,2) COMMENT '成交额（元）',
   `adjustflag` TINYINT COMMENT '复权类型：3=前复权',
-  `turn` DECIMAL(10,6) COMMENT '换手率（小数形式）',
+  `turn` DECIMAL(10,6) COMMENT '换手率（%）',
   `pctChg` DECIMAL(10,4) COMMENT '涨跌幅（%）',
-  UNIQUE KEY `uk_code_date` (`code`, `date`)
+  `provisional` TINYINT NOT NULL DEFAULT 0 COMMENT '1=非 Baostock 数据（临时收盘/回退数据源），待 Baostock 确认',
+  `source` VARCHAR(16) NOT NULL DEFAULT 'baostock' COMMENT '数据来源',
+  PRIMARY KEY (`code`, `date`),
+  KEY `idx_date_code` (`date`, `code`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- 创建 1 分钟分时表
@@ -60,3 +66,125 @@ CREATE TABLE IF NOT EXISTS `stock_intraday_1m` (
   KEY `idx_trade_date` (`trade_date`),
   KEY `idx_code_trade_date` (`code`, `trade_date`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 写入版本表：同步任务按 (表, 代码, 年份) 登记最近写入时间，供 panel_loader 块缓存失效
+CREATE TABLE IF NOT EXISTS `stock_write_version` (
+  `table_name` VARCHAR(64) NOT NULL,
+  `code` VARCHAR(20) NOT NULL,
+  `year` SMALLINT NOT NULL,
+  `version` TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+  PRIMARY KEY (`table_name`, `code`, `year`),
+  KEY `idx_version` (`version`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- (代码, 月) 指纹：行数 + SUM(CRC32(CONCAT(date, '|', close)))，写入时在同一事务里刷新（见 fingerprint.py）
+CREATE TABLE IF NOT EXISTS `stock_daily_fingerprint` (
+  `code` VARCHAR(20) NOT NULL COMMENT '6位股票代码',
+  `year_month` CHAR(7) NOT NULL COMMENT 'YYYY-MM',
+  `row_count` INT NOT NULL,
+  `close_sum_hash` BIGINT UNSIGNED NOT NULL COMMENT 'SUM(CRC32(CONCAT(date, ''|'', close)))',
+  `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`code`, `year_month`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `stock_weekly_fingerprint` LIKE `stock_daily_fingerprint`;
+
+-- 不复权日线/周线（adjustflag=3），历史不随除权改写，读取时按复权因子现算
+CREATE TABLE IF NOT EXISTS `stock_daily_raw` LIKE `stock_daily`;
+CREATE TABLE IF NOT EXISTS `stock_weekly_raw` LIKE `stock_weekly`;
+
+-- 复权因子（bs.query_adjust_factor），每个除权除息日一行
+CREATE TABLE IF NOT EXISTS `stock_adjust_factor` (
+  `code` VARCHAR(20) NOT NULL COMMENT '6位股票代码',
+  `divid_operate_date` DATE NOT NULL COMMENT '除权除息日期',
+  `fore_adjust_factor` DECIMAL(20,10) DEFAULT NULL COMMENT '向前复权因子（查询时刻口径）',
+  `back_adjust_factor` DECIMAL(20,10) DEFAULT NULL COMMENT '向后复权因子',
+  `adjust_factor` DECIMAL(20,10) DEFAULT NULL COMMENT '本次复权因子',
+  `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`code`, `divid_operate_date`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 除权除息重刷队列：日线增量同步检测到前复权口径变化的股票，只对它们重刷完整历史
+CREATE TABLE IF NOT EXISTS `stock_resync_queue` (
+  `code` VARCHAR(20) NOT NULL PRIMARY KEY COMMENT '6位股票代码',
+  `reason` VARCHAR(64) NOT NULL COMMENT '触发原因',
+  `status` VARCHAR(16) NOT NULL DEFAULT 'pending' COMMENT 'pending/done/failed',
+  `attempts` INT NOT NULL DEFAULT 0,
+  `detected_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `finished_at` TIMESTAMP NULL DEFAULT NULL,
+  KEY `idx_status` (`status`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 交易日历与上市区间（backfill_planner.py 缺口检测用）
+CREATE TABLE IF NOT EXISTS `trade_calendar` (
+  `calendar_date` DATE NOT NULL PRIMARY KEY,
+  `is_trading_day` TINYINT NOT NULL,
+  KEY `idx_trading_day` (`is_trading_day`, `calendar_date`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `stock_listing` (
+  `code` VARCHAR(20) NOT NULL PRIMARY KEY COMMENT '6位股票代码',
+  `name` VARCHAR(64) DEFAULT NULL,
+  `ipo_date` DATE DEFAULT NULL COMMENT '上市日期',
+  `out_date` DATE DEFAULT NULL COMMENT '退市日期',
+  `type` TINYINT DEFAULT NULL COMMENT '1=股票 2=指数 3=其它',
+  `status` TINYINT DEFAULT NULL COMMENT '1=上市 0=退市',
+  `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 调度运行记录（scheduler.py）
+CREATE TABLE IF NOT EXISTS `sync_job_run` (
+  `job` VARCHAR(32) NOT NULL,
+  `run_date` DATE NOT NULL COMMENT '调度所属交易日',
+  `status` VARCHAR(16) NOT NULL COMMENT 'running/success/failed',
+  `attempts` INT NOT NULL DEFAULT 0,
+  `started_at` DATETIME DEFAULT NULL,
+  `finished_at` DATETIME DEFAULT NULL,
+  `message` VARCHAR(512) DEFAULT NULL,
+  PRIMARY KEY (`job`, `run_date`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 分布式任务队列（task_queue.py）：多个容器以同一 run_id 分批认领股票，租约过期的任务回到队列
+CREATE TABLE IF NOT EXISTS `sync_task` (
+  `job` VARCHAR(32) NOT NULL COMMENT '任务类型：daily/weekly/full/intraday/themes',
+  `run_id` VARCHAR(64) NOT NULL COMMENT '同一次运行的标识，多个容器共享',
+  `code` VARCHAR(20) NOT NULL,
+  `seq` INT NOT NULL DEFAULT 0 COMMENT '认领顺序，越小越先',
+  `status` VARCHAR(16) NOT NULL DEFAULT 'pending' COMMENT 'pending/claimed/done/failed',
+  `worker` VARCHAR(128) DEFAULT NULL,
+  `lease_until` DATETIME(3) DEFAULT NULL,
+  `attempts` INT NOT NULL DEFAULT 0,
+  `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`job`, `run_id`, `code`),
+  KEY `idx_claim` (`job`, `run_id`, `status`, `seq`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 优先级同步（priority.py）：--deadline 到点后被推迟的低优先级股票，由 --catch-up 补跑
+CREATE TABLE IF NOT EXISTS `sync_deferred` (
+  `job` VARCHAR(32) NOT NULL,
+  `code` VARCHAR(20) NOT NULL,
+  `score` DOUBLE NOT NULL DEFAULT 0,
+  `deferred_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`job`, `code`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 技术指标物化表（indicators.py）：日线写入后增量维护，除权除息重刷后整段重算
+CREATE TABLE IF NOT EXISTS `stock_daily_indicators` (
+  `code` VARCHAR(20) NOT NULL COMMENT '6位股票代码',
+  `date` DATE NOT NULL,
+  `ma5` DOUBLE, `ma10` DOUBLE, `ma20` DOUBLE, `ma60` DOUBLE,
+  `ema12` DOUBLE, `ema26` DOUBLE,
+  `macd_dif` DOUBLE, `macd_dea` DOUBLE, `macd_hist` DOUBLE,
+  `rsi14` DOUBLE, `atr14` DOUBLE,
+  PRIMARY KEY (`code`, `date`),
+  KEY `idx_date_code` (`date`, `code`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 每只股票的指标滚动状态：追加一根 K 线只需读取这一行
+CREATE TABLE IF NOT EXISTS `stock_indicator_state` (
+  `code` VARCHAR(20) NOT NULL PRIMARY KEY COMMENT '6位股票代码',
+  `last_date` DATE NOT NULL COMMENT '已计算到的最后一根 K 线',
+  `seen_version` TIMESTAMP(6) NULL DEFAULT NULL COMMENT '计算时该股票在 stock_write_version 中的最大版本',
+  `state` TEXT NOT NULL COMMENT '滚动状态 JSON',
+  `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
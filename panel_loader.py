@@ -0,0 +1,262 @@
+"""从 stock_daily / stock_weekly 读取 日期×代码 对齐的面板数组，带按块的 LRU 缓存。
+
+用法::
+
+    from panel_loader import load_panel
+
+    panel = load_panel(["close", "volume"], ["688001", "300750"], "2023-01-01", "2024-06-30")
+    panel.dates           # numpy datetime64[D]，长度 T
+    panel.codes           # 代码列表，长度 N
+    panel["close"]        # float64 数组，形状 (T, N)，缺失为 NaN
+
+缓存以 (表, 代码, 年份) 为块，只向数据库请求缺失的块。同步任务每次写入都会在
+stock_write_version 中登记 (表, 代码, 年份) 的版本号，load_panel 每次调用先查一次版本变化，
+让被改写过的块失效，因此前复权改写历史后也不会读到旧价格。
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Iterable, Sequence
+
+import numpy as np
+
+from common import build_engine
+
+PANEL_CACHE_MB = int(os.getenv("PANEL_CACHE_MB", "512"))
+
+FREQ_TABLES = {"daily": "stock_daily", "weekly": "stock_weekly"}
+PANEL_FIELDS = {
+    "stock_daily": (
+        "open", "high", "low", "close", "preclose", "volume", "amount", "turn",
+        "tradestatus", "pctChg", "peTTM", "pbMRQ", "psTTM", "pcfNcfTTM", "isST",
+    ),
+    "stock_weekly": ("open", "high", "low", "close", "volume", "amount", "turn", "pctChg"),
+}
+CODE_CHUNK_SIZE = 500
+# 写入事务提交顺序与版本时间戳顺序不严格一致，回看一段时间防止漏掉晚提交的写入
+VERSION_GRACE = timedelta(minutes=10)
+EPOCH = datetime(1970, 1, 1)
+
+
+@dataclass
+class Panel:
+    dates: np.ndarray
+    codes: list[str]
+    data: dict[str, np.ndarray]
+
+    def __getitem__(self, field_name: str) -> np.ndarray:
+        return self.data[field_name]
+
+
+@dataclass
+class Block:
+    """单只股票单个自然年的全部数值列。"""
+
+    dates: np.ndarray
+    values: dict[str, np.ndarray]
+    version: datetime | None
+    nbytes: int = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.nbytes = self.dates.nbytes + sum(arr.nbytes for arr in self.values.values())
+
+
+class BlockCache:
+    """按字节数限容的 LRU 块缓存，线程安全。"""
+
+    def __init__(self, max_bytes: int = PANEL_CACHE_MB * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.version_watermark: datetime | None = None
+        self._blocks: OrderedDict[tuple[str, str, int], Block] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple[str, str, int]) -> Block | None:
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is not None:
+                self._blocks.move_to_end(key)
+            return block
+
+    def put(self, key: tuple[str, str, int], block: Block) -> None:
+        with self._lock:
+            old = self._blocks.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._blocks[key] = block
+            self.nbytes += block.nbytes
+            while self.nbytes > self.max_bytes and len(self._blocks) > 1:
+                _, evicted = self._blocks.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def invalidate(self, key: tuple[str, str, int], version: datetime | None = None) -> None:
+        """version 给定时，只有缓存块的版本与之不同才丢弃。"""
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is None or (version is not None and block.version == version):
+                return
+            del self._blocks[key]
+            self.nbytes -= block.nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._blocks.clear()
+            self.nbytes = 0
+            self.version_watermark = None
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+
+_default_cache = BlockCache()
+_default_engine = None
+
+
+def get_default_engine() -> Any:
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = build_engine()
+    return _default_engine
+
+
+def chunked(items: Sequence[str], size: int) -> Iterable[Sequence[str]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def to_date(value: str | date | datetime) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def refresh_versions(engine: Any, cache: BlockCache) -> None:
+    """根据 stock_write_version 的变化让缓存块失效。"""
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        if cache.version_watermark is None:
+            # 空缓存无需失效，只记下当前水位
+            latest = conn.execute(text("SELECT MAX(`version`) FROM `stock_write_version`")).scalar()
+            cache.version_watermark = latest or EPOCH
+            return
+        rows = conn.execute(
+            text(
+                "SELECT `table_name`, `code`, `year`, `version` FROM `stock_write_version` "
+                "WHERE `version` > :since"
+            ),
+            {"since": cache.version_watermark - VERSION_GRACE},
+        ).fetchall()
+    for table, code, year, version in rows:
+        cache.invalidate((table, code, int(year)), version)
+        if version > cache.version_watermark:
+            cache.version_watermark = version
+
+
+def fetch_blocks(engine: Any, cache: BlockCache, table: str, year: int, codes: Sequence[str]) -> None:
+    """一次查询拉取若干只股票某一整年的数据，切成块放入缓存。"""
+    import pandas as pd
+    from sqlalchemy import bindparam, text
+
+    fields = PANEL_FIELDS[table]
+    columns = ", ".join(f"`{name}`" for name in fields)
+    version_query = text(
+        "SELECT `code`, `version` FROM `stock_write_version` "
+        "WHERE `table_name` = :t AND `year` = :y AND `code` IN :codes"
+    ).bindparams(bindparam("codes", expanding=True))
+    data_query = text(
+        f"SELECT `code`, `date`, {columns} FROM `{table}` "
+        "WHERE `code` IN :codes AND `date` >= :s AND `date` <= :e ORDER BY `code`, `date`"
+    ).bindparams(bindparam("codes", expanding=True))
+
+    for code_chunk in chunked(list(codes), CODE_CHUNK_SIZE):
+        with engine.connect() as conn:
+            # 先读版本再读数据：期间若有新写入，版本号更大，下次刷新时会让块失效
+            versions = dict(conn.execute(version_query, {"t": table, "y": year, "codes": list(code_chunk)}).fetchall())
+            df = pd.read_sql(
+                data_query,
+                conn,
+                params={"codes": list(code_chunk), "s": date(year, 1, 1), "e": date(year, 12, 31)},
+            )
+        grouped = dict(tuple(df.groupby("code", sort=False))) if not df.empty else {}
+        for code in code_chunk:
+            part = grouped.get(code)
+            if part is None:
+                dates = np.array([], dtype="datetime64[D]")
+                values = {name: np.array([], dtype="float64") for name in fields}
+            else:
+                dates = pd.to_datetime(part["date"]).to_numpy(dtype="datetime64[D]")
+                values = {
+                    name: pd.to_numeric(part[name], errors="coerce").to_numpy(dtype="float64")
+                    for name in fields
+                }
+            cache.put((table, code, year), Block(dates, values, versions.get(code)))
+
+
+def load_panel(
+    fields: Sequence[str],
+    codes: Sequence[str],
+    start: str | date | datetime,
+    end: str | date | datetime,
+    freq: str = "daily",
+    *,
+    engine: Any = None,
+    cache: BlockCache | None = None,
+) -> Panel:
+    """返回 [start, end] 区间内 日期×代码 的 float64 面板，日期轴为所有代码出现过的交易日并集。"""
+    if freq not in FREQ_TABLES:
+        raise ValueError(f"不支持的频率: {freq}，可选 {sorted(FREQ_TABLES)}")
+    table = FREQ_TABLES[freq]
+    unknown = [name for name in fields if name not in PANEL_FIELDS[table]]
+    if unknown:
+        raise ValueError(f"{table} 不支持的字段: {unknown}")
+    start_date, end_date = to_date(start), to_date(end)
+    if start_date > end_date:
+        raise ValueError("开始日期不能晚于结束日期")
+
+    engine = engine or get_default_engine()
+    cache = cache if cache is not None else _default_cache
+    codes = [str(code).zfill(6) for code in codes]
+    years = range(start_date.year, end_date.year + 1)
+
+    refresh_versions(engine, cache)
+    for year in years:
+        missing = [code for code in codes if cache.get((table, code, year)) is None]
+        if missing:
+            fetch_blocks(engine, cache, table, year, missing)
+
+    # 缓存容量小于本次请求时，块可能在组装前被挤出，这里保留引用
+    blocks: dict[str, list[Block]] = {code: [] for code in codes}
+    for code in codes:
+        for year in years:
+            block = cache.get((table, code, year))
+            if block is None:
+                fetch_blocks(engine, cache, table, year, [code])
+                block = cache.get((table, code, year))
+            blocks[code].append(block)
+
+    lo, hi = np.datetime64(start_date, "D"), np.datetime64(end_date, "D")
+    date_parts = [block.dates[(block.dates >= lo) & (block.dates <= hi)] for parts in blocks.values() for block in parts]
+    all_dates = np.unique(np.concatenate(date_parts)) if date_parts else np.array([], dtype="datetime64[D]")
+
+    data = {name: np.full((len(all_dates), len(codes)), np.nan, dtype="float64") for name in fields}
+    for col, code in enumerate(codes):
+        for block in blocks[code]:
+            mask = (block.dates >= lo) & (block.dates <= hi)
+            if not mask.any():
+                continue
+            rows = np.searchsorted(all_dates, block.dates[mask])
+            for name in fields:
+                data[name][rows, col] = block.values[name][mask]
+    return Panel(dates=all_dates, codes=codes, data=data)
+
+
+def clear_cache() -> None:
+    _default_cache.clear()
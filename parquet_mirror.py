@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""把 stock_daily / stock_weekly / stock_intraday_1m 增量镜像为本地分区 Parquet 数据集。
+
+目录结构（hive 分区，pyarrow / DuckDB / Polars 都可以直接识别）::
+
+    <root>/stock_daily/year=2024/month=06/part-0.parquet
+    <root>/stock_weekly/year=2024/month=06/part-0.parquet
+    <root>/stock_intraday_1m/year=2024/month=06/trade_date=2024-06-18/part-0.parquet
+
+日线/周线表没有更新时间列，按月统计行数和内容 CRC 与上次导出的清单比对，只重写发生变化的月份，
+库中已经没有数据的月份连同分区目录一并删除；
+分时表按 updated_at 水位（含水位所在的那一秒）找出本次同步触及的交易日，只重写这些交易日分区。
+分时表里过期的交易日由 intraday_retention 归档后删除，镜像中保留，不随之清理。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import shutil
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+from common import build_engine, setup_logging
+from profiling import add_profile_arguments, profile_run
+
+PARQUET_ROOT = os.getenv("PARQUET_ROOT", "./data/parquet")
+
+MANIFEST_NAME = "_manifest.json"
+PART_NAME = "part-0.parquet"
+
+# 每张表的分区方式、日期列和参与内容校验的列
+TABLES: dict[str, dict[str, Any]] = {
+    "stock_daily": {
+        "date_col": "date",
+        "by_trade_date": False,
+        "checksum_cols": ["code", "date", "open", "high", "low", "close", "preclose", "volume", "amount", "turn"],
+    },
+    "stock_weekly": {
+        "date_col": "date",
+        "by_trade_date": False,
+        "checksum_cols": ["code", "date", "open", "high", "low", "close", "volume", "amount", "turn"],
+    },
+    "stock_intraday_1m": {
+        "date_col": "trade_date",
+        "by_trade_date": True,
+        "checksum_cols": [],
+    },
+}
+STRING_COLUMNS = {"code", "name", "source"}
+TEMPORAL_COLUMNS = {"date", "trade_date", "trade_time", "trade_datetime", "created_at", "updated_at"}
+
+logger = logging.getLogger(__name__)
+
+
+def partition_dir(root: Path, table: str, day: date) -> Path:
+    path = root / table / f"year={day.year}" / f"month={day.month:02d}"
+    if TABLES[table]["by_trade_date"]:
+        path = path / f"trade_date={day.isoformat()}"
+    return path
+
+
+def load_manifest(root: Path) -> dict:
+    path = root / MANIFEST_NAME
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_manifest(root: Path, manifest: dict) -> None:
+    path = root / MANIFEST_NAME
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def normalize_frame(df: Any) -> Any:
+    """DECIMAL 转 float64、日期转 datetime，保证各分区 schema 一致。"""
+    import pandas as pd
+
+    for col in df.columns:
+        if col in STRING_COLUMNS:
+            df[col] = df[col].astype("string")
+        elif col == "trade_time":
+            df[col] = df[col].astype("string").str.replace("0 days ", "", regex=False)
+        elif col in TEMPORAL_COLUMNS:
+            df[col] = pd.to_datetime(df[col])
+        else:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    return df
+
+
+def write_partition(df: Any, path: Path, compression: str) -> None:
+    """先写临时文件再原子替换，读者永远看不到写了一半的分区。"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path.mkdir(parents=True, exist_ok=True)
+    target = path / PART_NAME
+    tmp_target = path / f".{PART_NAME}.tmp"
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_table(table, tmp_target, compression=None if compression == "none" else compression)
+    os.replace(tmp_target, target)
+
+
+def month_checksums(engine: Any, table: str, since: str | None) -> dict[str, list[int]]:
+    """一次分组查询得到每个月的 [行数, 内容CRC]，用于判断哪些月份需要重写。"""
+    from sqlalchemy import text
+
+    cols = ",".join(f"`{col}`" for col in TABLES[table]["checksum_cols"])
+    # 取整到月初，避免只统计半个月而与清单中的整月校验值永远对不上
+    since = f"{since[:7]}-01" if since else None
+    where = "WHERE `date` >= :since" if since else ""
+    query = text(
+        f"""
+        SELECT DATE_FORMAT(`date`, '%Y-%m') AS ym,
+               COUNT(*) AS cnt,
+               BIT_XOR(CRC32(CONCAT_WS('|', {cols}))) AS crc
+        FROM `{table}`
+        {where}
+        GROUP BY ym
+        """
+    )
+    with engine.connect() as conn:
+        rows = conn.execute(query, {"since": since} if since else {}).fetchall()
+    return {row[0]: [int(row[1]), int(row[2] or 0)] for row in rows}
+
+
+def mirror_monthly_table(engine: Any, root: Path, table: str, manifest: dict, args: argparse.Namespace) -> int:
+    import pandas as pd
+    from sqlalchemy import text
+
+    state = manifest.setdefault(table, {"months": {}})
+    current = month_checksums(engine, table, args.since)
+    touched = sorted(
+        ym for ym, checksum in current.items() if args.full or state["months"].get(ym) != checksum
+    )
+    # --since 只统计了起点之后的月份，更早的月份不能据此判断为已删除
+    floor = args.since[:7] if args.since else ""
+    removed = sorted(ym for ym in state["months"] if ym >= floor and ym not in current)
+    logger.info("%s 共 %s 个月，需重写 %s 个月，删除 %s 个月", table, len(current), len(touched), len(removed))
+
+    for ym in removed:
+        year, month = (int(part) for part in ym.split("-"))
+        shutil.rmtree(partition_dir(root, table, date(year, month, 1)), ignore_errors=True)
+        del state["months"][ym]
+        logger.info("%s %s 已从库中删除，移除镜像分区", table, ym)
+
+    for ym in touched:
+        year, month = (int(part) for part in ym.split("-"))
+        month_start = date(year, month, 1)
+        month_end = date(year + month // 12, month % 12 + 1, 1)
+        with engine.connect() as conn:
+            df = pd.read_sql(
+                text(f"SELECT * FROM `{table}` WHERE `date` >= :s AND `date` < :e ORDER BY `code`, `date`"),
+                conn,
+                params={"s": month_start, "e": month_end},
+            )
+        df = normalize_frame(df.drop(columns=["id"], errors="ignore"))
+        write_partition(df, partition_dir(root, table, month_start), args.compression)
+        state["months"][ym] = current[ym]
+        logger.info("%s %s 已导出 %s 行", table, ym, len(df))
+    return len(touched) + len(removed)
+
+
+def mirror_intraday_table(engine: Any, root: Path, table: str, manifest: dict, args: argparse.Namespace) -> int:
+    import pandas as pd
+    from sqlalchemy import text
+
+    state = manifest.setdefault(table, {})
+    with engine.connect() as conn:
+        has_updated_at = conn.execute(
+            text(
+                "SELECT COUNT(*) FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND COLUMN_NAME = 'updated_at'"
+            ),
+            {"t": table},
+        ).scalar()
+
+    # compact 布局（兼容视图没有 updated_at）的 trade_date 是不带索引的虚拟列，按它过滤每次都全表扫描，
+    # 改用主键列 trade_datetime 的范围；标准/分区布局按 trade_date 走索引或分区裁剪
+    by_datetime = not has_updated_at
+    conditions = []
+    params: dict[str, Any] = {}
+    if has_updated_at:
+        watermark = None if args.full else state.get("updated_at")
+        if watermark:
+            # updated_at 只精确到秒，与水位同一秒提交的行可能在上次取水位之后才写入；重写交易日是幂等的
+            conditions.append("`updated_at` >= :watermark")
+            params["watermark"] = watermark
+    else:
+        # compact 布局的兼容视图没有 updated_at，退化为从上次导出的最后交易日开始重写
+        watermark = None if args.full else state.get("trade_date")
+        if watermark:
+            conditions.append("`trade_datetime` >= :watermark")
+            params["watermark"] = watermark
+    if args.since:
+        conditions.append("`trade_datetime` >= :since" if by_datetime else "`trade_date` >= :since")
+        params["since"] = args.since
+    day_clause = (
+        "`trade_datetime` >= :d AND `trade_datetime` < :d_next" if by_datetime else "`trade_date` = :d"
+    )
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    with engine.connect() as conn:
+        # 先取水位再找触及的交易日，期间新写入的行留给下一轮
+        new_watermark = (
+            conn.execute(text(f"SELECT MAX(`updated_at`) FROM `{table}`")).scalar() if has_updated_at else None
+        )
+        touched = [
+            row[0]
+            for row in conn.execute(
+                text(f"SELECT DISTINCT `trade_date` FROM `{table}` {where} ORDER BY `trade_date`"), params
+            ).fetchall()
+        ]
+    logger.info("%s 水位 %s，需重写 %s 个交易日", table, watermark or "无", len(touched))
+
+    for trade_date in touched:
+        with engine.connect() as conn:
+            df = pd.read_sql(
+                text(f"SELECT * FROM `{table}` WHERE {day_clause} ORDER BY `code`, `trade_datetime`"),
+                conn,
+                params={"d": trade_date, "d_next": trade_date + timedelta(days=1)},
+            )
+        df = normalize_frame(df.drop(columns=["id"], errors="ignore"))
+        write_partition(df, partition_dir(root, table, trade_date), args.compression)
+        logger.info("%s %s 已导出 %s 行", table, trade_date, len(df))
+
+    if new_watermark is not None:
+        state["updated_at"] = new_watermark.strftime("%Y-%m-%d %H:%M:%S")
+    if touched:
+        state["trade_date"] = max(touched).strftime("%Y-%m-%d")
+    return len(touched)
+
+
+def mirror_tables(engine: Any, root: Path, tables: list[str], args: argparse.Namespace) -> None:
+    root.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(root)
+    for table in tables:
+        if TABLES[table]["by_trade_date"]:
+            count = mirror_intraday_table(engine, root, table, manifest, args)
+        else:
+            count = mirror_monthly_table(engine, root, table, manifest, args)
+        manifest.setdefault(table, {})["mirrored_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # 每张表完成后落盘清单，中途失败时已完成的表不必重做
+        save_manifest(root, manifest)
+        logger.info("%s 镜像完成，本次重写 %s 个分区", table, count)
+
+
+def read_mirror(
+    table: str,
+    columns: list[str] | None = None,
+    filters: list[tuple] | None = None,
+    root: str | Path = PARQUET_ROOT,
+) -> Any:
+    """以内存映射方式读取镜像，返回 pyarrow.Table。
+
+    filters 使用 pyarrow 语法，分区列 year/month/trade_date 上的条件会直接裁剪目录，例如::
+
+        read_mirror("stock_daily", ["code", "date", "close"], [("year", ">=", 2023), ("code", "in", codes)])
+    """
+    import pyarrow.parquet as pq
+
+    return pq.read_table(
+        Path(root) / table,
+        columns=columns,
+        filters=filters,
+        memory_map=True,
+        partitioning="hive",
+    )
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="把行情表增量镜像为本地分区 Parquet 数据集")
+    parser.add_argument("--tables", nargs="+", choices=sorted(TABLES), default=sorted(TABLES), help="需要镜像的表")
+    parser.add_argument("--root", default=PARQUET_ROOT, help="Parquet 数据集根目录，默认 ./data/parquet")
+    parser.add_argument("--since", help="只检查该日期（YYYY-MM-DD）之后的分区，缩小比对范围")
+    parser.add_argument("--full", action="store_true", help="忽略清单和水位，全量重写")
+    parser.add_argument(
+        "--compression",
+        choices=("none", "snappy", "zstd"),
+        default="snappy",
+        help="Parquet 压缩方式；none 体积大但内存映射读取最快",
+    )
+    add_profile_arguments(parser)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_arguments()
+    setup_logging("parquet_mirror.log")
+    if args.since:
+        try:
+            datetime.strptime(args.since, "%Y-%m-%d")
+        except ValueError as exc:
+            raise SystemExit(f"日期格式错误: {args.since}，请使用 YYYY-MM-DD") from exc
+    with profile_run("parquet_mirror", args):
+        mirror_tables(build_engine(), Path(args.root), args.tables, args)
+
+
+if __name__ == "__main__":
+    main()
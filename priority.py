@@ -0,0 +1,300 @@
+"""同步循环的优先级排序与截止时间。
+
+code.csv 只保证 688 排在前面，各同步循环严格按文件顺序处理；收盘后时间窗口紧张时，
+排在末尾的股票可能赶不上策略启动。--priority 按加权得分重新排序：
+
+* board：板块（688 > 创业板 > 沪深主板 > 其他），见 BOARD_SCORES；
+* liquidity：stock_daily 最新一根 K 线成交额在全部股票中的分位；
+* watchlist：是否在自选清单（WATCHLIST_PATH，每行一个代码）中；
+* staleness：目标表最新日期距今的天数，STALENESS_CAP_DAYS 天封顶，库中没有数据的股票记满分。
+
+每项归一化到 [0, 1] 后按 --priority-weights 加权求和，得分相同时保持 code.csv 原顺序。
+--deadline HH:MM 到点后只继续处理排名前 --keep-top 的股票，其余推迟：写入 sync_deferred，
+之后用 --catch-up 单独补一轮（调度进程中为 daily-catchup 任务）。任务队列模式下 seq 按优先级分配。
+股票在调用方处理完、回到循环取下一只时才移出 sync_deferred；处理失败（report_failure）或
+暂无数据（keep_deferred）的股票留在表中，下次补跑继续处理。
+
+    python sync_daily.py --priority
+    python sync_daily.py --priority --deadline 19:00 --keep-top 0.3
+    python sync_daily.py --catch-up
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+from datetime import date, datetime
+from typing import Any, Iterable, Iterator, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFERRED_TABLE = "sync_deferred"
+WATCHLIST_PATH = os.getenv("WATCHLIST_PATH", "./watchlist.csv")
+DEFAULT_WEIGHTS = "board=1,liquidity=2,watchlist=4,staleness=1"
+DEFAULT_KEEP_TOP = 0.2
+STALENESS_CAP_DAYS = 10
+# 按最长前缀匹配
+BOARD_SCORES = {"688": 1.0, "689": 1.0, "300": 0.8, "301": 0.8, "60": 0.6, "00": 0.6}
+OTHER_BOARD_SCORE = 0.3
+FACTORS = ("board", "liquidity", "watchlist", "staleness")
+
+CREATE_DEFERRED_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{DEFERRED_TABLE}` (
+  `job` VARCHAR(32) NOT NULL,
+  `code` VARCHAR(20) NOT NULL,
+  `score` DOUBLE NOT NULL DEFAULT 0,
+  `deferred_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`job`, `code`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+
+def parse_weights(value: str) -> dict[str, float]:
+    """'board=1,liquidity=2' -> {'board': 1.0, 'liquidity': 2.0, ...}，未列出的因子权重为 0。"""
+    weights = dict.fromkeys(FACTORS, 0.0)
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, sep, weight = item.partition("=")
+        if not sep or name not in weights:
+            raise argparse.ArgumentTypeError(f"无效的权重 {item!r}，格式为 因子=权重，因子: {', '.join(FACTORS)}")
+        try:
+            weights[name] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"无效的权重 {item!r}") from None
+    return weights
+
+
+def parse_deadline(value: str) -> datetime:
+    try:
+        at = datetime.strptime(value, "%H:%M").time()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的截止时间 {value!r}，格式为 HH:MM") from None
+    return datetime.combine(date.today(), at)
+
+
+def add_priority_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--priority", action="store_true", help="按板块/流动性/自选/陈旧度加权排序后再同步")
+    parser.add_argument(
+        "--priority-weights",
+        type=parse_weights,
+        default=DEFAULT_WEIGHTS,
+        help=f"各因子权重，默认 {DEFAULT_WEIGHTS}",
+    )
+    parser.add_argument("--watchlist", default=WATCHLIST_PATH, help="自选清单 CSV，每行一个代码")
+    parser.add_argument(
+        "--deadline",
+        type=parse_deadline,
+        default=None,
+        metavar="HH:MM",
+        help="到点后只处理排名靠前的股票，其余写入 sync_deferred 留待 --catch-up（隐含 --priority）",
+    )
+    parser.add_argument("--keep-top", type=float, default=DEFAULT_KEEP_TOP, help="截止后仍继续处理的排名比例")
+    parser.add_argument("--catch-up", action="store_true", help="只处理之前因截止时间被推迟的股票")
+
+
+def board_score(code: str) -> float:
+    for length in (3, 2):
+        score = BOARD_SCORES.get(code[:length])
+        if score is not None:
+            return score
+    return OTHER_BOARD_SCORE
+
+
+def load_watchlist(path: str) -> set[str]:
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return {line.strip().zfill(6) for line in f if line.strip() and not line.startswith("#")}
+
+
+def latest_bars(engine: Any, table: str) -> dict[str, tuple[Any, Optional[float]]]:
+    """每只股票最新一根 K 线的 (日期, 成交额)；按主键 (code, date) 取每组最大日期，无需扫描全表。"""
+    from sqlalchemy import text
+
+    query = text(
+        f"SELECT d.`code`, d.`date`, d.`amount` FROM `{table}` d "
+        f"JOIN (SELECT `code`, MAX(`date`) AS `date` FROM `{table}` GROUP BY `code`) m "
+        "ON d.`code` = m.`code` AND d.`date` = m.`date`"
+    )
+    try:
+        with engine.connect() as conn:
+            return {
+                code: (day, float(amount) if amount is not None else None)
+                for code, day, amount in conn.execute(query)
+            }
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("读取 %s 最新 K 线失败，相关因子按 0 处理: %s", table, exc)
+        return {}
+
+
+def score_codes(
+    engine: Any,
+    codes: Sequence[str],
+    weights: dict[str, float],
+    watchlist: set[str],
+    table: str = "stock_daily",
+) -> dict[str, float]:
+    daily = latest_bars(engine, "stock_daily") if weights["liquidity"] or weights["staleness"] else {}
+    if table == "stock_daily" or not weights["staleness"]:
+        latest = daily
+    else:
+        latest = latest_bars(engine, table)
+
+    amounts = sorted(amount for _, amount in daily.values() if amount is not None)
+    ranks = {amount: index for index, amount in enumerate(amounts)}  # 相同成交额取最高分位
+    denominator = max(len(amounts) - 1, 1)
+    today = date.today()
+
+    scores = {}
+    for code in codes:
+        amount = daily.get(code, (None, None))[1]
+        day = latest.get(code, (None, None))[0]
+        if day is None:
+            staleness = 1.0
+        else:
+            day = day.date() if isinstance(day, datetime) else day
+            staleness = min(max((today - day).days, 0) / STALENESS_CAP_DAYS, 1.0)
+        factors = {
+            "board": board_score(code),
+            "liquidity": ranks[amount] / denominator if amount is not None else 0.0,
+            "watchlist": 1.0 if code in watchlist else 0.0,
+            "staleness": staleness,
+        }
+        scores[code] = sum(weights[name] * value for name, value in factors.items())
+    return scores
+
+
+def load_deferred(engine: Any, job: str) -> set[str]:
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_DEFERRED_SQL))
+        result = conn.execute(text(f"SELECT `code` FROM `{DEFERRED_TABLE}` WHERE `job` = :j"), {"j": job})
+        return {row[0] for row in result}
+
+
+def save_deferred(engine: Any, job: str, done: Sequence[str], deferred: dict[str, float]) -> None:
+    """已处理的股票移出 sync_deferred，本轮推迟的股票写入。"""
+    from sqlalchemy import bindparam, text
+
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_DEFERRED_SQL))
+        if done:
+            conn.execute(
+                text(f"DELETE FROM `{DEFERRED_TABLE}` WHERE `job` = :j AND `code` IN :codes").bindparams(
+                    bindparam("codes", expanding=True)
+                ),
+                {"j": job, "codes": list(done)},
+            )
+        if deferred:
+            conn.execute(
+                text(
+                    f"INSERT INTO `{DEFERRED_TABLE}` (`job`, `code`, `score`) VALUES (:j, :c, :s) "
+                    "ON DUPLICATE KEY UPDATE `score` = VALUES(`score`), `deferred_at` = CURRENT_TIMESTAMP"
+                ),
+                [{"j": job, "c": code, "s": score} for code, score in deferred.items()],
+            )
+
+
+class PriorityPlan:
+    """排好序的代码列表 + 截止时间；schedule() 包装实际遍历的序列（列表或任务队列）。"""
+
+    def __init__(
+        self,
+        engine: Any,
+        job: str,
+        codes: list[str],
+        scores: dict[str, float],
+        deadline: Optional[datetime] = None,
+        keep_top: float = DEFAULT_KEEP_TOP,
+        track: bool = False,
+    ) -> None:
+        self.engine = engine
+        self.job = job
+        self.codes = codes
+        self.scores = scores
+        self.deadline = deadline
+        self.keep = max(0, int(len(codes) * keep_top))
+        self.rank = {code: index for index, code in enumerate(codes)}
+        self.track = track
+        self.deferred: dict[str, float] = {}
+        self.kept: set[str] = set()  # 本轮处理失败或无数据，留在 sync_deferred
+
+    def schedule(self, codes: Iterable[str]) -> Any:
+        if not self.track:
+            return codes
+        return _Scheduled(self, codes)
+
+    def _iterate(self, codes: Iterable[str]) -> Iterator[str]:
+        done: list[str] = []
+        try:
+            for code in codes:
+                if (
+                    self.deadline is not None
+                    and self.rank.get(code, 0) >= self.keep
+                    and datetime.now() >= self.deadline
+                ):
+                    self.deferred[code] = self.scores.get(code, 0.0)
+                    continue
+                yield code
+                # 调用方处理本股票时抛出异常会在 yield 处关闭生成器，不会走到这里
+                if code not in self.kept:
+                    done.append(code)
+        finally:
+            if self.deferred:
+                logger.warning(
+                    "⏰ 已过截止时间 %s，%s 只低优先级股票推迟到补跑: %s",
+                    self.deadline.strftime("%H:%M"),
+                    len(self.deferred),
+                    ", ".join(list(self.deferred)[:20]),
+                )
+            save_deferred(self.engine, self.job, done, self.deferred)
+
+
+class _Scheduled:
+    def __init__(self, plan: PriorityPlan, codes: Iterable[str]) -> None:
+        self.plan = plan
+        self.codes = codes
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def keep(self, code: str) -> None:
+        self.plan.kept.add(code)
+
+    def fail(self, code: str) -> None:
+        self.keep(code)
+        fail = getattr(self.codes, "fail", None)  # 任务队列模式
+        if fail is not None:
+            fail(code)
+
+    def __iter__(self) -> Iterator[str]:
+        return self.plan._iterate(self.codes)
+
+
+def keep_deferred(codes: Any, code: str) -> None:
+    """遍历 plan.schedule() 的结果时标记某只股票本轮没有拿到数据，不把它移出 sync_deferred；普通列表什么都不做。"""
+    keep = getattr(codes, "keep", None)
+    if keep is not None:
+        keep(code)
+
+
+def prioritize(
+    engine: Any, args: argparse.Namespace, job: str, codes: Sequence[str], table: str = "stock_daily"
+) -> PriorityPlan:
+    """未指定 --priority/--deadline/--catch-up 时保持原顺序；否则按得分排序，--catch-up 只保留被推迟的股票。"""
+    enabled = getattr(args, "priority", False) or getattr(args, "deadline", None) or getattr(args, "catch_up", False)
+    if not enabled or engine is None:
+        return PriorityPlan(engine, job, list(codes), {})
+
+    if args.catch_up:
+        deferred = load_deferred(engine, job)
+        codes = [code for code in codes if code in deferred]
+        logger.info("补跑 %s 上次推迟的 %s 只股票", job, len(codes))
+
+    scores = score_codes(engine, codes, args.priority_weights, load_watchlist(args.watchlist), table)
+    order = {code: index for index, code in enumerate(codes)}
+    ranked = sorted(codes, key=lambda code: (-scores[code], order[code]))
+    logger.info("按优先级排序 %s 只股票，前 10: %s", len(ranked), ", ".join(ranked[:10]))
+    deadline = None if args.catch_up else args.deadline
+    return PriorityPlan(engine, job, ranked, scores, deadline, args.keep_top, track=True)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""同步任务的性能剖析：cProfile 统计、折叠栈（火焰图输入）与 tracemalloc 内存快照。"""
+
+from __future__ import annotations
+
+import argparse
+import cProfile
+import logging
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, Sequence, TypeVar
+
+PROFILE_ROOT = Path("./logs/profiles")
+SAMPLE_INTERVAL = 0.005  # 折叠栈采样间隔（秒）
+TRACEMALLOC_FRAMES = 8
+TRACEMALLOC_TOP_N = 30
+CPROFILE_TOP_N = 60
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="开启性能剖析，结果写入 ./logs/profiles/<job>-<时间戳>",
+    )
+    parser.add_argument(
+        "--profile-limit",
+        type=int,
+        default=0,
+        help="剖析时只处理前 N 只股票，便于快速采样；0 表示不限制",
+    )
+
+
+def profile_limit(args: argparse.Namespace) -> int:
+    """生效的 --profile-limit：只在 --profile 开启时生效，否则返回 0 并提示被忽略。"""
+    limit = getattr(args, "profile_limit", 0) or 0
+    if limit > 0 and not getattr(args, "profile", False):
+        logger.warning("--profile-limit=%s 仅在 --profile 开启时生效，本次不限制股票数", limit)
+        return 0
+    return max(limit, 0)
+
+
+def limit_codes(codes: Sequence[T], args: argparse.Namespace) -> list[T]:
+    """按生效的 --profile-limit 截断待处理的代码列表。"""
+    limit = profile_limit(args)
+    if limit > 0 and len(codes) > limit:
+        logger.info("--profile-limit=%s，仅处理前 %s/%s 只股票", limit, limit, len(codes))
+        return list(codes[:limit])
+    return list(codes)
+
+
+class StackSampler:
+    """后台线程定时采样目标线程的调用栈，输出 Brendan Gregg 折叠栈格式。"""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def write(self, path: Path) -> None:
+        with path.open("w", encoding="utf-8") as handle:
+            for stack, count in self.stacks.most_common():
+                handle.write(f"{stack} {count}\n")
+
+
+def write_tracemalloc_report(snapshot: tracemalloc.Snapshot, path: Path, top_n: int) -> None:
+    snapshot = snapshot.filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        )
+    )
+    current, peak = tracemalloc.get_traced_memory()
+    with path.open("w", encoding="utf-8") as handle:
+        handle.write(f"current={current / 1024 / 1024:.1f} MiB peak={peak / 1024 / 1024:.1f} MiB\n\n")
+        handle.write(f"Top {top_n} 分配（按行）:\n")
+        for stat in snapshot.statistics("lineno")[:top_n]:
+            handle.write(f"{stat}\n")
+        handle.write(f"\nTop {top_n} 分配（按调用栈）:\n")
+        for stat in snapshot.statistics("traceback")[:top_n]:
+            handle.write(f"\n{stat}\n")
+            for line in stat.traceback.format():
+                handle.write(f"{line}\n")
+
+
+@contextmanager
+def profile_run(job: str, args: argparse.Namespace) -> Iterator[Path | None]:
+    """在 --profile 开启时对包裹的代码块做 CPU/内存剖析，未开启时不做任何事。"""
+    if not getattr(args, "profile", False):
+        yield None
+        return
+
+    output_dir = PROFILE_ROOT / f"{job}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    logger.info("性能剖析已开启，输出目录 %s", output_dir)
+
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    sampler = StackSampler(threading.get_ident())
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    sampler.start()
+    profiler.enable()
+    try:
+        yield output_dir
+    finally:
+        profiler.disable()
+        sampler.stop()
+        elapsed = time.perf_counter() - started
+        snapshot = tracemalloc.take_snapshot()
+        write_tracemalloc_report(snapshot, output_dir / "tracemalloc.txt", TRACEMALLOC_TOP_N)
+        tracemalloc.stop()
+
+        profiler.dump_stats(output_dir / "cprofile.prof")
+        with (output_dir / "cprofile.txt").open("w", encoding="utf-8") as handle:
+            stats = pstats.Stats(profiler, stream=handle)
+            stats.sort_stats("cumulative").print_stats(CPROFILE_TOP_N)
+            stats.sort_stats("tottime").print_stats(CPROFILE_TOP_N)
+        sampler.write(output_dir / "stacks.collapsed")
+        logger.info(
+            "性能剖析完成，耗时 %.1fs，采样 %s 次，结果见 %s",
+            elapsed,
+            sum(sampler.stacks.values()),
+            output_dir,
+        )
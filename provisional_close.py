@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""收盘后用腾讯批量行情快速写入当日临时日线。
+
+Baostock 日线晚上才发布，sync_daily.sync_latest 又是每只股票一个请求。腾讯行情接口
+qt.gtimg.cn 一个请求可以查询几十只股票（q=sh600000,sz000001,...），全市场只需一百来个请求。
+本任务在收盘后拉取全部股票的开高低收、成交量、成交额、换手率，写入 stock_daily 并置
+provisional = 1：
+
+* 库中已有 Baostock 确认过的同日 K 线（provisional = 0）时不覆盖；
+* get_latest 忽略临时行，之后的 Baostock 日线同步仍会拉取这一天，写入时把 provisional 清零，
+  即确认或覆盖临时收盘；
+* 行情时间不是目标交易日的股票（停牌、非交易日）跳过。
+
+    python provisional_close.py                  # 15:20 后执行
+    python provisional_close.py --dry-run --batch-size 80
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import re
+import time
+from datetime import datetime
+from typing import Any, Sequence
+from urllib.request import Request, urlopen
+
+from common import CODE_CSV_PATH, build_engine, exclusive_run, setup_logging
+from db_writer import ensure_tag_columns, ensure_write_version_table, touch_write_versions, version_keys
+from fetch_intraday_one import HEADERS, MAX_RETRIES, REQUEST_TIMEOUT, get_market_prefix, to_float
+from fingerprint import ensure_fingerprint_table, month_keys, refresh_fingerprints
+from profiling import add_profile_arguments, limit_codes, profile_run
+from sync_intraday import load_codes
+
+logger = logging.getLogger(__name__)
+
+TENCENT_QT_URL = "https://qt.gtimg.cn/q="
+SOURCE_NAME = "tencent_qt"
+DEFAULT_BATCH_SIZE = 60
+QUOTE_RE = re.compile(r'v_(\w+)="([^"]*)"')
+
+# qt 接口以 ~ 分隔的字段下标
+F_NAME, F_PRICE, F_PRECLOSE, F_OPEN = 1, 3, 4, 5
+F_TIME, F_PCT_CHG, F_HIGH, F_LOW = 30, 32, 33, 34
+F_VOLUME_HAND, F_AMOUNT_WAN, F_TURNOVER_PCT = 36, 37, 38
+MIN_FIELDS = F_TURNOVER_PCT + 1
+
+COLUMNS = (
+    "code", "date", "open", "high", "low", "close", "preclose", "volume", "amount",
+    "adjustflag", "turn", "tradestatus", "pctChg", "isST", "provisional", "source",
+)
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="腾讯批量行情写入当日临时日线（provisional = 1）")
+    parser.add_argument("--code-csv", default=CODE_CSV_PATH, help="股票代码 CSV")
+    parser.add_argument("--date", default=None, help="目标交易日 YYYY-MM-DD，默认今天；行情时间不符的股票跳过")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="每个请求查询的股票数")
+    parser.add_argument("--raw", action="store_true", help="写入不复权表 stock_daily_raw")
+    parser.add_argument("--dry-run", action="store_true", help="只拉取与解析，不写库")
+    add_profile_arguments(parser)
+    return parser.parse_args()
+
+
+def fetch_quotes(codes: Sequence[str]) -> dict[str, list[str]]:
+    """一次请求查询多只股票，返回 {6位代码: 字段列表}；未知代码不出现在结果中。"""
+    url = TENCENT_QT_URL + ",".join(f"{get_market_prefix(code)}{code}" for code in codes)
+    last_error = None
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            with urlopen(Request(url, headers=HEADERS), timeout=REQUEST_TIMEOUT) as resp:
+                body = resp.read().decode("gbk", errors="replace")
+            break
+        except Exception as exc:  # noqa: BLE001
+            last_error = exc
+            if attempt == MAX_RETRIES:
+                raise RuntimeError(f"腾讯行情请求失败: {len(codes)} 只股票") from last_error
+            time.sleep(0.6 * attempt)
+
+    quotes = {}
+    for symbol, payload in QUOTE_RE.findall(body):
+        fields = payload.split("~")
+        if len(fields) >= MIN_FIELDS and symbol[-6:].isdigit():
+            quotes[symbol[-6:]] = fields
+    return quotes
+
+
+def to_row(code: str, fields: list[str], target_date: str, adjustflag: int) -> tuple | None:
+    """转换为 stock_daily 的一行；行情不属于目标交易日或当日未成交时返回 None。"""
+    quote_time = fields[F_TIME]
+    if len(quote_time) < 8 or f"{quote_time[:4]}-{quote_time[4:6]}-{quote_time[6:8]}" != target_date:
+        return None
+    open_price = to_float(fields[F_OPEN])
+    volume_hand = to_float(fields[F_VOLUME_HAND])
+    if not open_price or not volume_hand:
+        return None  # 停牌
+    amount_wan = to_float(fields[F_AMOUNT_WAN])
+    return (
+        code,
+        target_date,
+        open_price,
+        to_float(fields[F_HIGH]),
+        to_float(fields[F_LOW]),
+        to_float(fields[F_PRICE]),
+        to_float(fields[F_PRECLOSE]),
+        int(volume_hand * 100),
+        round(amount_wan * 10000, 2) if amount_wan is not None else None,
+        adjustflag,
+        to_float(fields[F_TURNOVER_PCT]),  # 与 Baostock 的 turn 相同，单位为 %
+        1,
+        to_float(fields[F_PCT_CHG]),
+        1 if "ST" in fields[F_NAME].upper() else 0,
+        1,
+        SOURCE_NAME,
+    )
+
+
+def build_provisional_sql(table: str) -> str:
+    """只插入新行或更新仍为临时状态的行，Baostock 已确认的 K 线保持不变。"""
+    cols = ", ".join(f"`{col}`" for col in COLUMNS)
+    placeholders = ", ".join(["%s"] * len(COLUMNS))
+    updates = ", ".join(
+        f"`{col}` = IF(`provisional` = 1, VALUES(`{col}`), `{col}`)"
+        for col in COLUMNS
+        if col not in ("code", "date", "provisional")
+    )
+    return f"INSERT INTO `{table}` ({cols}) VALUES ({placeholders}) ON DUPLICATE KEY UPDATE {updates}"
+
+
+def write_provisional(engine: Any, table: str, rows: list[tuple]) -> None:
+    if not rows:
+        return
+    ensure_write_version_table(engine)
+    ensure_fingerprint_table(engine, table)
+    ensure_tag_columns(engine, table)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(build_provisional_sql(table), rows)
+        touch_write_versions(conn, table, version_keys(COLUMNS, rows, "date"))
+        refresh_fingerprints(conn, table, month_keys(COLUMNS, rows, "date"))
+
+
+def count_unconfirmed(engine: Any, table: str, before: str) -> int:
+    """早于 before 仍未被 Baostock 确认的临时行数。"""
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        return int(
+            conn.execute(
+                text(f"SELECT COUNT(*) FROM `{table}` WHERE `provisional` = 1 AND `date` < :d"), {"d": before}
+            ).scalar()
+        )
+
+
+def run(args: argparse.Namespace) -> None:
+    if args.batch_size < 1:
+        raise SystemExit("--batch-size 至少为 1")
+    target_date = args.date or datetime.now().strftime("%Y-%m-%d")
+    table = "stock_daily_raw" if args.raw else "stock_daily"
+    adjustflag = 3 if args.raw else 2  # 当日前复权价即原始价
+    codes = limit_codes(load_codes(args.code_csv), args)
+    if not codes:
+        logger.warning("⚠️ 未加载到任何股票代码，请检查 %s", args.code_csv)
+        return
+    engine = None if args.dry_run else (getattr(args, "engine", None) or build_engine())
+
+    started = time.monotonic()
+    written = skipped = failed = 0
+    for offset in range(0, len(codes), args.batch_size):
+        batch = codes[offset: offset + args.batch_size]
+        try:
+            quotes = fetch_quotes(batch)
+        except RuntimeError as exc:
+            logger.warning("%s，跳过 %s~%s", exc, batch[0], batch[-1])
+            failed += len(batch)
+            continue
+        rows = [to_row(code, quotes[code], target_date, adjustflag) for code in batch if code in quotes]
+        rows = [row for row in rows if row is not None]
+        skipped += len(batch) - len(rows)
+        if engine is not None:
+            write_provisional(engine, table, rows)
+        written += len(rows)
+        logger.info("临时收盘 %s/%s：本批写入 %s 只", min(offset + len(batch), len(codes)), len(codes), len(rows))
+        time.sleep(random.uniform(0.2, 0.5))
+
+    logger.info(
+        "✅ %s 临时收盘完成：写入 %s 只，停牌/无行情 %s 只，请求失败 %s 只，用时 %.1fs",
+        target_date, written, skipped, failed, time.monotonic() - started,
+    )
+    if engine is not None:
+        stale = count_unconfirmed(engine, table, target_date)
+        if stale:
+            logger.warning("⚠️ %s 中有 %s 条早于 %s 的临时 K 线尚未被 Baostock 确认", table, stale, target_date)
+
+
+def main() -> None:
+    args = parse_arguments()
+    setup_logging("provisional_close.log")
+    with exclusive_run("provisional_close", args), profile_run("provisional_close", args):
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
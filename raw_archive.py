@@ -0,0 +1,127 @@
+"""上游原始响应归档与重放。
+
+改了 parse_trends、parse_ths_concept_page 或 Baostock 的数值转换后，以前只能重新抓取几个小时。
+开启 --archive 后，各抓取函数把解析前的原始数据追加写入按日期分区的 gzip JSON Lines 文件：
+
+    <DIR>/<YYYY-MM-DD>/<来源>-<主机>-<pid>.jsonl.gz
+
+来源包括 baostock（rs.fields + get_row_data() 原始字符串行）、tencent_mkline（分时 JSONP 原文）、
+ths_concept（F10 概念页 HTML）。每个进程写自己的文件，多容器同时归档互不干扰；
+进程崩溃只会截断最后一个压缩块，重放时跳过并告警。
+
+--replay <DIR> 让各同步入口读取 DIR（某一天的分区或整个归档根目录）下的归档，按当前代码的
+解析/写库流程重新处理，不访问网络、不登录 Baostock，也不做请求间隔。
+
+    python sync_daily.py --archive                   # 归档到 RAW_ARCHIVE_DIR（默认 ./archive）
+    python sync_daily.py --replay ./archive/2024-12-06
+    python sync_intraday.py --replay ./archive --date 2024-12-06
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_ROOT = os.getenv("RAW_ARCHIVE_DIR", "./archive")
+
+
+class RawArchive:
+    """按 (来源, 日期) 各保持一个 gzip 文件句柄追加写入，线程安全。"""
+
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+        self.worker = f"{socket.gethostname()}-{os.getpid()}"
+        self.records = 0
+        self._files: dict[tuple[str, str], Any] = {}
+        self._lock = threading.Lock()
+
+    def _handle(self, source: str, day: str) -> Any:
+        handle = self._files.get((source, day))
+        if handle is None:
+            directory = self.root / day
+            directory.mkdir(parents=True, exist_ok=True)
+            handle = gzip.open(directory / f"{source}-{self.worker}.jsonl.gz", "at", encoding="utf-8")
+            self._files[(source, day)] = handle
+        return handle
+
+    def record(self, source: str, payload: dict) -> None:
+        line = json.dumps({"ts": round(time.time(), 3), **payload}, ensure_ascii=False)
+        with self._lock:
+            self._handle(source, date.today().isoformat()).write(line + "\n")
+            self.records += 1
+
+    def close(self) -> None:
+        with self._lock:
+            for handle in self._files.values():
+                handle.close()
+            self._files.clear()
+        logger.info("原始响应归档 %s 条，目录 %s", self.records, self.root)
+
+
+_active: Optional[RawArchive] = None
+
+
+def record(source: str, **payload: Any) -> None:
+    """未开启归档时什么都不做；抓取函数在解析之前调用。"""
+    if _active is not None:
+        _active.record(source, payload)
+
+
+@contextmanager
+def archiving(args: argparse.Namespace) -> Iterator[None]:
+    """按 --archive 开启归档，退出时关闭文件；参数缺失或未开启时不做任何事。"""
+    global _active
+    root = getattr(args, "archive", None)
+    if not root or _active is not None:
+        yield
+        return
+    _active = RawArchive(root)
+    try:
+        yield
+    finally:
+        archive, _active = _active, None
+        archive.close()
+
+
+def iter_records(path: str | Path, source: str) -> Iterator[dict]:
+    """按日期、文件名顺序读出某个来源的全部归档记录，后写的记录排在后面。"""
+    files = sorted(Path(path).rglob(f"{source}-*.jsonl.gz"))
+    if not files:
+        logger.warning("%s 下没有 %s 的归档文件", path, source)
+    for file in files:
+        count = 0
+        try:
+            with gzip.open(file, "rt", encoding="utf-8") as handle:
+                for line in handle:
+                    if line.strip():
+                        count += 1
+                        yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile, zlib.error, json.JSONDecodeError) as exc:
+            logger.warning("归档文件 %s 在第 %s 条之后损坏或被截断，跳过剩余部分: %s", file, count, exc)
+        logger.info("已重放 %s：%s 条", file, count)
+
+
+def add_archive_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "--archive",
+        nargs="?",
+        const=ARCHIVE_ROOT,
+        default=None,
+        metavar="DIR",
+        help=f"把上游原始响应按日期归档到 DIR（默认 {ARCHIVE_ROOT}）",
+    )
+    group.add_argument("--replay", metavar="DIR", default=None, help="不访问网络，按当前解析逻辑重放 DIR 下的归档并写库")
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""常驻调度进程：替代外部 docker exec 冷启动各同步脚本。
+
+* 交易日历感知：日历来自 trade_calendar 表（backfill_planner 维护，当年缺失时自动从 Baostock 补齐），
+  表不可用时退化为周一至周五；
+* 任务依赖：如周线只在当天日线成功后运行；
+* 每个任务运行期间持有 MySQL 咨询锁 GET_LOCK('stock_sync:<脚本>')（common.job_lock），
+  各脚本的 main() 手工执行时也持有同一把锁（common.exclusive_run），手工执行、另一个调度进程
+  与本进程不会同时运行同一个脚本；
+* 进程常驻：pandas / SQLAlchemy / baostock 只导入一次，所有任务共用同一个连接池；
+* 运行记录写入 sync_job_run，进程重启后不会重复执行当天已成功的任务，失败任务按间隔重试。
+
+Baostock 会话仍由各任务自己登录/登出：它们依赖 logout+login 从会话超时中恢复，跨任务复用同一会话反而更脆弱。
+
+    python scheduler.py                 # 常驻运行
+    python scheduler.py --list          # 查看今天的计划
+    python scheduler.py --run daily     # 立即执行某个任务（仍受咨询锁保护）
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib
+import logging
+import signal
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Callable
+
+from baostock_deadline import STATS as BAOSTOCK_STATS
+from common import build_engine, job_lock, setup_logging
+from raw_archive import archiving
+
+POLL_SECONDS = 30
+MAX_ATTEMPTS = 3
+RETRY_DELAY = timedelta(minutes=10)
+
+logger = logging.getLogger("scheduler")
+
+CREATE_JOB_RUN_SQL = """
+CREATE TABLE IF NOT EXISTS `sync_job_run` (
+  `job` VARCHAR(32) NOT NULL,
+  `run_date` DATE NOT NULL COMMENT '调度所属交易日',
+  `status` VARCHAR(16) NOT NULL COMMENT 'running/success/failed',
+  `attempts` INT NOT NULL DEFAULT 0,
+  `started_at` DATETIME DEFAULT NULL,
+  `finished_at` DATETIME DEFAULT NULL,
+  `message` VARCHAR(512) DEFAULT NULL,
+  PRIMARY KEY (`job`, `run_date`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+
+class TradingCalendar:
+    """按年缓存交易日集合。"""
+
+    def __init__(self, engine: Any) -> None:
+        self.engine = engine
+        self._years: dict[int, set[date]] = {}
+
+    def _load_year(self, year: int) -> set[date]:
+        from sqlalchemy import text
+
+        query = text(
+            "SELECT `calendar_date` FROM `trade_calendar` "
+            "WHERE `is_trading_day` = 1 AND `calendar_date` BETWEEN :s AND :e"
+        )
+        params = {"s": f"{year}-01-01", "e": f"{year}-12-31"}
+        try:
+            with self.engine.connect() as conn:
+                days = {row[0] for row in conn.execute(query, params)}
+            if not days:
+                self._refresh_year(year)
+                with self.engine.connect() as conn:
+                    days = {row[0] for row in conn.execute(query, params)}
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("交易日历 %s 加载失败，按工作日处理: %s", year, exc)
+            days = set()
+        if not days:
+            start = date(year, 1, 1)
+            days = {start + timedelta(days=i) for i in range(366) if (start + timedelta(days=i)).year == year}
+            days = {day for day in days if day.weekday() < 5}
+        return days
+
+    def _refresh_year(self, year: int) -> None:
+        import baostock as bs
+
+        from backfill_planner import ensure_reference_tables, refresh_trade_calendar
+
+        ensure_reference_tables(self.engine)
+        lg = bs.login()
+        if lg.error_code != '0':
+            raise RuntimeError(f"Baostock login failed: {lg.error_msg}")
+        try:
+            count = refresh_trade_calendar(self.engine, f"{year}-01-01", f"{year}-12-31")
+        finally:
+            bs.logout()
+        logger.info("已从 Baostock 补齐 %s 年交易日历 %s 天", year, count)
+
+    def trading_days(self, year: int) -> set[date]:
+        if year not in self._years:
+            self._years[year] = self._load_year(year)
+        return self._years[year]
+
+    def is_trading_day(self, day: date) -> bool:
+        return day in self.trading_days(day.year)
+
+    def is_last_of_week(self, day: date) -> bool:
+        if not self.is_trading_day(day):
+            return False
+        rest = (day + timedelta(days=offset) for offset in range(1, 7 - day.weekday()))
+        return not any(self.is_trading_day(other) for other in rest)
+
+    def is_first_of_month(self, day: date) -> bool:
+        if not self.is_trading_day(day):
+            return False
+        return not any(self.is_trading_day(date(day.year, day.month, d)) for d in range(1, day.day))
+
+
+@dataclass
+class JobSpec:
+    name: str
+    module: str
+    at: str  # HH:MM，当天到点后才运行
+    when: Callable[[TradingCalendar, date], bool]
+    argv: list[str] = field(default_factory=list)
+    after: tuple[str, ...] = ()
+    parser: str = "parse_arguments"
+    entry: str = "run"
+
+
+JOBS = [
+    JobSpec("intraday", "sync_intraday", "15:10", TradingCalendar.is_trading_day),
+    # 腾讯批量行情先写入临时收盘，日线同步时由 Baostock 确认
+    JobSpec("provisional", "provisional_close", "15:20", TradingCalendar.is_trading_day),
+    # Baostock 日线约 17:30 后更新完毕；按优先级同步，19:00 后只保留前 20%，其余由 daily-catchup 补跑
+    JobSpec("daily", "sync_daily", "17:40", TradingCalendar.is_trading_day, argv=["--priority", "--deadline", "19:00"]),
+    JobSpec("daily-catchup", "sync_daily", "21:00", TradingCalendar.is_trading_day, argv=["--catch-up"], after=("daily",)),
+    JobSpec("weekly", "sync_weekly", "18:00", TradingCalendar.is_last_of_week, after=("daily",)),
+    JobSpec(
+        "themes",
+        "ths_f10_theme_sync",
+        "20:00",
+        TradingCalendar.is_first_of_month,
+        parser="parse_args",
+        entry="sync_themes",
+    ),
+]
+JOBS_BY_NAME = {job.name: job for job in JOBS}
+
+
+def parse_job_args(module: Any, spec: JobSpec) -> argparse.Namespace:
+    """复用各脚本自己的参数解析，保证默认值与命令行运行一致。"""
+    saved = sys.argv
+    sys.argv = [f"{spec.module}.py", *spec.argv]
+    try:
+        return getattr(module, spec.parser)()
+    finally:
+        sys.argv = saved
+
+
+class Scheduler:
+    def __init__(self, engine: Any, jobs: list[JobSpec]) -> None:
+        from sqlalchemy import text
+
+        self.engine = engine
+        self.jobs = jobs
+        self.calendar = TradingCalendar(engine)
+        self.stopping = False
+        with engine.begin() as conn:
+            conn.execute(text(CREATE_JOB_RUN_SQL))
+
+    def job_state(self, name: str, run_date: date) -> tuple[str | None, int, datetime | None]:
+        from sqlalchemy import text
+
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text("SELECT `status`, `attempts`, `finished_at` FROM `sync_job_run` WHERE `job` = :j AND `run_date` = :d"),
+                {"j": name, "d": run_date},
+            ).fetchone()
+        return (row[0], int(row[1]), row[2]) if row else (None, 0, None)
+
+    def record(self, name: str, run_date: date, status: str, message: str | None = None) -> None:
+        from sqlalchemy import text
+
+        if status == "running":
+            sql = """
+                INSERT INTO `sync_job_run` (`job`, `run_date`, `status`, `attempts`, `started_at`)
+                VALUES (:j, :d, 'running', 1, NOW())
+                ON DUPLICATE KEY UPDATE `status` = 'running', `attempts` = `attempts` + 1,
+                    `started_at` = NOW(), `finished_at` = NULL, `message` = NULL
+            """
+        else:
+            sql = """
+                UPDATE `sync_job_run` SET `status` = :s, `finished_at` = NOW(), `message` = :m
+                WHERE `job` = :j AND `run_date` = :d
+            """
+        with self.engine.begin() as conn:
+            conn.execute(text(sql), {"j": name, "d": run_date, "s": status, "m": (message or "")[:512]})
+
+    def is_due(self, spec: JobSpec, now: datetime) -> bool:
+        today = now.date()
+        if now.strftime("%H:%M") < spec.at or not spec.when(self.calendar, today):
+            return False
+        status, attempts, finished_at = self.job_state(spec.name, today)
+        if status == "success" or attempts >= MAX_ATTEMPTS:
+            return False
+        if status == "failed" and finished_at and now - finished_at < RETRY_DELAY:
+            return False
+        return all(self.job_state(dep, today)[0] == "success" for dep in spec.after)
+
+    def run_job(self, spec: JobSpec, run_date: date) -> bool:
+        with job_lock(self.engine, spec.module) as acquired:
+            if not acquired:
+                logger.warning("任务 %s 正在其他进程中运行，跳过本轮", spec.name)
+                return False
+            self.record(spec.name, run_date, "running")
+            started = time.monotonic()
+            BAOSTOCK_STATS.reset()
+            logger.info("▶ 开始任务 %s", spec.name)
+            try:
+                module = importlib.import_module(spec.module)
+                args = parse_job_args(module, spec)
+                args.engine = self.engine  # 复用常驻连接池
+                with archiving(args):  # argv 带 --archive 的任务同样归档原始响应
+                    result = getattr(module, spec.entry)(args)
+                if result is False:
+                    # sync_daily / sync_weekly 在内部捕获异常、登录失败时直接返回，只能靠返回值判断
+                    raise RuntimeError(f"{spec.module}.{spec.entry} 返回失败，详见任务日志")
+            except (Exception, SystemExit) as exc:  # noqa: BLE001
+                logger.exception("✖ 任务 %s 失败", spec.name)
+                self.record(spec.name, run_date, "failed", f"{type(exc).__name__}: {exc}")
+                return False
+            summary = BAOSTOCK_STATS.summary() if BAOSTOCK_STATS.calls or BAOSTOCK_STATS.messages else None
+            self.record(spec.name, run_date, "success", summary)
+            logger.info("✔ 任务 %s 完成，用时 %.0fs", spec.name, time.monotonic() - started)
+            return True
+
+    def run_pending(self) -> None:
+        for spec in self.jobs:
+            if self.stopping:
+                return
+            now = datetime.now()
+            if self.is_due(spec, now):
+                self.run_job(spec, now.date())
+
+    def describe(self, day: date) -> None:
+        for spec in self.jobs:
+            scheduled = spec.when(self.calendar, day)
+            status, attempts, _ = self.job_state(spec.name, day)
+            deps = f"，依赖 {', '.join(spec.after)}" if spec.after else ""
+            print(
+                f"{spec.name:10s} {spec.at}  {'今日执行' if scheduled else '今日不执行'}{deps}"
+                f"  状态: {status or '-'}（{attempts} 次）"
+            )
+
+    def serve(self) -> None:
+        logger.info("调度进程启动，任务: %s", ", ".join(f"{job.name}@{job.at}" for job in self.jobs))
+        while not self.stopping:
+            try:
+                self.run_pending()
+            except Exception:  # noqa: BLE001
+                logger.exception("调度轮询异常")
+            for _ in range(POLL_SECONDS):
+                if self.stopping:
+                    break
+                time.sleep(1)
+        logger.info("调度进程退出")
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="常驻调度：按交易日历运行各同步任务")
+    parser.add_argument("--list", action="store_true", help="打印今天的任务计划后退出")
+    parser.add_argument("--run", choices=sorted(JOBS_BY_NAME), help="立即执行指定任务后退出")
+    parser.add_argument("--once", action="store_true", help="只检查并执行一轮到期任务后退出")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_arguments()
+    setup_logging("scheduler.log", fmt="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    scheduler = Scheduler(build_engine(pool_recycle=3600), JOBS)
+
+    if args.list:
+        scheduler.describe(date.today())
+        return
+    if args.run:
+        ok = scheduler.run_job(JOBS_BY_NAME[args.run], date.today())
+        raise SystemExit(0 if ok else 1)
+    if args.once:
+        scheduler.run_pending()
+        return
+
+    def stop(signum, _frame):
+        logger.info("收到信号 %s，当前任务结束后退出", signum)
+        scheduler.stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    scheduler.serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""统一入口：stock-sync <子命令> [参数...]。
+
+子命令表只记录模块名，选中后才 import 对应模块并调用其 main()，参数原样转交，
+因此 `--help`、`fetch-intraday` 这类轻命令不会导入 pandas / baostock / SQLAlchemy。
+
+    alias stock-sync="python stock_sync_cli.py"
+    stock-sync daily --date 2024-12-07
+    stock-sync fetch-intraday 600000 --date 2024-12-06
+    stock-sync --import-profile daily --help     # 按模块统计导入耗时（基于 python -X importtime）
+"""
+
+from __future__ import annotations
+
+import importlib
+import re
+import subprocess
+import sys
+import time
+from typing import NamedTuple, Sequence
+
+
+class Command(NamedTuple):
+    module: str
+    help: str
+
+
+COMMANDS: dict[str, Command] = {
+    "full": Command("sync_to_mysql", "全量/增量同步日线与周线"),
+    "daily": Command("sync_daily", "日线增量同步"),
+    "weekly": Command("sync_weekly", "周线增量同步"),
+    "intraday": Command("sync_intraday", "腾讯 1 分钟分时同步"),
+    "provisional": Command("provisional_close", "腾讯批量行情写入当日临时日线"),
+    "minute": Command("sync_minute", "Baostock 5/15/30/60 分钟线同步"),
+    "themes": Command("ths_f10_theme_sync", "同花顺 F10 概念题材同步"),
+    "scheduler": Command("scheduler", "常驻调度进程"),
+    "backfill": Command("backfill_planner", "日线缺口规划与补数"),
+    "check-intraday": Command("intraday_checker", "分时完整性检查与补数"),
+    "bootstrap": Command("bootstrap_load", "LOAD DATA 新库初始化"),
+    "mirror": Command("parquet_mirror", "MySQL -> Parquet 镜像导出"),
+    "retention": Command("intraday_retention", "分时分区维护与归档"),
+    "migrate-pk": Command("migrate_clustered_pk", "日线/周线聚簇主键迁移"),
+    "fetch-intraday": Command("fetch_intraday_one", "获取单只股票某日分时到 CSV"),
+    "filter-code": Command("filter_code", "按条件筛选股票代码"),
+    "fingerprint": Command("fingerprint", "重建 (代码, 月) 指纹表"),
+    "indicators": Command("indicators", "技术指标表增量维护/重算"),
+}
+
+IMPORT_TIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+PROFILE_TOP = 15
+
+
+def print_usage() -> None:
+    print("用法: stock-sync [--import-profile] <子命令> [参数...]\n\n子命令:")
+    width = max(len(name) for name in COMMANDS)
+    for name, command in COMMANDS.items():
+        print(f"  {name:<{width}}  {command.help}（{command.module}.py）")
+    print("\n子命令的参数见 stock-sync <子命令> --help")
+
+
+def dispatch(name: str, argv: Sequence[str]) -> None:
+    command = COMMANDS[name]
+    module = importlib.import_module(command.module)
+    sys.argv = [f"{command.module}.py", *argv]
+    module.main()
+
+
+def import_profile(argv: Sequence[str]) -> int:
+    """在 -X importtime 下重新运行同一条命令，汇总各顶层包的导入耗时。"""
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", __file__, *argv],
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    elapsed = time.perf_counter() - started
+
+    packages: dict[str, list[int]] = {}
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        match = IMPORT_TIME_RE.match(line)
+        if match is None:
+            if not line.startswith("import time:"):
+                print(line, file=sys.stderr)
+            continue
+        self_us, cumulative_us, indent, module = int(match[1]), int(match[2]), match[3], match[4]
+        package = module.split(".")[0]
+        stats = packages.setdefault(package, [0, 0])
+        stats[0] += self_us
+        if len(indent) == 1:  # 只累计顶层 import 的 cumulative，避免嵌套重复计数
+            stats[1] += cumulative_us
+            total_us += cumulative_us
+
+    print(f"\n命令总耗时 {elapsed * 1000:.0f} ms，其中导入 {total_us / 1000:.0f} ms", file=sys.stderr)
+    print(f"{'包':<24}{'self ms':>10}{'cumulative ms':>16}", file=sys.stderr)
+    ranked = sorted(packages.items(), key=lambda item: (item[1][1], item[1][0]), reverse=True)
+    for package, (self_us, cumulative_us) in ranked[:PROFILE_TOP]:
+        print(f"{package:<24}{self_us / 1000:>10.1f}{cumulative_us / 1000:>16.1f}", file=sys.stderr)
+    return proc.returncode
+
+
+def main() -> None:
+    argv = sys.argv[1:]
+    if argv and argv[0] == "--import-profile":
+        raise SystemExit(import_profile(argv[1:]))
+    if not argv or argv[0] in ("-h", "--help"):
+        print_usage()
+        return
+    name, rest = argv[0], argv[1:]
+    if name not in COMMANDS:
+        print(f"未知子命令: {name}\n", file=sys.stderr)
+        print_usage()
+        raise SystemExit(2)
+    dispatch(name, rest)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,24 @@
 # sync_daily.py
-import os
-import sys
 import time
 import logging
 import argparse
-import pandas as pd
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, text
-import baostock as bs
-from sync_to_mysql import fetch_baostock_data, upsert, get_latest
+from baostock_deadline import log_stats, login, logout
+from common import CODE_CSV_PATH, build_engine, exclusive_run, lazy_import, setup_logging
+from sync_to_mysql import fetch_baostock_data, fetch_baostock_rows, get_latest, replay_baostock
+from daily_sources import add_source_arguments, build_fetcher
+from db_writer import add_group_commit_arguments, open_writer, write_rows
+from indicators import update_indicators
+from priority import add_priority_arguments, keep_deferred, prioritize
+from profiling import add_profile_arguments, limit_codes, profile_run
+from raw_archive import add_archive_arguments, archiving
+from task_queue import add_queue_arguments, queue_codes
+from adjust_factor import ensure_raw_tables, get_prev_close, has_ex_rights_rows, sync_adjust_factors
+from corporate_action import detect_corporate_action, enqueue_resync, ensure_resync_queue, process_resync_queue
 
-# ================== 配置 ==================
-MYSQL_USER = os.getenv("MYSQL_USER", "root")
-MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "InsightOne123456")
-MYSQL_HOST = os.getenv("MYSQL_HOST", "127.0.0.1")
-MYSQL_PORT = os.getenv("MYSQL_PORT", "3306")
-MYSQL_DB = os.getenv("MYSQL_DB", "stock_db_qfq")
-CODE_CSV_PATH = os.getenv("CODE_CSV_PATH", "./code.csv")
+pd = lazy_import("pandas")
+bs = lazy_import("baostock")
 
-# ================== 日志 ==================
-log_dir = "./logs"
-os.makedirs(log_dir, exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(os.path.join(log_dir, "sync_daily_baostock.log"), encoding="utf-8"),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
 logger = logging.getLogger(__name__)
 
 def parse_arguments():
@@ -36,6 +26,18 @@ def parse_arguments():
     parser.add_argument('--date', type=str, help='指定同步日期，格式：YYYY-MM-DD')
     parser.add_argument('--start-date', type=str, help='开始日期，格式：YYYY-MM-DD')
     parser.add_argument('--end-date', type=str, help='结束日期，格式：YYYY-MM-DD')
+    parser.add_argument('--raw', action='store_true',
+                        help='写入不复权表 stock_daily_raw，检测到除权除息时刷新复权因子')
+    parser.add_argument('--check-dividends', action='store_true',
+                        help='除 preclose 比对外，再查询分红送转日历判断除权除息（每只股票多一次请求）')
+    parser.add_argument('--no-resync', action='store_true',
+                        help='只把除权除息股票加入重刷队列，不在本次运行中重刷历史')
+    add_source_arguments(parser)
+    add_archive_arguments(parser)
+    add_group_commit_arguments(parser)
+    add_queue_arguments(parser)
+    add_priority_arguments(parser)
+    add_profile_arguments(parser)
     return parser.parse_args()
 
 def validate_date(date_str):
@@ -45,39 +47,72 @@ def validate_date(date_str):
     except ValueError:
         return False
 
-def fetch_with_relogin(code, start_date, end_date, freq="daily", max_retries=3):
+def fetch_with_relogin(code, start_date, end_date, freq="daily", max_retries=3, adjustflag="2"):
     """带自动重新登录的数据获取"""
     for attempt in range(max_retries):
-        df = fetch_baostock_data(code, start_date, end_date, freq)
+        df = fetch_baostock_data(code, start_date, end_date, freq, adjustflag)
         # 检查是否因会话超时导致空数据（通过重新登录验证）
         if df.empty:
             # 尝试重新登录
-            bs.logout()
+            logout()
             time.sleep(1)
-            lg = bs.login()
+            lg = login()
             if lg.error_code != '0':
                 logger.warning(f"重新登录失败: {lg.error_msg}，等待5s后重试")
                 time.sleep(5)
                 continue
             # 重新登录成功后再次获取数据
-            df = fetch_baostock_data(code, start_date, end_date, freq)
+            df = fetch_baostock_data(code, start_date, end_date, freq, adjustflag)
         return df
     return pd.DataFrame()
 
-def sync_single_date(engine, codes, target_date):
+def fetch_rows_with_relogin(code, start_date, end_date, freq="daily", max_retries=3, adjustflag="2", fetcher=None):
+    """fetch_with_relogin 的无 pandas 版本，返回 (字段名列表, 类型化元组列表)；传入 fetcher 时走多数据源"""
+    if fetcher is not None:
+        return fetcher.fetch(code, start_date, end_date, freq, adjustflag)
+    columns = []
+    for attempt in range(max_retries):
+        columns, rows = fetch_baostock_rows(code, start_date, end_date, freq, adjustflag)
+        if not rows:
+            logout()
+            time.sleep(1)
+            lg = login()
+            if lg.error_code != '0':
+                logger.warning(f"重新登录失败: {lg.error_msg}，等待5s后重试")
+                time.sleep(5)
+                continue
+            columns, rows = fetch_baostock_rows(code, start_date, end_date, freq, adjustflag)
+        return columns, rows
+    return columns, []
+
+def refresh_factors_if_ex_rights(engine, code, columns, rows, table):
+    """不复权模式下，新 K 线的 preclose 与库里前一日 close 不一致即视为除权除息，重新拉取该股复权因子"""
+    first_date = rows[0][columns.index('date')]
+    prev_close = get_prev_close(engine, table, code, first_date)
+    if prev_close is None or has_ex_rights_rows(columns, rows, prev_close):
+        count = sync_adjust_factors(engine, code)
+        logger.info(f"🔁 {code} 检测到除权除息/新股，已刷新 {count} 条复权因子")
+
+def sync_single_date(engine, codes, target_date, raw=False, writer=None, fetcher=None):
     logger.info(f"正在同步指定日期数据（{target_date}）")
+    table = "stock_daily_raw" if raw else "stock_daily"
+    adjustflag = "3" if raw else "2"
     cnt = 1
     for code in codes:
         time.sleep(0.5)
-        df = fetch_with_relogin(code, target_date, target_date, "daily")
-        if not df.empty:
-            upsert(df, "stock_daily", engine, "date")
+        columns, rows = fetch_rows_with_relogin(code, target_date, target_date, "daily", adjustflag=adjustflag,
+                                                fetcher=fetcher)
+        if rows:
+            if raw:
+                refresh_factors_if_ex_rights(engine, code, columns, rows, table)
+            write_rows(engine, writer, table, columns, rows)
             logger.info(f"✅ {code} 同步 {cnt}/{len(codes)} 条 {target_date} 数据")
         else:
+            keep_deferred(codes, code)
             logger.info(f"ℹ️ {code} 在 {target_date} 无数据")
         cnt += 1
 
-def sync_date_range(engine, codes, start_date, end_date):
+def sync_date_range(engine, codes, start_date, end_date, raw=False, writer=None):
     logger.info(f"正在同步日期范围数据（{start_date} 到 {end_date}）")
     start_dt = datetime.strptime(start_date, "%Y-%m-%d")
     end_dt = datetime.strptime(end_date, "%Y-%m-%d")
@@ -87,33 +122,44 @@ def sync_date_range(engine, codes, start_date, end_date):
     current_dt = start_dt
     while current_dt <= end_dt:
         current_date_str = current_dt.strftime("%Y-%m-%d")
-        sync_single_date(engine, codes, current_date_str)
+        sync_single_date(engine, codes, current_date_str, raw, writer)
         current_dt += timedelta(days=1)
 
-def sync_latest(engine, codes):
+def sync_latest(engine, codes, raw=False, check_dividends=False, writer=None, fetcher=None):
     today = datetime.now().strftime("%Y-%m-%d")
     logger.info(f"正在同步最新日线数据（到{today}为止）")
+    table = "stock_daily_raw" if raw else "stock_daily"
+    adjustflag = "3" if raw else "2"
     cnt = 1
     for code in codes:
         time.sleep(0.2)
-        latest_date = get_latest(engine, code, "stock_daily", "date")
+        latest_date = get_latest(engine, code, table, "date")
         if latest_date:
             start_date = (datetime.strptime(latest_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
         else:
             start_date = "2024-01-01"
         if start_date <= today:
             try:
-                df = fetch_with_relogin(code, start_date, today, "daily")
+                columns, rows = fetch_rows_with_relogin(code, start_date, today, "daily", adjustflag=adjustflag,
+                                                        fetcher=fetcher)
             except Exception as e:
                 logger.warning(f"⚠️ {code} 日线同步失败: {e}，等待30s重试")
                 time.sleep(30)
-                bs.logout()
-                bs.login()
-                df = fetch_baostock_data(code, start_date, today, "daily")
-            if not df.empty:
-                upsert(df, "stock_daily", engine, "date")
+                logout()
+                login()
+                columns, rows = fetch_baostock_rows(code, start_date, today, "daily", adjustflag)
+            if rows:
+                if raw:
+                    refresh_factors_if_ex_rights(engine, code, columns, rows, table)
+                else:
+                    # 前复权口径：除权除息会让该股旧 K 线整体失效，命中则加入重刷队列
+                    reason = detect_corporate_action(engine, code, columns, rows, latest_date, check_dividends)
+                    if reason:
+                        enqueue_resync(engine, code, reason)
+                write_rows(engine, writer, table, columns, rows)
                 logger.info(f"✅ {code} 同步 {cnt}/{len(codes)} 条日线数据")
             else:
+                keep_deferred(codes, code)
                 logger.info(f"ℹ️ {code} 无新数据")
         else:
             logger.info(f"ℹ️ {code} 数据已是最新")
@@ -121,14 +167,33 @@ def sync_latest(engine, codes):
 
 def main():
     args = parse_arguments()
-    uri = f"mysql+mysqlconnector://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}?charset=utf8mb4"
-    engine = create_engine(uri, pool_pre_ping=True)
+    setup_logging("sync_daily_baostock.log")
+    try:
+        with exclusive_run("sync_daily", args), archiving(args), profile_run("sync_daily", args):
+            run(args)
+    finally:
+        log_stats()
 
-    lg = bs.login()
-    if lg.error_code != '0':
-        logger.error(f"Baostock login failed: {lg.error_msg}")
-        return
+def run(args):
+    """返回是否成功：异常在这里记录日志后不再抛出，调度进程据返回值记录失败并重试"""
+    engine = getattr(args, "engine", None) or build_engine()
+    if getattr(args, "replay", None):
+        # 重放只写归档里的 K 线，不做除权检测与重刷（那些需要访问 Baostock）
+        with open_writer(engine, args) as writer:
+            replay_baostock(engine, writer, args.replay, freqs=("daily",))
+        return True
+    if args.raw:
+        ensure_raw_tables(engine)
+    else:
+        ensure_resync_queue(engine)
 
+    fetcher = build_fetcher(args)
+    lg = login()
+    if lg.error_code != '0':
+        if fetcher is None:
+            logger.error(f"Baostock login failed: {lg.error_msg}")
+            return False
+        logger.warning(f"Baostock 登录失败，使用其他数据源继续: {lg.error_msg}")
     try:
         codes = []
         with open(CODE_CSV_PATH, "r") as f:
@@ -136,24 +201,51 @@ def main():
                 code = line.strip()
                 if code and not code.startswith("#"):
                     codes.append(code.zfill(6))
+        codes = limit_codes(codes, args)
 
         if args.date:
             if not validate_date(args.date):
                 logger.error("❌ 日期格式错误，请使用 YYYY-MM-DD 格式")
-                return
-            sync_single_date(engine, codes, args.date)
+                return False
+            plan = prioritize(engine, args, "daily", codes, "stock_daily_raw" if args.raw else "stock_daily")
+            with open_writer(engine, args) as writer:
+                codes = plan.schedule(queue_codes(engine, args, "daily", plan.codes, writer))
+                sync_single_date(engine, codes, args.date, args.raw, writer, fetcher)
+            if not args.raw:
+                update_indicators(engine, rewritten_from=args.date)
         elif args.start_date and args.end_date:
             if not validate_date(args.start_date) or not validate_date(args.end_date):
                 logger.error("❌ 日期格式错误，请使用 YYYY-MM-DD 格式")
-                return
-            sync_date_range(engine, codes, args.start_date, args.end_date)
+                return False
+            if args.queue:
+                logger.error("❌ 日期范围同步按日期逐轮遍历股票，不支持 --queue")
+                return False
+            with open_writer(engine, args) as writer:
+                sync_date_range(engine, codes, args.start_date, args.end_date, args.raw, writer)
+            if not args.raw:
+                update_indicators(engine, rewritten_from=args.start_date)
         else:
-            sync_latest(engine, codes)
+            # 写入器在这里关闭，确保增量全部提交后再重刷
+            plan = prioritize(engine, args, "daily", codes, "stock_daily_raw" if args.raw else "stock_daily")
+            with open_writer(engine, args) as writer:
+                codes = plan.schedule(queue_codes(engine, args, "daily", plan.codes, writer))
+                sync_latest(engine, codes, args.raw, args.check_dividends, writer, fetcher)
+            if not args.raw and not args.no_resync:
+                done, failed = process_resync_queue(engine)
+                if done or failed:
+                    logger.info(f"🔁 除权除息重刷完成 {done} 只，失败 {failed} 只")
+            if not args.raw:
+                # 重刷过的股票已整段重算，这里只推进其余股票的新 K 线
+                update_indicators(engine)
         logger.info("✅ 日线数据同步完成")
+        return True
     except Exception as e:
         logger.exception(f"同步失败: {e}")
+        return False
     finally:
-        bs.logout()
+        if fetcher is not None:
+            fetcher.close()
+        logout()
         logger.info("✅ 日线同步任务结束")
 
 if __name__ == "__main__":
@@ -161,6 +253,7 @@ if __name__ == "__main__":
     同步单日数据: python sync_daily.py --date 2024-12-07
     同步日期范围: python sync_daily.py --start-date 2024-12-01 --end-date 2024-12-07
     自动同步最新: python sync_daily.py
+    不复权+因子: python sync_daily.py --raw
     '''
     s_time = time.time()
     main()
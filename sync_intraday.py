@@ -8,39 +8,36 @@ import csv
 import logging
 import os
 import random
-import sys
 import time
-from datetime import datetime
-from pathlib import Path
-from typing import Any
+from datetime import date, datetime
+from typing import Any, Callable
 
+from common import CODE_CSV_PATH, LOG_DIR, build_engine, exclusive_run, setup_logging
 from fetch_intraday_one import (
     fetch_intraday_trends,
     filter_rows_by_date,
     normalize_code,
+    parse_mkline_text,
     parse_trends,
 )
-
-MYSQL_USER = os.getenv("MYSQL_USER", "root")
-MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "InsightOne123456")
-MYSQL_HOST = os.getenv("MYSQL_HOST", "127.0.0.1")
-MYSQL_PORT = os.getenv("MYSQL_PORT", "3306")
-MYSQL_DB = os.getenv("MYSQL_DB", "stock_db_qfq")
-CODE_CSV_PATH = os.getenv("CODE_CSV_PATH", "./code.csv")
+from db_writer import add_group_commit_arguments, open_writer
+from profiling import add_profile_arguments, limit_codes, profile_run
+from raw_archive import add_archive_arguments, archiving, iter_records
+from task_queue import add_queue_arguments, queue_codes, report_failure
 
 TABLE_NAME = "stock_intraday_1m"
 SOURCE_NAME = "tencent_mkline_m1"
+INTRADAY_LAYOUT = os.getenv("INTRADAY_LAYOUT", "standard")
+PARTITION_MONTHS_BACK = 12  # 新建分区表时预建的历史月份数，更早的数据落入 p_hist
+PARTITION_MONTHS_AHEAD = 3  # 始终保持未来 N 个月的空分区
+
+# compact 布局：聚簇主键 (code, trade_datetime)、定点整数价格，名称和来源放到维表
+COMPACT_TABLE_NAME = "stock_intraday_1m_compact"
+SYMBOL_TABLE_NAME = "stock_intraday_symbol"
+COMPACT_VIEW_FALLBACK = "stock_intraday_1m_v"
+PRICE_SCALE = 1000
+TURNOVER_SCALE = 1_000_000
 
-LOG_DIR = Path("./logs")
-LOG_DIR.mkdir(exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(LOG_DIR / "sync_intraday.log", encoding="utf-8"),
-        logging.StreamHandler(sys.stdout),
-    ],
-)
 logger = logging.getLogger(__name__)
 
 CREATE_TABLE_SQL = f"""
@@ -66,6 +63,103 @@ CREATE TABLE IF NOT EXISTS `{TABLE_NAME}` (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 """
 
+# 按 trade_date 做 RANGE 分区：分区键必须出现在所有唯一键中，因此主键和唯一键都带上 trade_date；
+# 日期范围查询靠分区裁剪完成，不再单独维护 idx_trade_date。
+CREATE_PARTITIONED_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{TABLE_NAME}` (
+  `id` BIGINT AUTO_INCREMENT,
+  `code` VARCHAR(20) NOT NULL COMMENT '6位股票代码',
+  `name` VARCHAR(64) DEFAULT NULL COMMENT '股票名称',
+  `trade_date` DATE NOT NULL COMMENT '交易日期',
+  `trade_time` TIME NOT NULL COMMENT '分钟时间',
+  `trade_datetime` DATETIME NOT NULL COMMENT '分钟时间戳',
+  `open` DECIMAL(10,4) DEFAULT NULL,
+  `close` DECIMAL(10,4) DEFAULT NULL,
+  `high` DECIMAL(10,4) DEFAULT NULL,
+  `low` DECIMAL(10,4) DEFAULT NULL,
+  `volume_hand` DECIMAL(20,4) DEFAULT NULL COMMENT '成交量（手）',
+  `turnover_rate_pct` DECIMAL(12,6) DEFAULT NULL COMMENT '换手率（%）',
+  `source` VARCHAR(32) NOT NULL DEFAULT '{SOURCE_NAME}',
+  `created_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`, `trade_date`),
+  UNIQUE KEY `uk_code_trade_datetime` (`code`, `trade_datetime`, `trade_date`),
+  KEY `idx_code_trade_date` (`code`, `trade_date`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+PARTITION BY RANGE COLUMNS(`trade_date`) (
+{{partitions}}
+);
+"""
+
+# 每行约 36 字节（标准布局约 100 字节外加三个二级索引）；trade_date/trade_time 为虚拟列，不占存储
+CREATE_COMPACT_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{COMPACT_TABLE_NAME}` (
+  `code` CHAR(6) CHARACTER SET ascii NOT NULL COMMENT '6位股票代码',
+  `trade_datetime` DATETIME NOT NULL COMMENT '分钟时间戳',
+  `open` INT UNSIGNED DEFAULT NULL COMMENT '价格×{PRICE_SCALE}',
+  `close` INT UNSIGNED DEFAULT NULL COMMENT '价格×{PRICE_SCALE}',
+  `high` INT UNSIGNED DEFAULT NULL COMMENT '价格×{PRICE_SCALE}',
+  `low` INT UNSIGNED DEFAULT NULL COMMENT '价格×{PRICE_SCALE}',
+  `volume_hand` INT UNSIGNED DEFAULT NULL COMMENT '成交量（手）',
+  `turnover_ppm` INT UNSIGNED DEFAULT NULL COMMENT '换手率（%）×{TURNOVER_SCALE}',
+  `trade_date` DATE AS (DATE(`trade_datetime`)) VIRTUAL COMMENT '交易日期',
+  `trade_time` TIME AS (TIME(`trade_datetime`)) VIRTUAL COMMENT '分钟时间',
+  PRIMARY KEY (`code`, `trade_datetime`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+CREATE_SYMBOL_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{SYMBOL_TABLE_NAME}` (
+  `code` CHAR(6) CHARACTER SET ascii NOT NULL PRIMARY KEY COMMENT '6位股票代码',
+  `name` VARCHAR(64) DEFAULT NULL COMMENT '股票名称',
+  `source` VARCHAR(32) NOT NULL DEFAULT '{SOURCE_NAME}',
+  `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+# 兼容视图：列名、类型与标准布局一致，旧的读端 SQL 不用改
+CREATE_COMPACT_VIEW_SQL = f"""
+CREATE OR REPLACE VIEW `{{view}}` AS
+SELECT
+  c.`code`,
+  s.`name`,
+  c.`trade_date`,
+  c.`trade_time`,
+  c.`trade_datetime`,
+  CAST(c.`open` / {PRICE_SCALE} AS DECIMAL(10,4)) AS `open`,
+  CAST(c.`close` / {PRICE_SCALE} AS DECIMAL(10,4)) AS `close`,
+  CAST(c.`high` / {PRICE_SCALE} AS DECIMAL(10,4)) AS `high`,
+  CAST(c.`low` / {PRICE_SCALE} AS DECIMAL(10,4)) AS `low`,
+  CAST(c.`volume_hand` AS DECIMAL(20,4)) AS `volume_hand`,
+  CAST(c.`turnover_ppm` / {TURNOVER_SCALE} AS DECIMAL(12,6)) AS `turnover_rate_pct`,
+  COALESCE(s.`source`, '{SOURCE_NAME}') AS `source`
+FROM `{COMPACT_TABLE_NAME}` c
+LEFT JOIN `{SYMBOL_TABLE_NAME}` s ON s.`code` = c.`code`
+"""
+
+COMPACT_UPSERT_SQL = f"""
+INSERT INTO `{COMPACT_TABLE_NAME}` (
+  `code`, `trade_datetime`, `open`, `close`, `high`, `low`, `volume_hand`, `turnover_ppm`
+) VALUES (
+  :code, :trade_datetime, :open, :close, :high, :low, :volume_hand, :turnover_ppm
+)
+ON DUPLICATE KEY UPDATE
+  `open` = VALUES(`open`),
+  `close` = VALUES(`close`),
+  `high` = VALUES(`high`),
+  `low` = VALUES(`low`),
+  `volume_hand` = VALUES(`volume_hand`),
+  `turnover_ppm` = VALUES(`turnover_ppm`);
+"""
+
+SYMBOL_UPSERT_SQL = f"""
+INSERT INTO `{SYMBOL_TABLE_NAME}` (`code`, `name`, `source`)
+VALUES (:code, :name, :source)
+ON DUPLICATE KEY UPDATE
+  `name` = VALUES(`name`),
+  `source` = VALUES(`source`);
+"""
+
 UPSERT_SQL = f"""
 INSERT INTO `{TABLE_NAME}` (
   `code`, `name`, `trade_date`, `trade_time`, `trade_datetime`,
@@ -103,23 +197,20 @@ def parse_arguments() -> argparse.Namespace:
         help="不按数据库最新时间过滤，重新写入接口返回范围内的所有记录",
     )
     parser.add_argument("--dry-run", action="store_true", help="只抓取和统计，不写入数据库")
-    return parser.parse_args()
-
-
-def build_engine() -> Any:
-    from sqlalchemy import create_engine
-    from sqlalchemy.engine import URL
-
-    url = URL.create(
-        "mysql+mysqlconnector",
-        username=MYSQL_USER,
-        password=MYSQL_PASSWORD,
-        host=MYSQL_HOST,
-        port=int(MYSQL_PORT),
-        database=MYSQL_DB,
-        query={"charset": "utf8mb4"},
+    parser.add_argument(
+        "--layout",
+        choices=("standard", "partitioned", "compact"),
+        default=INTRADAY_LAYOUT,
+        help=(
+            "建表方式：standard 单表；partitioned 按 trade_date 月度 RANGE 分区；"
+            "compact 聚簇主键+整数价格+维表，默认读 INTRADAY_LAYOUT"
+        ),
     )
-    return create_engine(url, pool_pre_ping=True)
+    add_archive_arguments(parser)
+    add_group_commit_arguments(parser)
+    add_queue_arguments(parser)
+    add_profile_arguments(parser)
+    return parser.parse_args()
 
 
 def validate_date(date_text: str | None) -> None:
@@ -149,19 +240,151 @@ def load_codes(csv_path: str) -> list[str]:
     return codes
 
 
-def ensure_table(engine: Any) -> None:
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month_start: date) -> str:
+    return f"p{month_start:%Y%m}"
+
+
+def partition_clause(month_start: date) -> str:
+    """分区 p202406 存放 2024-06 的数据，上界为下月 1 日。"""
+    return f"PARTITION {partition_name(month_start)} VALUES LESS THAN ('{add_months(month_start, 1).isoformat()}')"
+
+
+def get_partition_bounds(engine: Any) -> dict[str, str] | None:
+    """返回 {分区名: 上界表达式}；表未分区时返回 None。"""
     from sqlalchemy import text
 
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t ORDER BY PARTITION_ORDINAL_POSITION"
+            ),
+            {"t": TABLE_NAME},
+        ).fetchall()
+    if not rows or rows[0][0] is None:
+        return None
+    return {row[0]: row[1] for row in rows}
+
+
+def ensure_future_partitions(engine: Any, months_ahead: int = PARTITION_MONTHS_AHEAD) -> list[str]:
+    """把 pmax 拆出缺失的月度分区，保证未来 months_ahead 个月都有独立分区。
+
+    pmax 平时为空，REORGANIZE 只改元数据，几乎不耗时。
+    """
+    from sqlalchemy import text
+
+    bounds = get_partition_bounds(engine)
+    if bounds is None:
+        raise SystemExit(
+            f"{TABLE_NAME} 是未分区的旧表，不能直接按 partitioned 方式写入；"
+            "请先执行 python intraday_retention.py convert 转换表结构"
+        )
+    horizon = add_months(date.today().replace(day=1), months_ahead)
+    month_partitions = sorted(name for name in bounds if name[1:].isdigit())
+    if month_partitions:
+        # 从最后一个月度分区的下个月开始补齐，中间停机漏掉的月份也各自成区
+        last = month_partitions[-1]
+        month = add_months(date(int(last[1:5]), int(last[5:7]), 1), 1)
+    else:
+        month = date.today().replace(day=1)
+    missing = []
+    while month <= horizon:
+        missing.append(month)
+        month = add_months(month, 1)
+    if not missing:
+        return []
+
+    clauses = ",\n".join(partition_clause(month) for month in missing)
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                f"ALTER TABLE `{TABLE_NAME}` REORGANIZE PARTITION pmax INTO (\n"
+                f"{clauses},\nPARTITION pmax VALUES LESS THAN (MAXVALUE))"
+            )
+        )
+    created = [partition_name(month) for month in missing]
+    logger.info("%s 新建分区 %s", TABLE_NAME, ",".join(created))
+    return created
+
+
+def build_partition_clauses(first_month: date, last_month: date) -> str:
+    clauses = [f"PARTITION p_hist VALUES LESS THAN ('{first_month.isoformat()}')"]
+    month = first_month
+    while month <= last_month:
+        clauses.append(partition_clause(month))
+        month = add_months(month, 1)
+    clauses.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    return ",\n".join(f"  {clause}" for clause in clauses)
+
+
+def is_base_table(engine: Any, table: str) -> bool:
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        table_type = conn.execute(
+            text(
+                "SELECT TABLE_TYPE FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t"
+            ),
+            {"t": table},
+        ).scalar()
+    return table_type == "BASE TABLE"
+
+
+def ensure_compact_view(engine: Any) -> str:
+    """优先把兼容视图建成 stock_intraday_1m；同名旧表还在时退而建 stock_intraday_1m_v。"""
+    from sqlalchemy import text
+
+    view = TABLE_NAME
+    if is_base_table(engine, TABLE_NAME):
+        view = COMPACT_VIEW_FALLBACK
+        logger.warning(
+            "%s 仍是标准布局的实体表，兼容视图建为 %s；迁移请执行 python intraday_retention.py convert --to compact",
+            TABLE_NAME,
+            view,
+        )
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_COMPACT_VIEW_SQL.format(view=view)))
+    return view
+
+
+def ensure_table(engine: Any, layout: str = "standard") -> None:
+    from sqlalchemy import text
+
+    if layout == "compact":
+        with engine.begin() as conn:
+            conn.execute(text(CREATE_COMPACT_TABLE_SQL))
+            conn.execute(text(CREATE_SYMBOL_TABLE_SQL))
+        ensure_compact_view(engine)
+        return
+
+    if layout == "partitioned":
+        this_month = date.today().replace(day=1)
+        partitions = build_partition_clauses(
+            add_months(this_month, -PARTITION_MONTHS_BACK),
+            add_months(this_month, PARTITION_MONTHS_AHEAD),
+        )
+        with engine.begin() as conn:
+            conn.execute(text(CREATE_PARTITIONED_TABLE_SQL.format(partitions=partitions)))
+        ensure_future_partitions(engine)
+        return
+
     with engine.begin() as conn:
         conn.execute(text(CREATE_TABLE_SQL))
 
 
-def get_latest_trade_datetime(engine: Any, code: str) -> str | None:
+def get_latest_trade_datetime(engine: Any, code: str, layout: str = "standard") -> str | None:
     from sqlalchemy import text
 
+    table = COMPACT_TABLE_NAME if layout == "compact" else TABLE_NAME
     with engine.connect() as conn:
         result = conn.execute(
-            text(f"SELECT MAX(`trade_datetime`) FROM `{TABLE_NAME}` WHERE `code` = :code"),
+            text(f"SELECT MAX(`trade_datetime`) FROM `{table}` WHERE `code` = :code"),
             {"code": code},
         ).scalar()
     return result.strftime("%Y-%m-%d %H:%M") if result else None
@@ -189,13 +412,73 @@ def to_db_rows(rows: list[dict]) -> list[dict]:
     return db_rows
 
 
-def upsert_intraday_rows(engine: Any, rows: list[dict]) -> None:
+def to_fixed(value: float | None, scale: int) -> int | None:
+    return None if value is None else int(round(value * scale))
+
+
+def to_compact_rows(db_rows: list[dict]) -> list[dict]:
+    return [
+        {
+            "code": row["code"],
+            "trade_datetime": row["trade_datetime"],
+            "open": to_fixed(row["open"], PRICE_SCALE),
+            "close": to_fixed(row["close"], PRICE_SCALE),
+            "high": to_fixed(row["high"], PRICE_SCALE),
+            "low": to_fixed(row["low"], PRICE_SCALE),
+            "volume_hand": to_fixed(row["volume_hand"], 1),
+            "turnover_ppm": to_fixed(row["turnover_rate_pct"], TURNOVER_SCALE),
+        }
+        for row in db_rows
+    ]
+
+
+INTRADAY_COLUMNS = (
+    "code", "name", "trade_date", "trade_time", "trade_datetime",
+    "open", "close", "high", "low", "volume_hand", "turnover_rate_pct", "source",
+)
+COMPACT_COLUMNS = ("code", "trade_datetime", "open", "close", "high", "low", "volume_hand", "turnover_ppm")
+SYMBOL_COLUMNS = ("code", "name", "source")
+
+
+def submit_intraday_rows(
+    writer: Any, rows: list[dict], layout: str = "standard", on_commit: Callable[[], None] | None = None
+) -> None:
+    """组提交路径：按列顺序转成元组交给 GroupCommitWriter，分时表不登记写入版本。"""
+    key_columns = ("code", "trade_datetime")
+    if layout == "compact":
+        symbols = {row["code"]: (row["code"], row["name"], row["source"]) for row in rows}
+        writer.submit(SYMBOL_TABLE_NAME, SYMBOL_COLUMNS, list(symbols.values()), key_columns=("code",), date_column=None)
+        compact = [tuple(row[col] for col in COMPACT_COLUMNS) for row in to_compact_rows(rows)]
+        writer.submit(COMPACT_TABLE_NAME, COMPACT_COLUMNS, compact, key_columns=key_columns, date_column=None, on_commit=on_commit)
+        return
+    values = [tuple(row[col] for col in INTRADAY_COLUMNS) for row in rows]
+    writer.submit(TABLE_NAME, INTRADAY_COLUMNS, values, key_columns=key_columns, date_column=None, on_commit=on_commit)
+
+
+def upsert_intraday_rows(
+    engine: Any,
+    rows: list[dict],
+    layout: str = "standard",
+    writer: Any = None,
+    on_commit: Callable[[], None] | None = None,
+) -> None:
     from sqlalchemy import text
 
     if not rows:
         return
+    if writer is not None:
+        submit_intraday_rows(writer, rows, layout, on_commit)
+        return
     with engine.begin() as conn:
-        conn.execute(text(UPSERT_SQL), rows)
+        if layout == "compact":
+            # 名称/来源每只股票只写一行维表，分钟行只存数值
+            symbols = {row["code"]: {"code": row["code"], "name": row["name"], "source": row["source"]} for row in rows}
+            conn.execute(text(SYMBOL_UPSERT_SQL), list(symbols.values()))
+            conn.execute(text(COMPACT_UPSERT_SQL), to_compact_rows(rows))
+        else:
+            conn.execute(text(UPSERT_SQL), rows)
+    if on_commit is not None:
+        on_commit()
 
 
 def fetch_code_rows(code: str, bars: int, target_date: str | None) -> list[dict]:
@@ -206,6 +489,28 @@ def fetch_code_rows(code: str, bars: int, target_date: str | None) -> list[dict]
     return rows
 
 
+def replay_intraday(engine: Any, args: argparse.Namespace, writer: Any) -> int:
+    """按当前的 parse_trends 重新解析归档的 mkline 原文并写库，不访问网络；返回写入/统计行数。"""
+    total_rows = 0
+    for record in iter_records(args.replay, "tencent_mkline"):
+        try:
+            data = parse_mkline_text(record["code"], record["payload"])
+        except ValueError as exc:
+            logger.warning("归档的 %s 分时原文无法解析，跳过: %s", record["code"], exc)
+            continue
+        rows = parse_trends(data["code"], data["name"], data["rows"])
+        if args.date:
+            rows = filter_rows_by_date(rows, args.date)
+        if not rows:
+            continue
+        db_rows = to_db_rows(rows)
+        if engine is not None:
+            upsert_intraday_rows(engine, db_rows, args.layout, writer)
+        total_rows += len(db_rows)
+    logger.info("分时重放结束，写入/统计 %s 条", total_rows)
+    return total_rows
+
+
 def write_failed_codes(failed_codes: list[str]) -> None:
     if not failed_codes:
         return
@@ -216,61 +521,95 @@ def write_failed_codes(failed_codes: list[str]) -> None:
 
 def main() -> None:
     args = parse_arguments()
+    setup_logging("sync_intraday.log")
+    with exclusive_run("sync_intraday", args), archiving(args), profile_run("sync_intraday", args):
+        run(args)
+
+
+def run(args: argparse.Namespace) -> None:
     validate_date(args.date)
     if args.sleep_min < 0 or args.sleep_max < args.sleep_min:
         raise SystemExit("--sleep-max 必须大于等于 --sleep-min，且等待时间不能为负数")
 
+    if getattr(args, "replay", None):
+        engine = None if args.dry_run else (getattr(args, "engine", None) or build_engine())
+        if engine is not None:
+            ensure_table(engine, args.layout)
+        with open_writer(engine, args) as writer:
+            replay_intraday(engine, args, writer)
+        return
+
     codes = load_codes(args.code_csv)
     if args.limit > 0:
         codes = codes[: args.limit]
+    codes = limit_codes(codes, args)
     if not codes:
         logger.warning("未加载到任何股票代码，请检查 %s", args.code_csv)
         return
 
-    engine = None if args.dry_run else build_engine()
+    engine = None if args.dry_run else (getattr(args, "engine", None) or build_engine())
     if engine is not None:
-        ensure_table(engine)
-
-    logger.info("准备同步 %s 只股票，date=%s，bars=%s，dry_run=%s", len(codes), args.date or "增量", args.bars, args.dry_run)
+        ensure_table(engine, args.layout)
+
+    logger.info(
+        "准备同步 %s 只股票，date=%s，bars=%s，layout=%s，dry_run=%s",
+        len(codes),
+        args.date or "增量",
+        args.bars,
+        args.layout,
+        args.dry_run,
+    )
     failed_codes: list[str] = []
     total_rows = 0
-
-    for index, code in enumerate(codes, start=1):
-        try:
-            rows = fetch_code_rows(code, args.bars, args.date)
-            if not rows:
-                logger.info("%s/%s %s 无分时数据", index, len(codes), code)
-                continue
-
-            if engine is not None and not args.date and not args.refresh_existing:
-                latest_datetime = get_latest_trade_datetime(engine, code)
-                if latest_datetime:
-                    rows = [row for row in rows if row["datetime"] > latest_datetime]
-
-            if not rows:
-                logger.info("%s/%s %s 无新分时数据", index, len(codes), code)
-                continue
-
-            db_rows = to_db_rows(rows)
-            if not args.dry_run and engine is not None:
-                upsert_intraday_rows(engine, db_rows)
-
-            total_rows += len(db_rows)
-            logger.info(
-                "%s/%s %s 写入 %s 条，范围 %s 至 %s",
-                index,
-                len(codes),
-                code,
-                len(db_rows),
-                db_rows[0]["trade_datetime"],
-                db_rows[-1]["trade_datetime"],
-            )
-        except Exception as exc:  # noqa: BLE001
-            failed_codes.append(code)
-            logger.exception("%s/%s %s 同步失败: %s", index, len(codes), code, exc)
-        finally:
-            time.sleep(random.uniform(args.sleep_min, args.sleep_max))
-
+    unconfirmed: set[str] = set()  # 已排队、尚未确认提交的股票
+
+    with open_writer(engine, args) as writer:
+        codes = queue_codes(engine, args, "intraday", codes, writer)
+        for index, code in enumerate(codes, start=1):
+            try:
+                rows = fetch_code_rows(code, args.bars, args.date)
+                if not rows:
+                    logger.info("%s/%s %s 无分时数据", index, len(codes), code)
+                    continue
+
+                if engine is not None and not args.date and not args.refresh_existing:
+                    latest_datetime = get_latest_trade_datetime(engine, code, args.layout)
+                    if latest_datetime:
+                        rows = [row for row in rows if row["datetime"] > latest_datetime]
+
+                if not rows:
+                    logger.info("%s/%s %s 无新分时数据", index, len(codes), code)
+                    continue
+
+                db_rows = to_db_rows(rows)
+                if not args.dry_run and engine is not None:
+                    unconfirmed.add(code)
+                    upsert_intraday_rows(
+                        engine, db_rows, args.layout, writer, on_commit=lambda code=code: unconfirmed.discard(code)
+                    )
+
+                total_rows += len(db_rows)
+                if code in failed_codes:
+                    failed_codes.remove(code)  # 队列模式下放回队列后重试成功
+                logger.info(
+                    "%s/%s %s 写入 %s 条，范围 %s 至 %s",
+                    index,
+                    len(codes),
+                    code,
+                    len(db_rows),
+                    db_rows[0]["trade_datetime"],
+                    db_rows[-1]["trade_datetime"],
+                )
+            except Exception as exc:  # noqa: BLE001
+                failed_codes.append(code)
+                report_failure(codes, code)
+                logger.exception("%s/%s %s 同步失败: %s", index, len(codes), code, exc)
+                if writer is not None and writer.failed:
+                    break
+            finally:
+                time.sleep(random.uniform(args.sleep_min, args.sleep_max))
+
+    failed_codes.extend(code for code in unconfirmed if code not in failed_codes)
     write_failed_codes(failed_codes)
     logger.info("分时同步结束，成功写入/统计 %s 条，失败 %s 只", total_rows, len(failed_codes))
 
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""Baostock 5/15/30/60 分钟 K 线同步到 stock_minute_<N>。
+
+腾讯 1 分钟接口（sync_intraday）只能回溯有限条数，多年的分钟线研究改用 Baostock 的分钟频率。
+多年 × 数千只股票的 5 分钟线数据量很大，这里不再像 fetch_baostock_data 那样先攒出完整的
+data_list 和 DataFrame：rs.next() 逐行读取、转换成元组，攒满 --chunk-size 行就在一个事务里
+executemany 写入并登记写入版本，内存占用只与 chunk 大小有关。
+
+    python sync_minute.py --freq 5
+    python sync_minute.py --freq 5 15 60 --start 2020-01-01 --chunk-size 5000
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import time
+from collections.abc import Iterator
+from datetime import datetime
+from typing import Any
+
+from baostock_deadline import install as install_baostock_deadline, log_stats
+from common import build_engine, lazy_import, setup_logging
+from db_writer import ensure_write_version_table, upsert_rows
+from profiling import add_profile_arguments, limit_codes, profile_run
+from sync_to_mysql import HISTORY_START_DATE, load_codes, parse_float, parse_int
+
+bs = lazy_import("baostock")
+logger = logging.getLogger(__name__)
+
+MINUTE_FREQUENCIES = ("5", "15", "30", "60")
+MINUTE_FIELDS = "date,time,code,open,high,low,close,volume,amount,adjustflag"
+INSERT_COLUMNS = ("code", "trade_datetime", "date", "open", "high", "low", "close", "volume", "amount", "adjustflag")
+DEFAULT_CHUNK_SIZE = 5000
+
+CREATE_MINUTE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS `{table}` (
+  `code` VARCHAR(20) NOT NULL COMMENT '6位股票代码',
+  `trade_datetime` DATETIME NOT NULL COMMENT 'K线结束时间',
+  `date` DATE NOT NULL COMMENT '交易日期',
+  `open` DECIMAL(10,4),
+  `high` DECIMAL(10,4),
+  `low` DECIMAL(10,4),
+  `close` DECIMAL(10,4),
+  `volume` BIGINT COMMENT '成交量（股）',
+  `amount` DECIMAL(18,2) COMMENT '成交额（元）',
+  `adjustflag` TINYINT COMMENT '复权类型：1=后复权 2=前复权 3=不复权',
+  PRIMARY KEY (`code`, `trade_datetime`),
+  KEY `idx_date_code` (`date`, `code`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+
+def minute_table(freq: str) -> str:
+    return f"stock_minute_{freq}"
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="同步 Baostock 分钟K线（5/15/30/60）到 stock_minute_<N>")
+    parser.add_argument("--freq", nargs="+", choices=MINUTE_FREQUENCIES, default=["5"], help="分钟频率，可多选，默认 5")
+    parser.add_argument("--start", default=HISTORY_START_DATE, help="无历史数据时的起始日期 YYYY-MM-DD")
+    parser.add_argument("--end", default=None, help="截止日期 YYYY-MM-DD，默认今天")
+    parser.add_argument("--adjustflag", choices=("1", "2", "3"), default="2", help="1 后复权 / 2 前复权 / 3 不复权")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="每个写入事务的行数")
+    parser.add_argument("--full", action="store_true", help="忽略库中已有数据，从 --start 重新拉取")
+    add_profile_arguments(parser)
+    return parser.parse_args()
+
+
+def ensure_minute_tables(engine: Any, freqs: list[str]) -> None:
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        for freq in freqs:
+            conn.execute(text(CREATE_MINUTE_TABLE_SQL.format(table=minute_table(freq))))
+
+
+def get_latest_minute_date(engine: Any, table: str, code: str) -> str | None:
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        result = conn.execute(
+            text(f"SELECT MAX(`trade_datetime`) FROM `{table}` WHERE `code` = :c"), {"c": code}
+        ).scalar()
+    return result.strftime("%Y-%m-%d") if result else None
+
+
+def to_minute_row(code: str, row: list[str]) -> tuple:
+    """Baostock 行 -> 写入元组；time 形如 20240102093500000。"""
+    day, ts, _code, open_p, high_p, low_p, close_p, volume, amount, adjustflag = row
+    trade_datetime = f"{ts[0:4]}-{ts[4:6]}-{ts[6:8]} {ts[8:10]}:{ts[10:12]}:{ts[12:14]}"
+    return (
+        code,
+        trade_datetime,
+        day,
+        parse_float(open_p),
+        parse_float(high_p),
+        parse_float(low_p),
+        parse_float(close_p),
+        parse_int(volume),
+        parse_float(amount),
+        parse_int(adjustflag),
+    )
+
+
+def iter_minute_chunks(
+    code: str, start: str, end: str, freq: str, adjustflag: str, chunk_size: int
+) -> Iterator[list[tuple]]:
+    """逐行消费 rs.next()，每攒满 chunk_size 行产出一次，不保留已产出的数据。"""
+    code_bs = f"sh.{code}" if code.startswith(('6', '9')) else f"sz.{code}"
+    rs = bs.query_history_k_data_plus(
+        code_bs, MINUTE_FIELDS, start_date=start, end_date=end, frequency=freq, adjustflag=adjustflag
+    )
+    if rs.error_code != '0':
+        raise RuntimeError(f"Baostock 分钟线查询失败 {code}: {rs.error_msg}")
+
+    chunk: list[tuple] = []
+    while (rs.error_code == '0') & rs.next():
+        chunk.append(to_minute_row(code, rs.get_row_data()))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if rs.error_code != '0':
+        raise RuntimeError(f"Baostock 分钟线分页读取失败 {code}: {rs.error_msg}")
+    if chunk:
+        yield chunk
+
+
+def sync_code(engine: Any, code: str, freq: str, start: str, end: str, adjustflag: str, chunk_size: int) -> int:
+    table = minute_table(freq)
+    written = 0
+    for chunk in iter_minute_chunks(code, start, end, freq, adjustflag, chunk_size):
+        upsert_rows(engine, table, INSERT_COLUMNS, chunk, key_columns=("code", "trade_datetime"))
+        written += len(chunk)
+        logger.debug("%s %s 已写入 %s 行，最新 %s", table, code, written, chunk[-1][1])
+    return written
+
+
+def run(args: argparse.Namespace) -> None:
+    if args.chunk_size < 1:
+        raise SystemExit("--chunk-size 至少为 1")
+    end = args.end or datetime.now().strftime("%Y-%m-%d")
+    codes = limit_codes(load_codes(), args)
+    if not codes:
+        logger.warning("⚠️ 未加载到任何股票代码，请检查 code.csv")
+        return
+
+    engine = build_engine()
+    ensure_write_version_table(engine)
+    ensure_minute_tables(engine, args.freq)
+
+    # 分块写库穿插在翻页之间，不设整次调用的时限，只限制每一页（BAOSTOCK_MESSAGE_TIMEOUT）
+    install_baostock_deadline()
+    lg = bs.login()
+    if lg.error_code != '0':
+        raise SystemExit(f"Baostock login failed: {lg.error_msg}")
+    failed: list[str] = []
+    try:
+        for freq in args.freq:
+            table = minute_table(freq)
+            total_rows = 0
+            for index, code in enumerate(codes, start=1):
+                # 从库中最新一天重新拉取，当天可能只写了一部分
+                start = args.start if args.full else (get_latest_minute_date(engine, table, code) or args.start)
+                try:
+                    rows = sync_code(engine, code, freq, start, end, args.adjustflag, args.chunk_size)
+                except Exception as exc:  # noqa: BLE001
+                    logger.warning("%s %s 首次失败，重新登录后重试: %s", table, code, exc)
+                    bs.logout()
+                    time.sleep(2)
+                    bs.login()
+                    try:
+                        rows = sync_code(engine, code, freq, start, end, args.adjustflag, args.chunk_size)
+                    except Exception as retry_exc:  # noqa: BLE001
+                        logger.error("%s %s 同步失败: %s", table, code, retry_exc, exc_info=True)
+                        failed.append(f"{freq},{code}")
+                        continue
+                total_rows += rows
+                logger.info("%s %s/%s %s %s~%s 写入 %s 行", table, index, len(codes), code, start, end, rows)
+                time.sleep(random.uniform(0.2, 0.5))
+            logger.info("%s 同步完成，共写入 %s 行", table, total_rows)
+    finally:
+        bs.logout()
+
+    if failed:
+        logger.warning("分钟线同步失败 %s 项: %s", len(failed), ", ".join(failed[:50]))
+
+
+def main() -> None:
+    args = parse_arguments()
+    setup_logging("sync_minute.log")
+    try:
+        with profile_run("sync_minute", args):
+            run(args)
+    finally:
+        log_stats()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,71 @@
 # sync_to_mysql.py
 import os
 import random
-import sys
+import argparse
 import time as pytime
 import logging
-import pandas as pd
-import baostock as bs
 from datetime import datetime, timedelta, time
-from sqlalchemy import create_engine, text
+from baostock_deadline import baostock_deadline, log_stats, login, logout
+from common import CODE_CSV_PATH, LOG_DIR, build_engine, exclusive_run, lazy_import, setup_logging
+from fingerprint import (changed_months, ensure_fingerprint_table, month_keys, refresh_fingerprints, row_fingerprints,
+                         stored_fingerprints)
+from indicators import recompute_indicators, update_indicators
+from priority import add_priority_arguments, prioritize
+from profiling import add_profile_arguments, limit_codes, profile_run
+from raw_archive import add_archive_arguments, archiving, iter_records, record as archive_raw
+from task_queue import add_queue_arguments, queue_codes, report_failure
+from adjust_factor import ensure_raw_tables, sync_adjust_factors
+from db_writer import (PROVISIONAL_TABLES, add_group_commit_arguments, build_upsert_sql, ensure_tag_columns,
+                       ensure_write_version_table, open_writer, touch_write_versions, version_keys, write_rows)
+
+# pandas / baostock 首次使用时才真正导入，--help 等轻命令不付这部分启动时间
+pd = lazy_import("pandas")
+bs = lazy_import("baostock")
 
 # ================== 配置 ==================
-MYSQL_USER = os.getenv("MYSQL_USER", "root")
-MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "InsightOne123456")
-MYSQL_HOST = os.getenv("MYSQL_HOST", "127.0.0.1")
-MYSQL_PORT = os.getenv("MYSQL_PORT", "3306")
-MYSQL_DB = os.getenv("MYSQL_DB", "stock_db_qfq")
-CODE_CSV_PATH = "./code.csv"
-
-# ================== 日志 ==================
-log_dir = "./logs"
-os.makedirs(log_dir, exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(os.path.join(log_dir, "sync_baostock.log"), encoding="utf-8"),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+HISTORY_START_DATE = "2019-07-22"  # 全量同步的历史起点
+DEFAULT_VERIFY_MONTHS = 12  # --verify 默认核对最近 N 个月
+
 logger = logging.getLogger(__name__)
 
+# 根据频率选择字段（周线不支持 preclose 等）
+DAILY_FIELDS = (
+    "date,code,open,high,low,close,preclose,volume,amount,adjustflag,turn,"
+    "tradestatus,pctChg,peTTM,pbMRQ,psTTM,pcfNcfTTM,isST"
+)
+WEEKLY_FIELDS = "date,code,open,high,low,close,volume,amount,adjustflag,turn,pctChg"
+INT_FIELDS = {"volume", "adjustflag", "tradestatus", "isST"}
+
 
-def fetch_baostock_data(code, start, end, freq="daily"):
-    """从 Baostock 获取股票数据（支持日线/周线，前复权）"""
+def fetch_baostock_data(code, start, end, freq="daily", adjustflag="2"):
+    """从 Baostock 获取股票数据（支持日线/周线，默认前复权，adjustflag="3" 为不复权）
+
+    全量回补用：行数多时 DataFrame 的向量化转换更划算。增量同步请用 fetch_baostock_rows。
+    """
     code_bs = f"sh.{code}" if code.startswith(('6', '9')) else f"sz.{code}"
     frequency = "d" if freq == "daily" else "w"
-
-    # 根据频率选择字段（周线不支持 preclose 等）
-    if freq == "daily":
-        fields = (
-            "date,code,open,high,low,close,preclose,volume,amount,adjustflag,turn,"
-            "tradestatus,pctChg,peTTM,pbMRQ,psTTM,pcfNcfTTM,isST"
+    fields = DAILY_FIELDS if freq == "daily" else WEEKLY_FIELDS
+
+    # 查询与翻页共用一个时限，超时抛 BaostockTimeout，不会返回截断的数据
+    with baostock_deadline(f"{code} {freq}"):
+        rs = bs.query_history_k_data_plus(
+            code_bs,
+            fields,
+            start_date=start,
+            end_date=end,
+            frequency=frequency,
+            adjustflag=adjustflag  # 1：后复权；2：前复权； 3: 不复权。
         )
-    else:  # weekly or monthly
-        fields = "date,code,open,high,low,close,volume,amount,adjustflag,turn,pctChg"
-
-    rs = bs.query_history_k_data_plus(
-        code_bs,
-        fields,
-        start_date=start,
-        end_date=end,
-        frequency=frequency,
-        adjustflag="2"  # 1：后复权；2：前复权； 3: 不复权。
-    )
-
-    if rs.error_code != '0':
-        logger.warning(f"Baostock query failed for {code}: {rs.error_msg}")
-        return pd.DataFrame()
 
-    data_list = []
-    while (rs.error_code == '0') & rs.next():
-        data_list.append(rs.get_row_data())
+        if rs.error_code != '0':
+            logger.warning(f"Baostock query failed for {code}: {rs.error_msg}")
+            return pd.DataFrame()
+
+        data_list = []
+        while (rs.error_code == '0') & rs.next():
+            data_list.append(rs.get_row_data())
+    archive_raw("baostock", code=code, freq=freq, adjustflag=adjustflag, start=start, end=end,
+                fields=rs.fields, rows=data_list)
 
     if not data_list:
         return pd.DataFrame()
@@ -81,8 +86,94 @@ def fetch_baostock_data(code, start, end, freq="daily"):
     df['date'] = pd.to_datetime(df['date'])
     return df
 
+def parse_float(value):
+    return float(value) if value else None
+
+
+def parse_int(value):
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return int(float(value))
+
+
+def _row_converters(fields):
+    converters = []
+    for field in fields:
+        if field == "code":
+            converters.append(lambda v: v[3:])  # 去掉 sh./sz.
+        elif field == "date":
+            converters.append(str)
+        elif field in INT_FIELDS:
+            converters.append(parse_int)
+        else:
+            converters.append(parse_float)
+    return converters
+
+
+def parse_baostock_rows(fields, raw_rows):
+    """get_row_data() 的原始字符串行 -> (字段名列表, 类型化元组列表)；重放归档时走同一套转换"""
+    converters = _row_converters(fields)
+    return list(fields), [tuple(convert(value) for convert, value in zip(converters, row)) for row in raw_rows]
+
+
+def fetch_baostock_rows(code, start, end, freq="daily", adjustflag="2", strict=False):
+    """与 fetch_baostock_data 相同的查询，但直接把 get_row_data() 转成类型化元组，不经过 pandas。
+
+    增量同步每只股票只有 1~5 行，DataFrame 的构造与逐列转换开销远大于数据本身。
+    返回 (字段名列表, 元组列表)；无数据时元组列表为空，查询失败时同样返回空（strict=True 时抛 RuntimeError，
+    供多数据源切换区分"没有新 K 线"与"Baostock 出错"）。
+    """
+    code_bs = f"sh.{code}" if code.startswith(('6', '9')) else f"sz.{code}"
+    frequency = "d" if freq == "daily" else "w"
+    fields = DAILY_FIELDS if freq == "daily" else WEEKLY_FIELDS
+    columns = fields.split(",")
+
+    raw_rows = []
+    with baostock_deadline(f"{code} {freq}"):
+        rs = bs.query_history_k_data_plus(
+            code_bs, fields, start_date=start, end_date=end, frequency=frequency, adjustflag=adjustflag
+        )
+        if rs.error_code != '0':
+            if strict:
+                raise RuntimeError(f"Baostock query failed for {code}: {rs.error_msg}")
+            logger.warning(f"Baostock query failed for {code}: {rs.error_msg}")
+            return columns, []
+        while (rs.error_code == '0') & rs.next():
+            raw_rows.append(rs.get_row_data())
+        if strict and rs.error_code != '0':
+            raise RuntimeError(f"Baostock 翻页失败 {code}: {rs.error_msg}")
+    archive_raw("baostock", code=code, freq=freq, adjustflag=adjustflag, start=start, end=end,
+                fields=columns, rows=raw_rows)
+    return parse_baostock_rows(columns, raw_rows)
+
+
+def replay_baostock(engine, writer, replay_dir, freqs=("daily", "weekly")):
+    """把归档的 Baostock 原始行按当前的转换逻辑重新写库，不登录、不访问网络；返回写入行数"""
+    raw_ready = False
+    written = 0
+    for record in iter_records(replay_dir, "baostock"):
+        if record["freq"] not in freqs or record["adjustflag"] not in ("2", "3") or not record["rows"]:
+            continue
+        table = "stock_daily" if record["freq"] == "daily" else "stock_weekly"
+        if record["adjustflag"] == "3":
+            table += "_raw"
+            if not raw_ready:
+                ensure_raw_tables(engine)
+                raw_ready = True
+        columns, rows = parse_baostock_rows(record["fields"], record["rows"])
+        write_rows(engine, writer, table, columns, rows)
+        written += len(rows)
+    logger.info(f"♻️ 重放 {replay_dir} 完成，写入 {written} 行")
+    return written
+
+
 def upsert(df, table, engine, date_col):
     """批量更新/插入数据，确保事务提交"""
+    from sqlalchemy import text
+
     if df.empty:
         return
 
@@ -93,7 +184,11 @@ def upsert(df, table, engine, date_col):
     codes = df['code'].unique().tolist()
     # 确保日期列是 datetime 格式，再格式化为字符串用于 SQL IN 语句
     dates = pd.to_datetime(df[date_col]).dt.strftime('%Y-%m-%d').unique().tolist()
+    code_years = set(zip(df['code'], pd.to_datetime(df[date_col]).dt.year))
+    code_months = set(zip(df['code'], pd.to_datetime(df[date_col]).dt.strftime('%Y-%m')))
 
+    ensure_write_version_table(engine)
+    ensure_fingerprint_table(engine, table)
     with engine.connect() as conn:
         # 【关键修改】：使用 conn.begin() 开启事务，确保原子性并自动提交
         with conn.begin():
@@ -109,15 +204,25 @@ def upsert(df, table, engine, date_col):
             # 确保 con=conn，使 to_sql 在当前事务中操作
             df.to_sql(table, con=conn, if_exists='append', index=False, method='multi')
 
+            # 3. 同一事务内登记写入版本，读端缓存据此失效；刷新受影响月份的指纹
+            touch_write_versions(conn, table, code_years)
+            refresh_fingerprints(conn, table, code_months)
+
         # with conn.begin(): 块在这里结束。如果成功，COMMIT 自动发生。
 
 
 def get_latest(engine, code, table, col):
-    """获取最新日期"""
+    """获取最新日期；临时收盘与回退数据源的行（provisional = 1）不计入，Baostock 会重新拉取并确认那些日期"""
+    from sqlalchemy import text
+
+    confirmed = ""
+    if table in PROVISIONAL_TABLES:
+        ensure_tag_columns(engine, table)
+        confirmed = " AND `provisional` = 0"
     try:
         with engine.connect() as conn:
             result = conn.execute(
-                text(f"SELECT MAX(`{col}`) FROM `{table}` WHERE `code` = :c"),
+                text(f"SELECT MAX(`{col}`) FROM `{table}` WHERE `code` = :c{confirmed}"),
                 {"c": code}
             ).scalar()
             return result.strftime("%Y-%m-%d") if result else None
@@ -126,6 +231,43 @@ def get_latest(engine, code, table, col):
         return None
 
 
+def replace_months(engine, table, code, columns, rows, months):
+    """在一个事务里删除并重写指定月份的行，清掉上游已不存在的 K 线"""
+    from sqlalchemy import text
+
+    date_idx = columns.index("date")
+    rows = [row for row in rows if str(row[date_idx])[:7] in months]
+    if not rows:
+        return
+    ensure_write_version_table(engine)
+    ensure_fingerprint_table(engine, table)
+    ensure_tag_columns(engine, table)
+    with engine.begin() as conn:
+        for month in sorted(months):
+            conn.execute(
+                text(f"DELETE FROM `{table}` WHERE `code` = :c AND `date` BETWEEN :s AND LAST_DAY(:s)"),
+                {"c": code, "s": f"{month}-01"},
+            )
+        conn.exec_driver_sql(build_upsert_sql(table, columns, ("code", "date")), rows)
+        touch_write_versions(conn, table, version_keys(columns, rows, "date"))
+        refresh_fingerprints(conn, table, month_keys(columns, rows, "date"))
+
+
+def verify_months(engine, table, code, columns, rows, start, end):
+    """比对抓到的样本与库中的 (代码, 月) 指纹，只重写不一致的月份，返回重写的月份列表"""
+    if not rows:
+        return []
+    fetched = row_fingerprints(columns, rows)
+    stored = stored_fingerprints(engine, table, [code], start, end)
+    differing = changed_months(fetched, stored).get(code, [])
+    extra = sorted(month for _, month in set(stored) - set(fetched))
+    if extra:
+        logger.warning(f"⚠️ {table} {code} 库中有上游不存在的月份，未自动删除: {', '.join(extra)}")
+    if differing:
+        replace_months(engine, table, code, columns, rows, set(differing))
+    return differing
+
+
 def load_codes():
     """从 CSV 加载股票代码"""
     codes = []
@@ -137,57 +279,253 @@ def load_codes():
     return codes
 
 
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='同步股票日线/周线数据（Baostock版），默认按库中最新日期增量同步')
+    parser.add_argument('--raw', action='store_true',
+                        help='写入不复权表 stock_daily_raw/stock_weekly_raw 并同步复权因子')
+    parser.add_argument('--bootstrap', action='store_true',
+                        help='新库初始化：TSV 落盘后 LOAD DATA LOCAL INFILE 批量导入（见 bootstrap_load.py）')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--full', action='store_true',
+                      help=f'忽略库中已有数据，从 {HISTORY_START_DATE} 重新拉取并覆盖全部历史')
+    mode.add_argument('--verify', action='store_true',
+                      help='增量之外，重新拉取最近 --verify-months 个月，按 (代码, 月) 校验和比对，只重写不一致的月份')
+    parser.add_argument('--verify-months', type=int, default=DEFAULT_VERIFY_MONTHS,
+                        help=f'--verify 核对的月数，0 表示从 {HISTORY_START_DATE} 起全部核对')
+    from daily_sources import add_source_arguments  # daily_sources 依赖本模块
+
+    add_source_arguments(parser)
+    add_archive_arguments(parser)
+    add_group_commit_arguments(parser)
+    add_queue_arguments(parser)
+    add_priority_arguments(parser)
+    add_profile_arguments(parser)
+    return parser.parse_args()
+
+
 def main():
-    start_str = "2019-07-22"
-    uri = f"mysql+mysqlconnector://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}?charset=utf8mb4"
-    engine = create_engine(uri, pool_pre_ping=True)
+    args = parse_arguments()
+    setup_logging("sync_baostock.log")
+    try:
+        # 全量/校验与日线、周线增量写同一批表、共用 Baostock 会话，不能同时运行
+        with exclusive_run("sync_to_mysql", args, "sync_daily", "sync_weekly"):
+            with archiving(args), profile_run("sync_to_mysql", args):
+                run(args)
+    finally:
+        log_stats()
+
+
+def default_end_date():
+    """15:30 后包含当天，否则截止到昨天"""
+    now = datetime.now()
+    if now.time() >= time(15, 30):
+        return now.strftime("%Y-%m-%d")
+    return (now - timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def verify_start_date(end_date, months):
+    """end_date 往前 months 个月的月初；0 表示历史起点"""
+    if months <= 0:
+        return HISTORY_START_DATE
+    end = datetime.strptime(end_date, "%Y-%m-%d")
+    year, month = divmod(end.year * 12 + end.month - 1 - months, 12)
+    return max(f"{year:04d}-{month + 1:02d}-01", HISTORY_START_DATE)
+
+
+def month_start(day):
+    return max(day[:8] + "01", HISTORY_START_DATE)
+
+
+def incremental_ranges(engine, code, daily_table, weekly_table, end_date):
+    """返回 (库中最新日线日期, 日线起点, 周线起点)，无需拉取的一侧为 None。
+
+    日线从最新一天的次日开始；周线从库中最新一根开始重拉，它可能是在周中写入的未完成周线。
+    """
+    latest_d = get_latest(engine, code, daily_table, "date")
+    latest_w = get_latest(engine, code, weekly_table, "date")
+    start_d = HISTORY_START_DATE
+    if latest_d:
+        start_d = (datetime.strptime(latest_d, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    start_w = latest_w or HISTORY_START_DATE
+    if start_d > end_date:
+        start_d = None
+        if latest_w and latest_w >= latest_d:
+            start_w = None  # 日线已最新，且周线已覆盖最新交易日
+    return latest_d, start_d, start_w
+
+
+def run(args):
+    if getattr(args, "replay", None):
+        engine = getattr(args, "engine", None) or build_engine()
+        with open_writer(engine, args) as writer:
+            replay_baostock(engine, writer, args.replay)
+        return
+
+    if args.bootstrap:
+        from bootstrap_load import DEFAULT_SPOOL_MB, bootstrap, build_infile_engine
+
+        engine = build_infile_engine()
+        if args.raw:
+            ensure_raw_tables(engine)
+        bootstrap(engine, limit_codes(load_codes(), args), HISTORY_START_DATE, default_end_date(),
+                  args.raw, DEFAULT_SPOOL_MB, keep_spool=False)
+        return
+
+    # 与本模块互相引用，延迟到运行时导入
+    from corporate_action import detect_corporate_action, enqueue_resync, ensure_resync_queue, process_resync_queue
+    from daily_sources import build_fetcher
+    from sync_daily import refresh_factors_if_ex_rights
+
+    engine = getattr(args, "engine", None) or build_engine()
+    adjustflag = "3" if args.raw else "2"
+    daily_table = "stock_daily_raw" if args.raw else "stock_daily"
+    weekly_table = "stock_weekly_raw" if args.raw else "stock_weekly"
+    weekly_columns = WEEKLY_FIELDS.split(",")
+    if args.raw:
+        ensure_raw_tables(engine)
+    elif not args.full:
+        ensure_resync_queue(engine)
+    # 全量与校验以 Baostock 为准，只有增量走多数据源
+    fetcher = None if args.full or args.verify else build_fetcher(args)
 
     try:
-        all_codes = load_codes()
+        all_codes = limit_codes(load_codes(), args)
         if not all_codes:
             logger.warning("⚠️ 未加载到任何股票代码，请检查 code.csv")
             return
         logger.info(f"共 {len(all_codes)} 只股票")
 
-        now = datetime.now()
-        # 15:30 后包含当天，否则截止到昨天
-        if now.time() >= time(15, 30):
-            end_date_str = now.strftime("%Y-%m-%d")
-        else:
-            end_date_str = (now - timedelta(days=1)).strftime("%Y-%m-%d")
-        logger.info(f"同步截止日期: {end_date_str}")
+        end_date_str = default_end_date()
+        verify_start = verify_start_date(end_date_str, args.verify_months) if args.verify else None
+        mode = "全量" if args.full else ("增量+校验" if args.verify else "增量")
+        logger.info(f"同步截止日期: {end_date_str}，模式: {mode}")
 
         failed_list = []
-        total = len(all_codes)
-
-        for i, code in enumerate(all_codes, 1):
-            logger.info(f"正在同步 {i}/{total}: {code}")
-            pytime.sleep(random.uniform(1.0, 1.8))  # 防限流
-            lg = bs.login()
-
-            if lg.error_code != '0':
-                logger.error(f"❌ Baostock login failed for {code}: {lg.error_msg}")
-                failed_list.append(code)
-                continue  # 跳过当前股票
-
-            try:
-                df_d = fetch_baostock_data(code, start_str, end_date_str, "daily")
-                if not df_d.empty:
-                    upsert(df_d, "stock_daily", engine, "date")
-
-                # 同步周线
-                df_w = fetch_baostock_data(code, start_str, end_date_str, "weekly")
-                if not df_w.empty:
-                    upsert(df_w, "stock_weekly", engine, "date")
-
-            except Exception as e:
-                logger.error(f"💥 {code} 同步崩溃: {e}", exc_info=True)
-                failed_list.append(code)
-            finally:
-                bs.logout()
+        processed = []
+        committed = set()
+        up_to_date = 0
+        rewritten_months = 0
+        rewritten_codes = set()  # 日线被校验重写的股票，指标需要整段重算
+
+        with open_writer(engine, args) as writer:
+            plan = prioritize(engine, args, "full", all_codes, daily_table)
+            codes = plan.schedule(queue_codes(engine, args, "full", plan.codes, writer))
+            total = len(codes)
+            for i, code in enumerate(codes, 1):
+                processed.append(code)
+                if args.full:
+                    latest_d, start_d, start_w = None, HISTORY_START_DATE, HISTORY_START_DATE
+                else:
+                    latest_d, start_d, start_w = incremental_ranges(engine, code, daily_table, weekly_table,
+                                                                    end_date_str)
+                    if args.verify:
+                        # 校验按整月比对、整月重写，起点必须对齐到月初
+                        start_d = month_start(min(start_d or verify_start, verify_start))
+                        start_w = month_start(min(start_w or verify_start, verify_start))
+                    if start_d is None and start_w is None:
+                        up_to_date += 1
+                        committed.add(code)
+                        continue
+
+                logger.info(f"正在同步 {i}/{total}: {code} 日线自 {start_d or '-'}，周线自 {start_w or '-'}")
+                pytime.sleep(random.uniform(1.0, 1.8))  # 防限流
+                lg = login()
+
+                if lg.error_code != '0' and fetcher is None:
+                    logger.error(f"❌ Baostock login failed for {code}: {lg.error_msg}")
+                    failed_list.append(code)
+                    report_failure(codes, code)
+                    continue  # 跳过当前股票
+
+                try:
+                    if args.full and writer is None:
+                        df_d = fetch_baostock_data(code, start_d, end_date_str, "daily", adjustflag)
+                        if not df_d.empty:
+                            upsert(df_d, daily_table, engine, "date")
+
+                        # 同步周线
+                        df_w = fetch_baostock_data(code, start_w, end_date_str, "weekly", adjustflag)
+                        if not df_w.empty:
+                            upsert(df_w, weekly_table, engine, "date")
+                        committed.add(code)
+                        if args.raw:
+                            sync_adjust_factors(engine, code)
+                        continue
+
+                    if start_d:
+                        if fetcher is not None:
+                            columns, rows = fetcher.fetch(code, start_d, end_date_str, "daily", adjustflag)
+                        else:
+                            columns, rows = fetch_baostock_rows(code, start_d, end_date_str, "daily", adjustflag)
+                        # 只对库里还没有的 K 线做除权检测，--verify 重拉的历史月份不重复触发
+                        date_idx = columns.index("date")
+                        new_rows = [row for row in rows if latest_d is None or str(row[date_idx]) > latest_d]
+                        if args.raw and args.full:
+                            sync_adjust_factors(engine, code)
+                        elif new_rows and args.raw:
+                            refresh_factors_if_ex_rights(engine, code, columns, new_rows, daily_table)
+                        elif new_rows and not args.full:
+                            # 前复权口径：增量里出现除权除息，旧 K 线整体失效，交给重刷队列
+                            reason = detect_corporate_action(engine, code, columns, new_rows, latest_d)
+                            if reason:
+                                enqueue_resync(engine, code, reason)
+                        if args.verify:
+                            months = verify_months(engine, daily_table, code, columns, rows, start_d, end_date_str)
+                            rewritten_months += len(months)
+                            if months:
+                                rewritten_codes.add(code)
+                                logger.info(f"🔧 {daily_table} {code} 重写 {len(months)} 个月: {', '.join(months)}")
+                        else:
+                            write_rows(engine, writer, daily_table, columns, rows)
+
+                    columns, rows = weekly_columns, []
+                    if start_w and fetcher is not None:
+                        columns, rows = fetcher.fetch(code, start_w, end_date_str, "weekly", adjustflag)
+                    elif start_w:
+                        columns, rows = fetch_baostock_rows(code, start_w, end_date_str, "weekly", adjustflag)
+                        if args.verify:
+                            months = verify_months(engine, weekly_table, code, columns, rows, start_w, end_date_str)
+                            rewritten_months += len(months)
+                            if months:
+                                logger.info(f"🔧 {weekly_table} {code} 重写 {len(months)} 个月: {', '.join(months)}")
+                            rows = []
+                    # 周线所在事务提交后才算该股票完成；无周线可写时回调按顺序排在日线之后
+                    write_rows(engine, writer, weekly_table, columns, rows,
+                               on_commit=lambda code=code: committed.add(code))
+
+                except Exception as e:
+                    if writer is not None and writer.failed:
+                        raise
+                    logger.error(f"💥 {code} 同步崩溃: {e}", exc_info=True)
+                    failed_list.append(code)
+                    report_failure(codes, code)
+                finally:
+                    logout()
+
+        failed_list += [code for code in processed if code not in committed and code not in failed_list]
+        # 队列模式下失败的股票会放回队列，可能在本 worker 重试成功
+        failed_list = [code for code in dict.fromkeys(failed_list) if code not in committed]
+        if up_to_date:
+            logger.info(f"ℹ️ {up_to_date} 只股票已是最新，未发起请求")
+        if args.verify:
+            logger.info(f"🔍 校验完成，共重写 {rewritten_months} 个 (代码, 月)")
+
+        if not args.raw and not args.full:
+            lg = login()
+            if lg.error_code == '0':
+                done, failed = process_resync_queue(engine, end_date_str)
+                if done or failed:
+                    logger.info(f"🔁 除权除息重刷完成 {done} 只，失败 {failed} 只")
+            else:
+                logger.warning(f"重刷队列登录失败，留待下次处理: {lg.error_msg}")
+
+        if not args.raw:
+            if rewritten_codes:
+                recompute_indicators(engine, sorted(rewritten_codes))
+            update_indicators(engine, rebuild=args.full)
 
         if failed_list:
-            fail_file = os.path.join(log_dir, "failed_codes_baostock.txt")
+            fail_file = os.path.join(LOG_DIR, "failed_codes_baostock.txt")
             with open(fail_file, "w") as f:
                 f.write("\n".join(failed_list))
             logger.warning(f"❌ {len(failed_list)} 只股票同步失败，已保存至: {fail_file}")
@@ -195,7 +533,9 @@ def main():
             logger.info("🎉 所有股票同步成功！")
 
     finally:
-        bs.logout()
+        if fetcher is not None:
+            fetcher.close()
+        logout()
         logger.info("✅ 同步任务结束")
 
 
@@ -1,43 +1,30 @@
 # sync_weekly.py
-import os
-import sys
 import time
 import logging
-import pandas as pd
+import argparse
 import socket
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, text
-import baostock as bs
-from sync_to_mysql import fetch_baostock_data, upsert, get_latest
+from baostock_deadline import log_stats, login, logout
+from common import CODE_CSV_PATH, build_engine, exclusive_run, lazy_import, setup_logging
+from sync_to_mysql import fetch_baostock_rows, get_latest, replay_baostock
+from daily_sources import add_source_arguments, build_fetcher
+from db_writer import add_group_commit_arguments, open_writer, write_rows
+from priority import add_priority_arguments, keep_deferred, prioritize
+from profiling import add_profile_arguments, limit_codes, profile_run
+from raw_archive import add_archive_arguments, archiving
+from task_queue import add_queue_arguments, queue_codes
+
+bs = lazy_import("baostock")
 
 # ================== 配置 ==================
-MYSQL_USER = os.getenv("MYSQL_USER", "root")
-MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "InsightOne123456")
-MYSQL_HOST = os.getenv("MYSQL_HOST", "127.0.0.1")
-MYSQL_PORT = os.getenv("MYSQL_PORT", "3306")
-MYSQL_DB = os.getenv("MYSQL_DB", "stock_db_qfq")
-CODE_CSV_PATH = os.getenv("CODE_CSV_PATH", "./code.csv")
 SOCKET_TIMEOUT = 15
 
-socket.setdefaulttimeout(SOCKET_TIMEOUT)
-
-# ================== 日志 ==================
-log_dir = "./logs"
-os.makedirs(log_dir, exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(os.path.join(log_dir, "sync_weekly_baostock.log"), encoding="utf-8"),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
 logger = logging.getLogger(__name__)
 
 
 def login_with_retry(max_retries=3):
     for attempt in range(1, max_retries + 1):
-        lg = bs.login()
+        lg = login()
         if lg.error_code == '0':
             return True
         logger.warning(f"Baostock 登录失败 {attempt}/{max_retries}: {lg.error_msg}")
@@ -46,37 +33,67 @@ def login_with_retry(max_retries=3):
     return False
 
 
-def fetch_with_relogin(code, start_date, end_date, freq="weekly", max_retries=3):
-    """带自动重新登录的数据获取"""
+def fetch_with_relogin(code, start_date, end_date, freq="weekly", max_retries=3, fetcher=None):
+    """带自动重新登录的数据获取，返回 (字段名列表, 类型化元组列表)；传入 fetcher 时走多数据源"""
+    if fetcher is not None:
+        return fetcher.fetch(code, start_date, end_date, freq)
     for attempt in range(1, max_retries + 1):
         try:
-            return fetch_baostock_data(code, start_date, end_date, freq)
+            return fetch_baostock_rows(code, start_date, end_date, freq)
         except Exception as e:
             logger.warning(f"{code} 第 {attempt}/{max_retries} 次周线请求异常: {e}")
             if attempt >= max_retries:
                 break
 
             try:
-                bs.logout()
+                logout()
             except Exception as logout_error:
                 logger.warning(f"{code} 登出异常，继续重新登录: {logout_error}")
 
             time.sleep(1)
-            lg = bs.login()
+            lg = login()
             if lg.error_code != '0':
                 logger.warning(f"重新登录失败: {lg.error_msg}，等待5s后重试")
                 time.sleep(5)
-    return pd.DataFrame()
+    return [], []
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='同步股票周线数据（Baostock版）')
+    add_source_arguments(parser)
+    add_archive_arguments(parser)
+    add_group_commit_arguments(parser)
+    add_queue_arguments(parser)
+    add_priority_arguments(parser)
+    add_profile_arguments(parser)
+    return parser.parse_args()
 
 
 def main():
-    uri = f"mysql+mysqlconnector://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}?charset=utf8mb4"
-    engine = create_engine(uri, pool_pre_ping=True)
+    args = parse_arguments()
+    setup_logging("sync_weekly_baostock.log")
+    try:
+        with exclusive_run("sync_weekly", args), archiving(args), profile_run("sync_weekly", args):
+            run(args)
+    finally:
+        log_stats()
 
-    if not login_with_retry():
-        logger.error("Baostock login failed")
-        return
 
+def run(args):
+    """返回是否成功：异常在这里记录日志后不再抛出，调度进程据返回值记录失败并重试"""
+    socket.setdefaulttimeout(SOCKET_TIMEOUT)
+    engine = getattr(args, "engine", None) or build_engine()
+    if getattr(args, "replay", None):
+        with open_writer(engine, args) as writer:
+            replay_baostock(engine, writer, args.replay, freqs=("weekly",))
+        return True
+
+    fetcher = build_fetcher(args)
+    if not login_with_retry():
+        if fetcher is None:
+            logger.error("Baostock login failed")
+            return False
+        logger.warning("Baostock 登录失败，使用其他数据源继续")
     try:
         today = datetime.now()
         week_start = (today - timedelta(days=today.weekday())).strftime("%Y-%m-%d")
@@ -89,39 +106,49 @@ def main():
                 code = line.strip()
                 if code and not code.startswith("#") and code.lower() != "code":
                     codes.append(code.zfill(6))
-        synced_count = 0
-        total = len(codes)
-        for index, code in enumerate(codes, start=1):
-            time.sleep(0.2)
-            latest_date = get_latest(engine, code, "stock_weekly", "date")
-            if latest_date:
-                start_date = (datetime.strptime(latest_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
-            else:
-                start_date = "2010-01-01"
-
-            if start_date > week_end:
-                logger.info(f"ℹ️ {code} 周线已是最新 {index}/{total}，最新日期 {latest_date}")
-                continue
-
-            try:
-                df = fetch_with_relogin(code, start_date, week_end, "weekly")
-            except Exception as e:
-                logger.warning(f"⚠️ {code} 周线同步失败: {e}，等待30s重试")
-                time.sleep(30)
-                bs.logout()
-                bs.login()
-                df = fetch_baostock_data(code, start_date, week_end, "weekly")
-            if not df.empty:
-                upsert(df, "stock_weekly", engine, "date")
-                synced_count += 1
-                logger.info(f"✅ {code} 同步 {index}/{total} 条周线数据")
-            else:
-                logger.info(f"ℹ️ {code} 无新数据 {index}/{total}")
-        logger.info(f"✅ 周线数据同步完成，本次写入 {synced_count} 只股票")
+        codes = limit_codes(codes, args)
+        committed = []
+        with open_writer(engine, args) as writer:
+            plan = prioritize(engine, args, "weekly", codes, "stock_weekly")
+            codes = plan.schedule(queue_codes(engine, args, "weekly", plan.codes, writer))
+            total = len(codes)
+            for index, code in enumerate(codes, start=1):
+                time.sleep(0.2)
+                latest_date = get_latest(engine, code, "stock_weekly", "date")
+                if latest_date:
+                    start_date = (datetime.strptime(latest_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+                else:
+                    start_date = "2010-01-01"
+
+                if start_date > week_end:
+                    logger.info(f"ℹ️ {code} 周线已是最新 {index}/{total}，最新日期 {latest_date}")
+                    continue
+
+                try:
+                    columns, rows = fetch_with_relogin(code, start_date, week_end, "weekly", fetcher=fetcher)
+                except Exception as e:
+                    logger.warning(f"⚠️ {code} 周线同步失败: {e}，等待30s重试")
+                    time.sleep(30)
+                    logout()
+                    login()
+                    columns, rows = fetch_baostock_rows(code, start_date, week_end, "weekly")
+                if rows:
+                    # 只有提交成功的股票才计入写入数
+                    write_rows(engine, writer, "stock_weekly", columns, rows,
+                               on_commit=lambda code=code: committed.append(code))
+                    logger.info(f"✅ {code} 同步 {index}/{total} 条周线数据")
+                else:
+                    keep_deferred(codes, code)
+                    logger.info(f"ℹ️ {code} 无新数据 {index}/{total}")
+        logger.info(f"✅ 周线数据同步完成，本次写入 {len(committed)} 只股票")
+        return True
     except Exception as e:
         logger.exception(f"同步失败: {e}")
+        return False
     finally:
-        bs.logout()
+        if fetcher is not None:
+            fetcher.close()
+        logout()
         logger.info("✅ 周线同步任务结束")
 
 
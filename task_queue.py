@@ -0,0 +1,269 @@
+"""MySQL 上的分布式任务队列：多个容器共享同一个 run_id 时分摊一次同步。
+
+以前扩容只能手工拆分 code.csv，某个容器崩溃后它那一份就丢了。现在每次运行把股票写入
+sync_task（INSERT IGNORE，多个容器重复写入同一 run_id 不会产生重复任务），各 worker 用
+SELECT ... FOR UPDATE SKIP LOCKED 按批认领：
+
+* 认领时写入租约 lease_until，后台心跳线程定期续约；worker 卡死或崩溃后租约过期，任务回到队列；
+* 一批股票全部处理完（组提交模式下先 flush 写入器）才确认，崩溃最多重做一批；
+* 调用方用 report_failure 报告失败的股票，确认时它们放回 pending（不标记 done），稍后重新认领；
+* 认领次数达到 max_attempts 仍未完成的任务标记 failed，不再反复分配。
+
+各同步脚本加 --queue RUN_ID 即进入队列模式，未指定时仍按 code.csv 顺序全量处理：
+
+    python sync_daily.py --queue 2024-12-07        # 在多个容器上执行同一条命令
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import socket
+import threading
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+TASK_TABLE = "sync_task"
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 3
+
+CREATE_TASK_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{TASK_TABLE}` (
+  `job` VARCHAR(32) NOT NULL COMMENT '任务类型：daily/weekly/full/intraday/themes',
+  `run_id` VARCHAR(64) NOT NULL COMMENT '同一次运行的标识，多个容器共享',
+  `code` VARCHAR(20) NOT NULL,
+  `seq` INT NOT NULL DEFAULT 0 COMMENT '认领顺序，越小越先',
+  `status` VARCHAR(16) NOT NULL DEFAULT 'pending' COMMENT 'pending/claimed/done/failed',
+  `worker` VARCHAR(128) DEFAULT NULL,
+  `lease_until` DATETIME(3) DEFAULT NULL,
+  `attempts` INT NOT NULL DEFAULT 0,
+  `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`job`, `run_id`, `code`),
+  KEY `idx_claim` (`job`, `run_id`, `status`, `seq`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """可迭代的认领队列：for code in queue 逐只产出本 worker 认领到的股票。"""
+
+    def __init__(
+        self,
+        engine: Any,
+        job: str,
+        run_id: str,
+        *,
+        worker: Optional[str] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        lease_seconds: int = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        before_ack: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.engine = engine
+        self.job = job
+        self.run_id = run_id
+        self.worker = worker or default_worker_id()
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.before_ack = before_ack
+        self.total = 0
+        self.claimed = 0
+        self._failed: set[str] = set()
+
+    def ensure_table(self) -> None:
+        from sqlalchemy import text
+
+        with self.engine.begin() as conn:
+            conn.execute(text(CREATE_TASK_TABLE_SQL))
+
+    def populate(self, codes: Sequence[str]) -> int:
+        """写入本次运行的全部任务（已存在的保持原状态），返回该 run_id 下的任务总数。"""
+        from sqlalchemy import text
+
+        self.ensure_table()
+        params = [{"j": self.job, "r": self.run_id, "c": code, "s": seq} for seq, code in enumerate(codes)]
+        with self.engine.begin() as conn:
+            if params:
+                conn.execute(
+                    text(
+                        f"INSERT IGNORE INTO `{TASK_TABLE}` (`job`, `run_id`, `code`, `seq`) "
+                        "VALUES (:j, :r, :c, :s)"
+                    ),
+                    params,
+                )
+            self.total = int(
+                conn.execute(
+                    text(f"SELECT COUNT(*) FROM `{TASK_TABLE}` WHERE `job` = :j AND `run_id` = :r"),
+                    {"j": self.job, "r": self.run_id},
+                ).scalar()
+            )
+        return self.total
+
+    def claim(self) -> list[str]:
+        """认领一批待处理或租约已过期的任务；没有可认领的任务时返回空列表。"""
+        from sqlalchemy import bindparam, text
+
+        key = {"j": self.job, "r": self.run_id}
+        with self.engine.begin() as conn:
+            conn.execute(
+                text(
+                    f"UPDATE `{TASK_TABLE}` SET `status` = 'failed', `worker` = NULL "
+                    "WHERE `job` = :j AND `run_id` = :r AND `status` = 'claimed' "
+                    "AND `lease_until` < NOW(3) AND `attempts` >= :max"
+                ),
+                {**key, "max": self.max_attempts},
+            )
+            codes = [
+                row[0]
+                for row in conn.execute(
+                    text(
+                        f"SELECT `code` FROM `{TASK_TABLE}` "
+                        "WHERE `job` = :j AND `run_id` = :r "
+                        "AND (`status` = 'pending' OR (`status` = 'claimed' AND `lease_until` < NOW(3))) "
+                        "ORDER BY `seq` LIMIT :n FOR UPDATE SKIP LOCKED"
+                    ),
+                    {**key, "n": self.batch_size},
+                )
+            ]
+            if codes:
+                conn.execute(
+                    text(
+                        f"UPDATE `{TASK_TABLE}` SET `status` = 'claimed', `worker` = :w, `attempts` = `attempts` + 1, "
+                        "`lease_until` = NOW(3) + INTERVAL :lease SECOND "
+                        "WHERE `job` = :j AND `run_id` = :r AND `code` IN :codes"
+                    ).bindparams(bindparam("codes", expanding=True)),
+                    {**key, "w": self.worker, "lease": self.lease_seconds, "codes": codes},
+                )
+        self.claimed += len(codes)
+        return codes
+
+    def complete(self, codes: Sequence[str]) -> None:
+        """标记完成；租约已过期且被别的 worker 重新认领的任务不会被覆盖。"""
+        from sqlalchemy import bindparam, text
+
+        if not codes:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(
+                text(
+                    f"UPDATE `{TASK_TABLE}` SET `status` = 'done', `lease_until` = NULL "
+                    "WHERE `job` = :j AND `run_id` = :r AND `worker` = :w AND `status` = 'claimed' "
+                    "AND `code` IN :codes"
+                ).bindparams(bindparam("codes", expanding=True)),
+                {"j": self.job, "r": self.run_id, "w": self.worker, "codes": list(codes)},
+            )
+
+    def release(self, codes: Sequence[str]) -> None:
+        """处理失败的任务放回队列；认领次数已达上限的标记 failed。"""
+        from sqlalchemy import bindparam, text
+
+        if not codes:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(
+                text(
+                    f"UPDATE `{TASK_TABLE}` SET `status` = IF(`attempts` >= :max, 'failed', 'pending'), "
+                    "`worker` = NULL, `lease_until` = NULL "
+                    "WHERE `job` = :j AND `run_id` = :r AND `worker` = :w AND `status` = 'claimed' "
+                    "AND `code` IN :codes"
+                ).bindparams(bindparam("codes", expanding=True)),
+                {"j": self.job, "r": self.run_id, "w": self.worker, "max": self.max_attempts, "codes": list(codes)},
+            )
+
+    def fail(self, code: str) -> None:
+        """调用方报告本次认领的某只股票处理失败，本批确认时放回队列而不是标记 done。"""
+        self._failed.add(code)
+
+    def heartbeat(self) -> int:
+        """续约本 worker 持有的全部任务，返回续约条数。"""
+        from sqlalchemy import text
+
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                text(
+                    f"UPDATE `{TASK_TABLE}` SET `lease_until` = NOW(3) + INTERVAL :lease SECOND "
+                    "WHERE `job` = :j AND `run_id` = :r AND `worker` = :w AND `status` = 'claimed'"
+                ),
+                {"j": self.job, "r": self.run_id, "w": self.worker, "lease": self.lease_seconds},
+            )
+            return result.rowcount
+
+    def _heartbeat_loop(self, stop: threading.Event) -> None:
+        interval = max(1.0, self.lease_seconds / 3)
+        while not stop.wait(interval):
+            try:
+                self.heartbeat()
+            except Exception:  # noqa: BLE001
+                logger.exception("任务队列续约失败，稍后重试")
+
+    def __len__(self) -> int:
+        return self.total
+
+    def __iter__(self) -> Iterator[str]:
+        stop = threading.Event()
+        thread = threading.Thread(target=self._heartbeat_loop, args=(stop,), name="task-queue-heartbeat", daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = self.claim()
+                if not batch:
+                    break
+                logger.info("从队列 %s/%s 认领 %s 只股票", self.job, self.run_id, len(batch))
+                yield from batch
+                if self.before_ack is not None:
+                    self.before_ack()  # 组提交模式：本批写入落库后才确认
+                failed = [code for code in batch if code in self._failed]
+                self._failed.difference_update(batch)
+                self.complete([code for code in batch if code not in failed])
+                if failed:
+                    logger.warning("队列 %s/%s 中 %s 只股票处理失败，放回队列重试: %s",
+                                   self.job, self.run_id, len(failed), ", ".join(failed))
+                    self.release(failed)
+        finally:
+            stop.set()
+            thread.join()
+            logger.info("队列 %s/%s 本 worker 共处理 %s 只股票", self.job, self.run_id, self.claimed)
+
+
+def report_failure(codes: Any, code: str) -> None:
+    """在遍历 queue_codes 的结果时报告某只股票失败；队列模式下放回队列重试，普通列表什么都不做。"""
+    fail = getattr(codes, "fail", None)
+    if fail is not None:
+        fail(code)
+
+
+def add_queue_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--queue",
+        metavar="RUN_ID",
+        default=None,
+        help="队列模式：多个容器使用同一 RUN_ID 时从 sync_task 表分批认领股票",
+    )
+    parser.add_argument("--queue-batch", type=int, default=DEFAULT_BATCH_SIZE, help="每次认领的股票数")
+    parser.add_argument("--queue-lease", type=int, default=DEFAULT_LEASE_SECONDS, help="认领租约秒数，心跳每 1/3 租约续约一次")
+
+
+def queue_codes(engine: Any, args: argparse.Namespace, job: str, codes: Sequence[str], writer: Any = None):
+    """未指定 --queue 时原样返回 codes；否则登记任务并返回可迭代的 WorkQueue。"""
+    run_id = getattr(args, "queue", None)
+    if not run_id or engine is None:
+        return codes
+    queue = WorkQueue(
+        engine,
+        job,
+        run_id,
+        batch_size=args.queue_batch,
+        lease_seconds=args.queue_lease,
+        before_ack=writer.flush if writer is not None else None,
+    )
+    total = queue.populate(codes)
+    logger.info("任务队列 %s/%s 共 %s 只股票，worker=%s", job, run_id, total, queue.worker)
+    return queue
@@ -0,0 +1,59 @@
+"""fingerprint 本地指纹与 MySQL 聚合口径一致。
+
+库中 close 是 DECIMAL(10,4)：写入时按四舍五入（远离零）截到 4 位，CONCAT 时固定输出 4 位小数，
+NULL 经 COALESCE 变成空串；SUM(CRC32(...)) 是精确整数和。这里按同一口径手写 SQL 侧的文本。
+"""
+
+import math
+import zlib
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from fingerprint import _row_hash, row_fingerprints
+
+# (Python 侧收盘价, MySQL 中 CONCAT(`close`) 的结果)
+CLOSE_CASES = [
+    (12.345, "12.3450"),
+    (0.1 + 0.2, "0.3000"),
+    (10, "10.0000"),
+    (10.0, "10.0000"),
+    (1.00005, "1.0001"),
+    (2.00015, "2.0002"),
+    (1688.88888, "1688.8889"),
+    (Decimal("7.1"), "7.1000"),
+    (Decimal("3.14155"), "3.1416"),
+    (None, ""),
+    (math.nan, ""),
+]
+
+
+def sql_crc(day: str, close_text: str) -> int:
+    """CRC32(CONCAT(`date`, '|', COALESCE(`close`, '')))"""
+    return zlib.crc32(f"{day}|{close_text}".encode())
+
+
+@pytest.mark.parametrize("close, mysql_text", CLOSE_CASES)
+def test_row_hash_matches_mysql_text(close, mysql_text):
+    assert _row_hash("2024-06-03", close) == sql_crc("2024-06-03", mysql_text)
+
+
+def test_row_fingerprints_match_sql_sum():
+    days = [date(2024, 6, day) for day in (3, 4, 5, 6, 7)] + [date(2024, 7, 1)]
+    rows = [("600000", day, close) for day, (close, _) in zip(days, CLOSE_CASES)]
+    result = row_fingerprints(("code", "date", "close"), rows)
+
+    june = [sql_crc(day.isoformat(), text) for day, (_, text) in zip(days[:5], CLOSE_CASES)]
+    july = [sql_crc(days[5].isoformat(), CLOSE_CASES[5][1])]
+    assert result == {
+        ("600000", "2024-06"): (5, sum(june)),
+        ("600000", "2024-07"): (1, sum(july)),
+    }
+
+
+def test_row_fingerprints_accept_timestamp_text():
+    """DataFrame 路径把日期转成字符串后可能带时间部分，只取前 10 位。"""
+    plain = row_fingerprints(("code", "date", "close"), [("000001", "2024-06-03", 9.87)])
+    stamped = row_fingerprints(("code", "date", "close"), [("000001", "2024-06-03 00:00:00", 9.87)])
+    assert plain == stamped
@@ -0,0 +1,80 @@
+"""IndicatorState.append 逐根递推与 compute_frame 向量化计算的口径一致。"""
+
+import json
+import math
+import random
+from datetime import date, datetime
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from indicators import COLUMNS, IndicatorState, compute_frame, plan_updates  # noqa: E402
+
+NAMES = COLUMNS[2:]
+
+
+def synthetic_bars(count: int, seed: int = 7) -> pd.DataFrame:
+    """带跳空、平盘和个别缺失最高/最低价的随机游走。"""
+    rng = random.Random(seed)
+    close, rows = 10.0, []
+    for index in range(count):
+        close = round(max(0.5, close * (1 + rng.gauss(0, 0.02)) + (0.8 if index == 40 else 0.0)), 4)
+        if index in (25, 26):
+            close = rows[-1][2] if rows else close  # 平盘
+        high = round(close * (1 + abs(rng.gauss(0, 0.01))), 4)
+        low = round(close * (1 - abs(rng.gauss(0, 0.01))), 4)
+        if index == 70:
+            high = low = None  # 与库中 NULL 的最高/最低价一样按收盘价处理
+        rows.append((high, low, close))
+    return pd.DataFrame(rows, columns=["high", "low", "close"])
+
+
+def incremental(df: pd.DataFrame, state: IndicatorState | None = None) -> list[tuple]:
+    state = state or IndicatorState()
+    out = []
+    for high, low, close in df[["high", "low", "close"]].itertuples(index=False):
+        high = close if high is None or pd.isna(high) else high
+        low = close if low is None or pd.isna(low) else low
+        out.append(state.append(float(high), float(low), float(close)))
+    return out
+
+
+def assert_rows_match(frame: pd.DataFrame, rows: list[tuple]) -> None:
+    assert len(frame) == len(rows)
+    for index, row in enumerate(rows):
+        for name, value in zip(NAMES, row):
+            expected = frame[name].iloc[index]
+            if value is None:
+                assert pd.isna(expected), (index, name, expected)
+            else:
+                assert not pd.isna(expected), (index, name, value)
+                assert math.isclose(value, expected, rel_tol=1e-9, abs_tol=1e-9), (index, name, value, expected)
+
+
+def test_append_matches_compute_frame():
+    df = synthetic_bars(120)
+    frame, _ = compute_frame(df)
+    assert_rows_match(frame, incremental(df))
+
+
+def test_state_from_compute_frame_continues_incrementally():
+    """整段重算后保存的状态（经 JSON 往返）继续逐根推进，结果与整段计算一致。"""
+    df = synthetic_bars(150, seed=11)
+    full, _ = compute_frame(df)
+    _, state = compute_frame(df.iloc[:90])
+    resumed = IndicatorState(json.loads(state.to_json()))
+    tail = incremental(df.iloc[90:].reset_index(drop=True), resumed)
+    assert_rows_match(full.iloc[90:].reset_index(drop=True), tail)
+
+
+def test_plan_updates_rewinds_past_skipped_provisional_rows():
+    """越过了临时行的股票再有写入时整段重算，而不是只从 last_date 之后追加。"""
+    seen = datetime(2024, 6, 3, 16, 0)
+    versions = {"600000": {2024: datetime(2024, 6, 4, 20, 0)}, "000001": {2024: datetime(2024, 6, 4, 20, 0)}}
+    pending = IndicatorState({"pending": ["2024-05-31"]}).to_json()
+    states = {
+        "600000": (date(2024, 6, 3), seen, pending),
+        "000001": (date(2024, 6, 3), seen, IndicatorState().to_json()),
+    }
+    assert plan_updates(["600000", "000001"], versions, states) == (["000001"], ["600000"])
@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import argparse
-import os
 import random
 import re
 import time
@@ -11,20 +10,18 @@ from typing import Iterable
 import requests
 from bs4 import BeautifulSoup
 from requests import Session
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+
+from common import build_engine, exclusive_run
+from profiling import add_profile_arguments, limit_codes, profile_run
+from raw_archive import add_archive_arguments, archiving, iter_records, record as archive_raw
+from task_queue import add_queue_arguments, queue_codes, report_failure
 
 THS_CONCEPT_URL = "https://basic.10jqka.com.cn/{code}/concept.html"
 DEFAULT_USER_AGENT = (
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
     "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36"
 )
-MYSQL_CONFIG = {
-    "host": os.getenv("MYSQL_HOST", "127.0.0.1"),
-    "port": int(os.getenv("MYSQL_PORT", "3306")),
-    "user": os.getenv("MYSQL_USER", "root"),
-    "password": os.getenv("MYSQL_PASSWORD", "InsightOne123456"),
-    "database": os.getenv("MYSQL_DB", "stock_db_qfq"),
-}
 
 
 @dataclass
@@ -35,14 +32,6 @@ class ThsThemeInfo:
     theme_tags: list[str]
 
 
-def create_db_engine():
-    db_uri = (
-        f"mysql+mysqlconnector://{MYSQL_CONFIG['user']}:{MYSQL_CONFIG['password']}"
-        f"@{MYSQL_CONFIG['host']}:{MYSQL_CONFIG['port']}/{MYSQL_CONFIG['database']}"
-    )
-    return create_engine(db_uri, pool_pre_ping=True)
-
-
 def ensure_theme_table(engine) -> None:
     ddl = text(
         """
@@ -118,6 +107,7 @@ def fetch_concept_html(session: Session, code: str, timeout: float) -> str:
     response = session.get(THS_CONCEPT_URL.format(code=code), timeout=timeout)
     response.raise_for_status()
     response.encoding = "gbk"
+    archive_raw("ths_concept", code=code, payload=response.text)
     return response.text
 
 
@@ -258,9 +248,28 @@ def build_session() -> Session:
     return session
 
 
+def replay_themes(engine, args: argparse.Namespace) -> None:
+    """按当前的 parse_ths_concept_page 重新解析归档的概念页 HTML，不访问同花顺。"""
+    success = 0
+    empty = 0
+    for record in iter_records(args.replay, "ths_concept"):
+        info = parse_ths_concept_page(record["code"], record["payload"])
+        if not info.theme_tags:
+            empty += 1
+            continue
+        success += 1
+        if not args.dry_run:
+            upsert_theme_info(engine, info, overwrite_empty_only=args.only_missing)
+    mode = "预览" if args.dry_run else "写入"
+    print(f"重放{mode}完成: 成功 {success}, 空结果 {empty}")
+
+
 def sync_themes(args: argparse.Namespace) -> None:
-    engine = create_db_engine()
+    engine = getattr(args, "engine", None) or build_engine()
     ensure_theme_table(engine)
+    if args.replay:
+        replay_themes(engine, args)
+        return
     codes = load_target_codes(
         engine,
         codes=args.codes,
@@ -268,10 +277,12 @@ def sync_themes(args: argparse.Namespace) -> None:
         only_missing=args.only_missing,
         limit=args.limit,
     )
+    codes = limit_codes(codes, args)
     if not codes:
         print("没有需要补充的股票。")
         return
 
+    codes = queue_codes(engine, args, "themes", codes)
     session = build_session()
     success = 0
     empty = 0
@@ -294,6 +305,7 @@ def sync_themes(args: argparse.Namespace) -> None:
                     upsert_theme_info(engine, info, overwrite_empty_only=args.only_missing)
         except Exception as exc:
             failed += 1
+            report_failure(codes, code)
             print(f"[{index}/{len(codes)}] {code} 失败: {type(exc).__name__}: {exc}")
 
         if index < len(codes):
@@ -319,8 +331,20 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--jitter", type=float, default=3.0, help="随机额外间隔秒数")
     parser.add_argument("--timeout", type=float, default=12.0, help="HTTP超时时间")
     parser.add_argument("--dry-run", action="store_true", help="只打印不写库")
+    add_archive_arguments(parser)
+    add_queue_arguments(parser)
+    add_profile_arguments(parser)
     return parser.parse_args()
 
 
+def main() -> None:
+    args = parse_args()
+    with exclusive_run("ths_f10_theme_sync", args), archiving(args):
+        with profile_run("ths_f10_theme_sync", args) as profile_dir:
+            sync_themes(args)
+    if profile_dir:
+        print(f"性能剖析结果: {profile_dir}")
+
+
 if __name__ == "__main__":
-    sync_themes(parse_args())
+    main()